@@ -0,0 +1,303 @@
+from functools import partial
+
+import numpy as np
+import properties
+import scipy.sparse as sp
+import discretize
+
+from ..simulation import BaseSimulation
+from ..utils.parallel_utils import shared_array, worker_executor
+
+
+class BaseStitched1DSimulation(BaseSimulation):
+    """
+    Base class of stitched 1D simulations, evaluating many independent
+    soundings over layered earths as one problem.
+
+    The physical property of the layers of every sounding is ordered as an
+    (n_sounding, n_layer) array in C order, and all the soundings share the
+    layer thicknesses and the geometry of their sources and receivers. The
+    survey holds the data of every sounding in turn.
+
+    The soundings are evaluated in chunks, every chunk vectorizing the kernels
+    of its soundings, optionally distributed over ``n_workers`` processes. As
+    the soundings are independent, the sensitivity is a block diagonal sparse
+    matrix.
+
+    Laterally constrained inversions regularize the model on the
+    :attr:`stitched_mesh`, whose cells are ordered as the model: smoothness
+    along its first axis constrains the layers of every sounding, and along
+    its second axis neighbouring soundings, e.g.
+
+    .. code:: python
+
+        reg = regularization.Tikhonov(
+            simulation.stitched_mesh, alpha_x=vertical, alpha_y=lateral
+        )
+
+    Subclasses combine this class with a single sounding simulation, and
+    implement :meth:`_evaluate_soundings`.
+    """
+
+    n_workers = properties.Integer(
+        "Number of worker processes evaluating the chunks of soundings",
+        default=1,
+        min=1,
+    )
+
+    max_chunk_size = properties.Float(
+        "Maximum size (MB) of the temporaries of a chunk of soundings",
+        default=16.0,
+        min=0.0,
+    )
+
+    sounding_locations = properties.Array(
+        "Locations of the soundings, (n_sounding,) positions along the line or "
+        "(n_sounding, dim) coordinates, spacing the soundings of the stitched mesh",
+        shape={("*",), ("*", "*")},
+        required=False,
+    )
+
+    #: Name of the physical property of the layers differentiated by the kernels
+    _property_name = "sigma"
+
+    #: Whether the layers are ordered from the bottom half-space up
+    _halfspace_first = False
+
+    @property
+    def n_layer(self):
+        """
+        Number of layers of every sounding
+        """
+        return self.thicknesses.size + 1
+
+    @property
+    def n_sounding(self):
+        """
+        Number of soundings, from the size of the model, or from the sounding
+        locations before a model is set
+        """
+        if self.model is None and self.sounding_locations is not None:
+            return len(self.sounding_locations)
+        return getattr(self, self._property_name).size // self.n_layer
+
+    @property
+    def n_sounding_data(self):
+        """
+        Number of data of every sounding
+        """
+        if self.survey.nD % self.n_sounding != 0:
+            raise ValueError(
+                "The survey holds {} data, which are not shared evenly by the {} "
+                "soundings".format(self.survey.nD, self.n_sounding)
+            )
+        return self.survey.nD // self.n_sounding
+
+    @property
+    def stitched_mesh(self):
+        """
+        Tensor mesh of the layers (first axis) and soundings (second axis),
+        whose cells are ordered as the model.
+
+        Cells of the layers are as thick as the layers, the half-space being
+        as thick as the layer above it. Soundings are spaced by the distances
+        between consecutive :attr:`sounding_locations`, or evenly if these are
+        not set.
+        """
+        thicknesses = np.asarray(self.thicknesses, dtype=float)
+        if thicknesses.size == 0:
+            h_layer = np.r_[1.0]
+        elif self._halfspace_first:
+            h_layer = np.r_[thicknesses[0], thicknesses]
+        else:
+            h_layer = np.r_[thicknesses, thicknesses[-1]]
+
+        locations = self.sounding_locations
+        if locations is None:
+            positions = np.arange(self.n_sounding, dtype=float)
+        elif locations.ndim == 1:
+            positions = locations
+        else:
+            # Distance along the line through the soundings
+            positions = np.r_[
+                0.0, np.cumsum(np.linalg.norm(np.diff(locations, axis=0), axis=1))
+            ]
+
+        if len(positions) != self.n_sounding:
+            raise ValueError(
+                "{} sounding locations were given for {} soundings".format(
+                    len(positions), self.n_sounding
+                )
+            )
+
+        if len(positions) == 1:
+            nodes = positions[0] + np.r_[-0.5, 0.5]
+        else:
+            nodes = np.r_[
+                1.5 * positions[0] - 0.5 * positions[1],
+                0.5 * (positions[1:] + positions[:-1]),
+                1.5 * positions[-1] - 0.5 * positions[-2],
+            ]
+
+        return discretize.TensorMesh([h_layer, np.diff(nodes)], x0=[0.0, nodes[0]])
+
+    @property
+    def _sounding_bytes(self):
+        """
+        Size (bytes) of the temporaries of the kernels of a sounding
+        """
+        return 8 * self.n_layer * self.n_sounding_data
+
+    def _evaluate_soundings(self, soundings, deriv=False):
+        """
+        Vectorized kernels of a chunk of soundings.
+
+        :param slice soundings: soundings of the chunk
+        :param bool deriv: also return the derivatives of the data
+        :rtype: tuple
+        :returns: (data,) or (data, derivatives) with data an array of shape
+            (n_chunk, n_sounding_data) and derivatives an array of shape
+            (n_chunk, n_sounding_data, n_layer) of the derivatives of the data
+            with respect to the physical property of the layers
+        """
+        raise NotImplementedError(
+            "_evaluate_soundings must be implemented by the stitched simulation"
+        )
+
+    def _sounding_chunks(self):
+        """
+        Slices of the chunks of soundings, bounded by ``max_chunk_size`` and
+        shared between the workers.
+        """
+        n_sounding = self.n_sounding
+        n_chunk = max(1, int(self.max_chunk_size * 1e6 // self._sounding_bytes))
+        if self.n_workers > 1:
+            n_chunk = min(n_chunk, -(-n_sounding // self.n_workers))
+
+        return [
+            slice(start, min(start + n_chunk, n_sounding))
+            for start in range(0, n_sounding, n_chunk)
+        ]
+
+    def _fill_soundings(self, soundings, arrays, deriv=False):
+        for out, values in zip(arrays, self._evaluate_soundings(soundings, deriv)):
+            out[soundings] = values
+
+    def _evaluate(self, deriv=False):
+        """
+        Data of all the soundings, and their derivatives if deriv is True.
+
+        Workers are forked so that they share the simulation and fill their
+        soundings of anonymous shared memory maps, see
+        :func:`SimPEG.utils.parallel_utils.worker_executor`.
+
+        :rtype: tuple
+        :returns: (data,) or (data, derivatives) arrays of shapes
+            (n_sounding, n_sounding_data) and
+            (n_sounding, n_sounding_data, n_layer)
+        """
+        shapes = [(self.n_sounding, self.n_sounding_data)]
+        if deriv:
+            shapes.append(shapes[0] + (self.n_layer,))
+
+        chunks = self._sounding_chunks()
+        if self.n_workers == 1 or len(chunks) == 1:
+            arrays = [np.empty(shape) for shape in shapes]
+            for soundings in chunks:
+                self._fill_soundings(soundings, arrays, deriv)
+            return tuple(arrays)
+
+        arrays = [shared_array(shape) for shape in shapes]
+        executor, fill_chunk = worker_executor(
+            partial(self._fill_soundings, arrays=arrays, deriv=deriv), self.n_workers
+        )
+        with executor:
+            for _ in executor.map(fill_chunk, chunks):
+                pass
+
+        return tuple(np.array(values) for values in arrays)
+
+    def fields(self, m=None):
+        # The stitched simulation does not have fields
+        if m is not None:
+            self.model = m
+        return None
+
+    def dpred(self, m=None, f=None):
+        """
+        Data of all the soundings, ordered by sounding.
+
+        :param numpy.ndarray m: inversion model (nP,)
+        :rtype: numpy.ndarray
+        :return: data (nD,)
+        """
+        if m is not None:
+            self.model = m
+
+        return self._evaluate()[0].reshape(-1)
+
+    def getJ(self, m, f=None):
+        """
+        Block diagonal sparse sensitivity matrix, every block holding the
+        derivatives of the data of a sounding with respect to its layers.
+
+        :param numpy.ndarray m: inversion model (nP,)
+        :rtype: scipy.sparse.csr_matrix
+        :return: J (nD, nP)
+        """
+        self.model = m
+        if getattr(self, "_Jmatrix", None) is not None:
+            return self._Jmatrix
+
+        if getattr(self, "thicknessesMap", None) is not None:
+            raise NotImplementedError(
+                "The soundings of a stitched simulation share fixed layer "
+                "thicknesses, which cannot be inverted for"
+            )
+
+        _, blocks = self._evaluate(deriv=True)
+        n_sounding, n_data, n_layer = blocks.shape
+        columns = np.tile(np.arange(n_layer), n_sounding * n_data) + np.repeat(
+            np.arange(n_sounding) * n_layer, n_data * n_layer
+        )
+        J = sp.csr_matrix(
+            (
+                blocks.reshape(-1),
+                columns,
+                np.arange(0, n_sounding * n_data * n_layer + 1, n_layer),
+            ),
+            shape=(n_sounding * n_data, n_sounding * n_layer),
+        )
+
+        self._Jmatrix = sp.csr_matrix(J @ getattr(self, self._property_name + "Deriv"))
+        return self._Jmatrix
+
+    def getJtJdiag(self, m, W=None):
+        """
+        Diagonal of J.T @ W.T @ W @ J, from the sparse sensitivity.
+        """
+        if getattr(self, "_gtgdiag", None) is None:
+            J = self.getJ(m)
+            if W is None:
+                W = np.ones(J.shape[0])
+            else:
+                W = W.diagonal() ** 2
+
+            self._gtgdiag = np.asarray(J.multiply(J).T @ W).reshape(-1)
+        return self._gtgdiag
+
+    def Jvec(self, m, v, f=None):
+        return self.getJ(m) @ v
+
+    def Jtvec(self, m, v, f=None):
+        return self.getJ(m).T @ v
+
+    @property
+    def deleteTheseOnModelUpdate(self):
+        toDelete = super().deleteTheseOnModelUpdate
+        if self.fix_Jmatrix or "_gtgdiag" in toDelete:
+            return toDelete
+
+        if getattr(self, "_gtgdiag", None) is not None:
+            toDelete = toDelete + ["_gtgdiag"]
+        return toDelete
@@ -4,6 +4,7 @@ from scipy.constants import mu_0
 
 from ...simulation import BaseSimulation
 from ... import props
+from ..base_1d_stitched import BaseStitched1DSimulation
 from ..frequency_domain.survey import Survey
 
 
@@ -57,12 +58,13 @@ class Simulation1DRecursive(BaseSimulation):
             Frequencies in Hz
         thicknesses : (n_layer-1, ) np.ndarray
             Layer thicknesses in meters, starting from the bottom
-        sigmas : (n_layer, ) np.ndarray
-            Layer conductivities in S/m, starting from the bottom
+        sigmas : (n_layer, ...) np.ndarray
+            Layer conductivities in S/m, starting from the bottom. Further
+            dimensions hold soundings sharing the thicknesses
 
         Returns
         -------
-        Z : (n_freq, ) np.ndarray
+        Z : (..., n_freq) np.ndarray
             complex impedances at surface
         """
         frequencies = np.asarray(frequencies)
@@ -72,9 +74,11 @@ class Simulation1DRecursive(BaseSimulation):
         n_layer = len(sigmas)
 
         # layer quantities
-        alphas = np.sqrt(1j * omega * mu_0 * sigmas[:, None])
-        ratios = alphas / sigmas[:, None]
-        tanhs = np.tanh(alphas[:-1] * thicknesses[:, None])
+        sigmas = sigmas[..., None]
+        thicknesses = thicknesses.reshape((-1,) + (1,) * (sigmas.ndim - 1))
+        alphas = np.sqrt(1j * omega * mu_0 * sigmas)
+        ratios = alphas / sigmas
+        tanhs = np.tanh(alphas[:-1] * thicknesses)
 
         Z = -ratios[-1]
         # Work from lowest layer to top layer
@@ -95,16 +99,17 @@ class Simulation1DRecursive(BaseSimulation):
             Frequencies in Hz
         thicknesses : (n_layer-1, ) np.ndarray
             Layer thicknesses in meters, starting from the bottom
-        sigmas : (n_layer, ) np.ndarray
-            Layer conductivities in S/m, starting from the bottom
+        sigmas : (n_layer, ...) np.ndarray
+            Layer conductivities in S/m, starting from the bottom. Further
+            dimensions hold soundings sharing the thicknesses
 
         Returns
         -------
-        Z : (n_freq, ) np.ndarray
+        Z : (..., n_freq) np.ndarray
             Complex impedance at surface
-        Z_dsigma : (n_freq, n_layer) np.ndarray
+        Z_dsigma : (..., n_freq, n_layer) np.ndarray
             Derivative of complex impedances at surface with respect to sigma
-        Z_dsigma : (n_freq, n_layer-1) np.ndarray
+        Z_dsigma : (..., n_freq, n_layer-1) np.ndarray
             Derivative of complex impedances at surface with respect to thicknesses
         """
         frequencies = np.asarray(frequencies)
@@ -114,9 +119,11 @@ class Simulation1DRecursive(BaseSimulation):
         n_layer = len(sigmas)
 
         # Bottom layer quantities
-        alphas = np.sqrt(1j * omega * mu_0 * sigmas[:, None])
-        ratios = alphas / sigmas[:, None]
-        tanhs = np.tanh(alphas[:-1] * thicknesses[:, None])
+        sigmas = sigmas[..., None]
+        thicknesses = thicknesses.reshape((-1,) + (1,) * (sigmas.ndim - 1))
+        alphas = np.sqrt(1j * omega * mu_0 * sigmas)
+        ratios = alphas / sigmas
+        tanhs = np.tanh(alphas[:-1] * thicknesses)
 
         tops = np.empty_like(tanhs)
         bots = np.empty_like(tanhs)
@@ -146,15 +153,19 @@ class Simulation1DRecursive(BaseSimulation):
         gratios[-1] = -gZ
         d_thick = (1 - tanhs ** 2) * alphas[:-1] * gtanhs
 
-        galphas = gratios / sigmas[:, None]
-        galphas[:-1] += (1 - tanhs ** 2) * thicknesses[:, None] * gtanhs
+        galphas = gratios / sigmas
+        galphas[:-1] += (1 - tanhs ** 2) * thicknesses * gtanhs
 
-        d_sigma = -ratios / sigmas[:, None] * gratios
+        d_sigma = -ratios / sigmas * gratios
         d_sigma += (0.5j * omega * mu_0) / alphas * galphas
 
         # d_mu would be this below when it gets activated:
         # d_mu = (0.5j * omega * sigmas[:, None]) / alphas * galphas
-        return Zs[0], d_sigma[::-1].T, d_thick[::-1].T
+        return (
+            Zs[0],
+            np.moveaxis(d_sigma[::-1], 0, -1),
+            np.moveaxis(d_thick[::-1], 0, -1),
+        )
 
     def fields(self, m):
         # The layered simulation does not have fields.
@@ -300,3 +311,108 @@ class Simulation1DRecursive(BaseSimulation):
         else:
             toDelete = toDelete + ["_Jmatrix", "_gtgdiag"]
         return toDelete
+
+
+class Simulation1DRecursiveStitched(BaseStitched1DSimulation, Simulation1DRecursive):
+    """
+    Stitched 1D MT simulation of many soundings over layered earths.
+
+    The survey holds the sources of every sounding in turn, all the soundings
+    sharing the frequencies and receiver components of the first one, and the
+    layer thicknesses. The conductivities (or resistivities) of the layers of
+    every sounding, starting from the bottom, are ordered as an
+    (n_sounding, n_layer) array.
+
+    The impedances of a chunk of soundings are evaluated in one recursion over
+    the layers.
+    """
+
+    _property_name = "sigma"
+    _halfspace_first = True
+
+    @property
+    def _sounding_rows(self):
+        """
+        Frequency index and component of the data of a sounding
+        """
+        if getattr(self, "_rows", None) is None:
+            frequencies, components = [], []
+            for src in self.survey.source_list:
+                for rx in src.receiver_list:
+                    frequencies += [src.frequency] * rx.nD
+                    components += [rx.component] * rx.nD
+
+            frequencies = np.reshape(frequencies, (self.n_sounding, -1))
+            components = np.reshape(components, (self.n_sounding, -1))
+            if np.any(frequencies != frequencies[0]) or np.any(
+                components != components[0]
+            ):
+                raise ValueError(
+                    "All soundings must share the frequencies and receiver "
+                    "components of the first sounding"
+                )
+            self._rows = (
+                np.searchsorted(self.survey.frequencies, frequencies[0]),
+                components[0],
+            )
+        return self._rows
+
+    @property
+    def _sounding_bytes(self):
+        # Complex quantities of the layers in the recursion and its adjoint
+        return 16 * 12 * self.n_layer * len(self.survey.frequencies)
+
+    def _evaluate_soundings(self, soundings, deriv=False):
+        sigma = self.sigma.reshape((-1, self.n_layer))[soundings].T
+        if deriv:
+            Z, Z_dsigma, _ = self._get_recursive_impedances_deriv(
+                self.survey.frequencies, self.thicknesses, sigma
+            )
+        else:
+            Z = self._get_recursive_impedances(
+                self.survey.frequencies, self.thicknesses, sigma
+            )
+
+        i_freq, components = self._sounding_rows
+        frequencies = np.asarray(self.survey.frequencies)[i_freq]
+
+        data = np.empty((Z.shape[0], len(i_freq)))
+        if deriv:
+            J = np.empty(data.shape + (self.n_layer,))
+
+        for component in np.unique(components):
+            rows = components == component
+            Zs = Z[:, i_freq[rows]]
+            if component == "real":
+                data[:, rows] = np.real(Zs)
+            elif component == "imag":
+                data[:, rows] = np.imag(Zs)
+            elif component == "apparent_resistivity":
+                data[:, rows] = np.abs(Zs) ** 2 / (2 * np.pi * frequencies[rows] * mu_0)
+            elif component == "phase":
+                data[:, rows] = (180.0 / np.pi) * np.arctan(np.imag(Zs) / np.real(Zs))
+
+            if not deriv:
+                continue
+
+            Js_rows = Z_dsigma[:, i_freq[rows]]
+            real = np.real(Zs)[..., None]
+            imag = np.imag(Zs)[..., None]
+            if component == "real":
+                J[:, rows] = np.real(Js_rows)
+            elif component == "imag":
+                J[:, rows] = np.imag(Js_rows)
+            elif component == "apparent_resistivity":
+                J[:, rows] = (np.pi * frequencies[rows, None] * mu_0) ** -1 * (
+                    real * np.real(Js_rows) + imag * np.imag(Js_rows)
+                )
+            elif component == "phase":
+                C = 180 / np.pi
+                bot = real ** 2 + imag ** 2
+                J[:, rows] = C * (
+                    -imag / bot * np.real(Js_rows) + real / bot * np.imag(Js_rows)
+                )
+
+        if not deriv:
+            return (data,)
+        return data, J
@@ -11,6 +11,7 @@ from ..resistivity import Simulation3DCellCentered as DC_3D_CC
 from ..resistivity import Simulation3DNodal as DC_3D_N
 from ..resistivity import Simulation2DCellCentered as DC_2D_CC
 from ..resistivity import Simulation2DNodal as DC_2D_N
+from ....utils.sensitivity_utils import MemmapSensitivity
 
 
 class BaseIPSimulation(BasePDESimulation):
@@ -114,7 +115,10 @@ class BaseIPSimulation(BasePDESimulation):
             else:
                 W = (self._scale * W.diagonal()) ** 2
 
-            self.gtgdiag = np.einsum("i,ij,ij->j", W, J, J)
+            if isinstance(J, MemmapSensitivity):
+                self.gtgdiag = J.jtj_diag(W)
+            else:
+                self.gtgdiag = np.einsum("i,ij,ij->j", W, J, J)
 
         return self.gtgdiag
 
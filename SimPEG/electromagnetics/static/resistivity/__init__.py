@@ -1,12 +1,13 @@
 from .simulation import Simulation3DCellCentered, Simulation3DNodal
 from .simulation_2d import Simulation2DCellCentered, Simulation2DNodal
-from .simulation_1d import Simulation1DLayers
+from .simulation_1d import Simulation1DLayers, Simulation1DLayersStitched
 from .survey import Survey
 from . import sources
 from . import receivers
 from .fields import FieldsDC, Fields3DCellCentered, Fields3DNodal
 from .fields_2d import Fields2D, Fields2DCellCentered, Fields2DNodal
 from . import utils
+from . import tiling
 from .IODC import IO
 from .run import run_inversion
 
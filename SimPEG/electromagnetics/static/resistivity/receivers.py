@@ -4,6 +4,16 @@ import properties
 from ....utils import sdiag
 from ....survey import BaseRx as BaseSimPEGRx, RxLocationArray
 
+# Bumped when the data type or geometric factors of any receiver, or the currents
+# of any source, change, so that simulations assemble their cached data
+# projections and reciprocal combinations again
+_data_scale_version = 0
+
+
+def _data_scale_changed():
+    global _data_scale_version
+    _data_scale_version += 1
+
 
 # Receiver classes
 class BaseRx(BaseSimPEGRx):
@@ -42,6 +52,10 @@ class BaseRx(BaseSimPEGRx):
 
     # data_type = 'volt'
 
+    @properties.observer("data_type")
+    def _data_type_changed(self, change):
+        _data_scale_changed()
+
     # knownRxTypes = {
     #     'phi': ['phi', None],
     #     'ex': ['e', 'x'],
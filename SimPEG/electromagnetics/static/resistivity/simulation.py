@@ -1,13 +1,24 @@
+import os
+import multiprocessing
 import numpy as np
 import scipy.sparse as sp
 import properties
 
+from .... import maps
 from ....utils import mkvc, Zero
+from ....utils.code_utils import hash_arrays
+from ....utils.sensitivity_utils import MemmapSensitivity, create_sensitivity_file
 from ....data import Data
 from ....base import BaseElectricalPDESimulation
 from .survey import Survey
 from .fields import Fields3DCellCentered, Fields3DNodal
-from .utils import _mini_pole_pole
+from . import receivers
+from .utils import (
+    _mini_pole_pole,
+    _reciprocal_combination,
+    _reciprocal_pole_pole,
+    _survey_projection,
+)
 from discretize.utils import make_boundary_bool
 
 
@@ -20,7 +31,40 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
 
     storeJ = properties.Bool("store the sensitivity matrix?", default=False)
 
+    max_adjoint_block = properties.Float(
+        "Maximum memory (MB) of the adjoint right-hand sides of many sources and "
+        "receivers solved together when forming J or Jtv. A block holds at least "
+        "one receiver.",
+        default=512.0,
+        min=0.0,
+    )
+
+    store_sensitivities = properties.StringChoice(
+        "Storage of the sensitivity matrix formed by getJ. 'disk' writes float32 "
+        "sensitivities with respect to the log conductivity to sensitivity_path, "
+        "memory mapped and shared by the simulations of the same mesh, survey and "
+        "conductivity.",
+        choices=["ram", "disk"],
+        default="ram",
+    )
+
+    sensitivity_chunk_size = properties.Float(
+        "Size (MB) of the blocks of rows of J read at once with "
+        "store_sensitivities='disk'",
+        default=128.0,
+        min=0.0,
+    )
+
+    n_threads = properties.Integer(
+        "Number of threads applying the blocks of rows of J with "
+        "store_sensitivities='disk'",
+        default=int(multiprocessing.cpu_count()),
+        min=1,
+    )
+
     _mini_survey = None
+    _combination = None
+    _reciprocal = False
 
     Ainv = None
     _Jmatrix = None
@@ -28,11 +72,22 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
 
     def __init__(self, *args, **kwargs):
         miniaturize = kwargs.pop("miniaturize", False)
+        reciprocity = kwargs.pop("reciprocity", False)
         super().__init__(*args, **kwargs)
+        if miniaturize and reciprocity:
+            raise ValueError("A survey cannot be both miniaturized and reciprocal")
         # Do stuff to simplify the forward and JTvec operation if number of dipole
         # sources is greater than the number of unique pole sources
         if miniaturize:
             self._dipoles, self._invs, self._mini_survey = _mini_pole_pole(self.survey)
+        # Solve for the potentials of the unique current electrodes, or by
+        # reciprocity of the unique potential electrodes if there are fewer
+        if reciprocity:
+            (
+                self._combination,
+                self._mini_survey,
+                self._reciprocal,
+            ) = _reciprocal_pole_pole(self.survey)
 
     def fields(self, m=None, calcJ=True):
         if m is not None:
@@ -53,23 +108,259 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
         if self._Jmatrix is None:
             if f is None:
                 f = self.fields(m)
-            self._Jmatrix = self._Jtvec(m, v=None, f=f).T
+            if self.store_sensitivities == "disk":
+                self._Jmatrix = self._getJ_disk(f)
+            elif self._combination is not None:
+                self._Jmatrix = self._mini_survey_data(self._getJ_electrodes(f))
+            else:
+                self._Jmatrix = self._Jtvec(m, v=None, f=f).T
         return self._Jmatrix
 
+    def _getJ_disk(self, f):
+        """
+        Sensitivity matrix stored in ``sensitivity_path``, as a
+        :class:`SimPEG.utils.sensitivity_utils.MemmapSensitivity`.
+
+        The sensitivities with respect to the log conductivity are written by
+        blocks of columns of adjoint problems to a file named by a hash of the
+        mesh, survey and conductivity, or reused if that file exists. Files
+        written for previous models by the simulation are removed.
+        """
+        filename = os.path.join(
+            self.sensitivity_path, "J_{}.npy".format(self._sensitivity_key())
+        )
+        if not os.path.exists(filename):
+            if self.verbose:
+                print(f"writing sensitivity to {filename}")
+            simulation = self._log_conductivity_simulation()
+            partial = filename[:-4] + ".partial.npy"
+            shape = (self.survey.nD, self.mesh.nC)
+            if self._mini_survey is None:
+                values = create_sensitivity_file(partial, shape)
+                simulation._Jtvec(simulation.model, v=None, f=f, out=values)
+            else:
+                mini_name = filename[:-4] + ".mini.npy"
+                mini = create_sensitivity_file(
+                    mini_name, (self._mini_survey.nD, self.mesh.nC)
+                )
+                if self._combination is not None:
+                    simulation._getJ_electrodes(f, out=mini)
+                else:
+                    simulation._Jtvec(simulation.model, v=None, f=f, out=mini)
+                values = create_sensitivity_file(partial, shape)
+                self._combine_mini_survey(mini, values)
+                del mini
+                os.remove(mini_name)
+            values.flush()
+            del values
+            os.replace(partial, filename)
+
+            for name in getattr(self, "_sensitivity_files", []):
+                if name != filename and os.path.exists(name):
+                    os.remove(name)
+            self._sensitivity_files = [filename]
+
+        return MemmapSensitivity(
+            filename,
+            sp.diags(1.0 / self.sigma) @ self.sigmaDeriv,
+            chunk_size=self.sensitivity_chunk_size,
+            n_threads=self.n_threads,
+        )
+
+    def _sensitivity_key(self):
+        """
+        Hash of the mesh, survey and conductivity defining the sensitivities
+        with respect to the log conductivity.
+        """
+        survey = []
+        for src in self.survey.source_list:
+            survey += [type(src).__name__, src.location, src.current]
+            for rx in src.receiver_list:
+                survey += [
+                    type(rx).__name__,
+                    np.asarray(rx.locations),
+                    rx.projField,
+                    str(rx.orientation),
+                ]
+                if rx.data_type == "apparent_resistivity":
+                    survey.append(rx.geometric_factor.get(src, np.nan))
+
+        return hash_arrays(
+            self._formulation,
+            str(self.bc_type),
+            self.mesh.cell_centers,
+            self.mesh.cell_volumes,
+            self.sigma,
+            *survey,
+        )
+
+    def _log_conductivity_simulation(self):
+        """
+        Simulation of the survey with the log conductivity of the cells as
+        model, sharing the factorization and survey decomposition of this
+        simulation.
+        """
+        if self._formulation == "HJ":
+            simulation_class = Simulation3DCellCentered
+        else:
+            simulation_class = Simulation3DNodal
+
+        simulation = simulation_class(
+            self.mesh,
+            survey=self.survey,
+            sigmaMap=maps.ExpMap(self.mesh),
+            bc_type=self.bc_type,
+            solver=self.solver,
+            solver_opts=self.solver_opts,
+            max_adjoint_block=self.max_adjoint_block,
+        )
+        simulation.model = np.log(self.sigma)
+        decomposition = ["_mini_survey", "_combination", "_reciprocal", "_dipoles"]
+        for name in decomposition + ["_invs"]:
+            if name in self.__dict__:
+                setattr(simulation, name, getattr(self, name))
+        simulation.Ainv = self.Ainv
+        return simulation
+
+    def _combine_mini_survey(self, mini, out):
+        """
+        Combine the rows of the sensitivity of the miniaturized survey into the
+        rows of the data, by blocks of ``sensitivity_chunk_size`` MB.
+        """
+        combination = self._mini_survey_matrix
+        n_block = max(1, int(self.sensitivity_chunk_size * 1e6 // (8 * out.shape[1])))
+        for start in range(0, out.shape[0], n_block):
+            rows = combination[start : start + n_block]
+            columns = np.unique(rows.indices)
+            out[start : start + n_block] = rows[:, columns] @ np.asarray(
+                mini[columns], dtype=float
+            )
+
+    def _getJ_electrodes(self, f, out=None):
+        """
+        Sensitivity of the pole-pole data of the solved electrodes.
+
+        The sensitivity of the potential of a pair of electrodes is the
+        derivative of the system, contracted with the potentials of both of
+        its electrodes. The other electrodes of the pairs are therefore solved
+        once each, rather than once for every datum, in blocks of at most
+        ``max_adjoint_block`` MB. The rows are written to ``out`` if given.
+        """
+        survey = self._mini_survey
+        locations = np.vstack(
+            [src.receiver_list[0].locations for src in survey.source_list]
+        )
+        others, inverse = np.unique(locations, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if self._reciprocal:
+            terms = self._source_terms(others)
+        else:
+            terms = self._receiver_terms(others)
+
+        u = f[:, self._solutionType]
+        offsets = np.r_[0, np.cumsum([src.nD for src in survey.source_list])]
+        if out is None:
+            J = np.empty((survey.nD, self.model.size))
+        else:
+            J = out
+        n_block = max(1, int(self.max_adjoint_block * 1e6 // (8 * terms.shape[1])))
+        for start in range(0, len(others), n_block):
+            stop = min(start + n_block, len(others))
+            solutions = self.Ainv * terms[start:stop].T.toarray()
+            solutions = solutions.reshape((terms.shape[1], -1))
+            for i_src in range(len(survey.source_list)):
+                rows = np.arange(offsets[i_src], offsets[i_src + 1])
+                rows = rows[(inverse[rows] >= start) & (inverse[rows] < stop)]
+                if len(rows) == 0:
+                    continue
+                dA_dmT = self.getADeriv(
+                    u[:, i_src], solutions[:, inverse[rows] - start], adjoint=True
+                )
+                J[rows] = -np.reshape(np.asarray(dA_dmT), (self.model.size, -1)).T
+        return J
+
+    def _source_terms(self, locations):
+        """
+        Right-hand sides of unit pole sources at the locations, as evaluated
+        by the sources, (n_locations, nC or nN)
+        """
+        if self._formulation == "HJ":
+            inds = self.mesh.closest_points_index(locations, grid_loc="CC")
+            return sp.csr_matrix(
+                (np.ones(len(inds)), (np.arange(len(inds)), inds)),
+                shape=(len(inds), self.mesh.nC),
+            )
+        return self.mesh.get_interpolation_matrix(locations, locType="N")
+
+    def _receiver_terms(self, locations):
+        """
+        Interpolation of the potentials at the locations, (n_locations, nC or nN)
+        """
+        if self._formulation == "HJ":
+            return self.mesh.get_interpolation_matrix(locations, locType="CC")
+        return self.mesh.get_interpolation_matrix(locations, locType="N")
+
     def dpred(self, m=None, f=None):
+        if f is None:
+            if m is None:
+                m = self.model
+            f = self.fields(m)
+
         if self._mini_survey is not None:
-            # Temporarily set self.survey to self._mini_survey
+            survey = self._mini_survey
+        else:
             survey = self.survey
-            self.survey = self._mini_survey
-
-        data = super().dpred(m=m, f=f)
 
-        if self._mini_survey is not None:
-            # reset survey
-            self.survey = survey
+        P = self._projection(survey, f)
+        if P is not None:
+            data = P @ mkvc(f[:, self._solutionType])
+        else:
+            data = Data(survey)
+            for src in survey.source_list:
+                for rx in src.receiver_list:
+                    data[src, rx] = rx.eval(src, self.mesh, f)
+            data = mkvc(data)
 
         return self._mini_survey_data(data)
 
+    def _projection(self, survey, f):
+        """
+        Projection of the potentials of all the sources of the survey to its
+        data, assembled once for every survey, and again once the data types
+        or geometric factors of the receivers change. None if receivers
+        project other fields than the potentials.
+        """
+        if getattr(self, "_projections", None) is None:
+            self._projections = {}
+        version = receivers._data_scale_version
+        cached = self._projections.get(id(survey))
+        if cached is None or cached[1] != version:
+            if self._reciprocal and survey is self._mini_survey:
+                P = self._reciprocal_projection(survey)
+            else:
+                P = _survey_projection(survey, self.mesh, f)
+            self._projections[id(survey)] = (survey, version, P)
+        return self._projections[id(survey)][2]
+
+    def _reciprocal_projection(self, survey):
+        """
+        Projection of the potentials of the potential electrodes of a
+        reciprocal survey to its pole-pole data, through the right-hand sides
+        of its current electrodes.
+        """
+        n = self.mesh.nC if self._formulation == "HJ" else self.mesh.nN
+        locations, shift = [], []
+        for i_src, src in enumerate(survey.source_list):
+            for rx in src.receiver_list:
+                locations.append(rx.locations)
+                shift.append(np.full(rx.nD, i_src * n))
+
+        P = self._source_terms(np.vstack(locations)).tocoo()
+        return sp.csr_matrix(
+            (P.data, (P.row, P.col + np.hstack(shift)[P.row])),
+            shape=(P.shape[0], n * len(survey.source_list)),
+        )
+
     def getJtJdiag(self, m, W=None):
         """
         Return the diagonal of JtJ
@@ -82,11 +373,10 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
             else:
                 W = W.diagonal() ** 2
 
-            diag = np.zeros(J.shape[1])
-            for i in range(J.shape[0]):
-                diag += (W[i]) * (J[i] * J[i])
-
-            self.gtgdiag = diag
+            if isinstance(J, MemmapSensitivity):
+                self.gtgdiag = J.jtj_diag(W)
+            else:
+                self.gtgdiag = np.einsum("i,ij,ij->j", W, J, J)
         return self.gtgdiag
 
     def Jvec(self, m, v, f=None):
@@ -109,6 +399,18 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
         else:
             survey = self.survey
 
+        P = self._projection(survey, f)
+        if P is not None:
+            # Solve the derivatives of the potentials of all sources at once
+            u = f[:, self._solutionType]
+            RHS = np.empty_like(u)
+            for i, source in enumerate(survey.source_list):
+                dA_dm_v = self.getADeriv(u[:, i], v)
+                dRHS_dm_v = self.getRHSDeriv(source, v)
+                RHS[:, i] = -dA_dm_v + dRHS_dm_v
+            du_dm_v = self.Ainv * RHS
+            return self._mini_survey_data(P @ mkvc(du_dm_v))
+
         Jv = []
         for source in survey.source_list:
             u_source = f[source, self._solutionType]  # solution vector
@@ -138,10 +440,17 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
 
         return self._Jtvec(m, v=v, f=f)
 
-    def _Jtvec(self, m, v=None, f=None):
+    def _Jtvec(self, m, v=None, f=None, out=None):
         """
         Compute adjoint sensitivity matrix (J^T) and vector (v) product.
-        Full J matrix can be computed by inputing v=None
+        Full J matrix can be computed by inputing v=None, written to the
+        (nD, nP) array ``out`` if given, without combining the data of a
+        miniaturized survey.
+
+        Adjoint right-hand sides are gathered over sources and receivers into
+        blocks of at most ``max_adjoint_block`` MB solved at once. For Jtv, the
+        right-hand sides of the receivers of a source are summed into a single
+        column.
         """
 
         if self._mini_survey is not None:
@@ -149,52 +458,140 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
         else:
             survey = self.survey
 
+        P = self._projection(survey, f)
+        if P is not None:
+            n_source = len(survey.source_list)
+            n = P.shape[1] // max(n_source, 1)
+            offsets = np.r_[0, np.cumsum([source.nD for source in survey.source_list])]
+
         if v is not None:
             if isinstance(v, Data):
                 v = v.dobs
             v = self._mini_survey_dataT(v)
+            if P is not None:
+                # Adjoint right-hand sides of all sources at once
+                PTv = (P.T @ v).reshape((n, n_source), order="F")
             v = Data(survey, v)
             Jtv = np.zeros(m.size)
         else:
             # This is for forming full sensitivity matrix
-            Jtv = np.zeros((self.model.size, survey.nD), order="F")
-            istrt = int(0)
-            iend = int(0)
-
-        for source in survey.source_list:
-            u_source = f[source, self._solutionType].copy()
-            for rx in source.receiver_list:
-                # wrt f, need possibility wrt m
+            if out is None:
+                Jtv = np.zeros((self.model.size, survey.nD), order="F")
+            else:
+                Jtv = out.T
+
+        # Adjoint right-hand sides of the pending sources and receivers
+        block, block_size = [], 0
+        istrt = 0
+        for i_source, source in enumerate(survey.source_list):
+            df_duT, df_dmT = [], []
+            if P is not None:
+                # Potentials are projected, without model derivatives
+                if offsets[i_source] == offsets[i_source + 1]:
+                    continue
                 if v is not None:
-                    PTv = rx.evalDeriv(
-                        source, self.mesh, f, v[source, rx], adjoint=True
-                    )
+                    df_duT.append(PTv[:, i_source : i_source + 1])
                 else:
-                    PTv = rx.evalDeriv(source, self.mesh, f).toarray().T
+                    P_source = P[offsets[i_source] : offsets[i_source + 1]]
+                    df_duT.append(
+                        P_source[:, i_source * n : (i_source + 1) * n].T.toarray()
+                    )
+                df_dmT.append(Zero())
+            else:
+                for rx in source.receiver_list:
+                    # wrt f, need possibility wrt m
+                    if v is not None:
+                        PTv = rx.evalDeriv(
+                            source, self.mesh, f, v[source, rx], adjoint=True
+                        )
+                    else:
+                        PTv = rx.evalDeriv(source, self.mesh, f).toarray().T
+
+                    df_duTFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
+                    rx_df_duT, rx_df_dmT = df_duTFun(source, None, PTv, adjoint=True)
+                    if sp.issparse(rx_df_duT):
+                        rx_df_duT = rx_df_duT.toarray()
+                    rx_df_duT = np.asarray(rx_df_duT).reshape((rx_df_duT.shape[0], -1))
+
+                    if v is not None and len(df_duT) > 0:
+                        # Jtv is linear in the right-hand sides of a source
+                        df_duT[0] = df_duT[0] + rx_df_duT
+                        df_dmT[0] = df_dmT[0] + rx_df_dmT
+                    else:
+                        df_duT.append(rx_df_duT)
+                        df_dmT.append(rx_df_dmT)
 
-                df_duTFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
-                df_duT, df_dmT = df_duTFun(source, None, PTv, adjoint=True)
+            if len(df_duT) == 0:
+                continue
 
-                ATinvdf_duT = self.Ainv * df_duT
+            if v is None:
+                columns = np.r_[
+                    istrt, istrt + np.cumsum([rx.nD for rx in source.receiver_list])
+                ]
+                istrt = columns[-1]
+            else:
+                columns = None
 
-                dA_dmT = self.getADeriv(u_source, ATinvdf_duT, adjoint=True)
-                dRHS_dmT = self.getRHSDeriv(source, ATinvdf_duT, adjoint=True)
-                du_dmT = -dA_dmT + dRHS_dmT
-                if v is not None:
-                    Jtv += (df_dmT + du_dmT).astype(float)
-                else:
-                    iend = istrt + rx.nD
-                    if rx.nD == 1:
-                        Jtv[:, istrt] = df_dmT + du_dmT
-                    else:
-                        Jtv[:, istrt:iend] = df_dmT + du_dmT
-                    istrt += rx.nD
+            size = sum(values.nbytes for values in df_duT) / 1e6
+            if block and block_size + size > self.max_adjoint_block:
+                self._solve_adjoint_block(block, f, Jtv)
+                block, block_size = [], 0
+            block.append((source, df_duT, df_dmT, columns))
+            block_size += size
+
+        if block:
+            self._solve_adjoint_block(block, f, Jtv)
 
         if v is not None:
             return mkvc(Jtv)
+        elif out is not None:
+            return out
         else:
             return (self._mini_survey_data(Jtv.T)).T
 
+    def _solve_adjoint_block(self, block, f, Jtv):
+        """
+        Solve the adjoint problems of a block of sources with one multi-column
+        solve, and add their contributions to Jtv, or to the columns of the
+        data of the receivers when forming J.
+
+        :param list block: tuples of (source, df_duT, df_dmT, columns) with
+            df_duT and df_dmT the lists of adjoint right-hand sides and direct
+            model derivatives of the receivers of the source, and columns the
+            bounds of the data of the receivers in J, None for Jtv
+        :param Fields f: fields of the simulation
+        :param numpy.ndarray Jtv: Jtv, or transpose of J, updated in place
+        """
+        ATinvdf_duT = self.Ainv * np.hstack(
+            [values for _, df_duT, _, _ in block for values in df_duT]
+        )
+        ATinvdf_duT = ATinvdf_duT.reshape((ATinvdf_duT.shape[0], -1))
+
+        start = 0
+        for source, df_duT, df_dmT, columns in block:
+            end = start + sum(values.shape[1] for values in df_duT)
+            u_source = f[source, self._solutionType].copy()
+
+            solution = ATinvdf_duT[:, start:end]
+            if solution.shape[1] == 1:
+                solution = solution[:, 0]
+
+            dA_dmT = self.getADeriv(u_source, solution, adjoint=True)
+            dRHS_dmT = self.getRHSDeriv(source, solution, adjoint=True)
+            du_dmT = -dA_dmT + dRHS_dmT
+
+            if columns is None:
+                Jtv += (df_dmT[0] + du_dmT).astype(float)
+            else:
+                du_dmT = np.asarray(du_dmT).reshape((Jtv.shape[0], -1))
+                Jtv[:, columns[0] : columns[-1]] = du_dmT
+                for ii, values in enumerate(df_dmT):
+                    if not isinstance(values, Zero):
+                        Jtv[:, columns[ii] : columns[ii + 1]] += np.reshape(
+                            values, (Jtv.shape[0], -1)
+                        )
+            start = end
+
     def getSourceTerm(self):
         """
         Evaluates the sources, and puts them in matrix form
@@ -207,6 +604,11 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
         else:
             Srcs = self.survey.source_list
 
+        if self._reciprocal:
+            # Potential electrodes are sources of their interpolation
+            locations = np.vstack([source.location for source in Srcs])
+            return self._receiver_terms(locations).T.toarray()
+
         if self._formulation == "EB":
             n = self.mesh.nN
 
@@ -228,8 +630,46 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
             toDelete = toDelete + ["gtgdiag"]
         return toDelete
 
+    @property
+    def _mini_survey_matrix(self):
+        """
+        Sparse matrix combining the data of the miniaturized survey into the
+        data of the survey. The currents and geometric factors of a reciprocal
+        survey are applied again once they change.
+        """
+        if self._combination is not None:
+            version = receivers._data_scale_version
+            cached = getattr(self, "_weighted_combination", None)
+            if cached is None or cached[0] != version:
+                self._weighted_combination = (
+                    version,
+                    _reciprocal_combination(self.survey, self._combination),
+                )
+            return self._weighted_combination[1]
+
+        dipole_rx, dipole_tx = self._dipoles
+        rows = np.arange(len(self._invs[0]))
+        terms = [
+            (rows, self._invs[0], 1.0),  # AM
+            (rows[dipole_rx], self._invs[1], -1.0),  # AN
+            (rows[dipole_tx], self._invs[2], -1.0),  # BM
+            (rows[dipole_rx & dipole_tx], self._invs[3], 1.0),  # BN
+        ]
+        return sp.csr_matrix(
+            (
+                np.hstack([np.full(len(row), sign) for row, _, sign in terms]),
+                (
+                    np.hstack([row for row, _, _ in terms]),
+                    np.hstack([column for _, column, _ in terms]),
+                ),
+            ),
+            shape=(len(rows), self._mini_survey.nD),
+        )
+
     def _mini_survey_data(self, d_mini):
-        if self._mini_survey is not None:
+        if self._combination is not None:
+            out = self._mini_survey_matrix @ d_mini
+        elif self._mini_survey is not None:
             out = d_mini[self._invs[0]]  # AM
             out[self._dipoles[0]] -= d_mini[self._invs[1]]  # AN
             out[self._dipoles[1]] -= d_mini[self._invs[2]]  # BM
@@ -239,7 +679,9 @@ class BaseDCSimulation(BaseElectricalPDESimulation):
         return out
 
     def _mini_survey_dataT(self, v):
-        if self._mini_survey is not None:
+        if self._combination is not None:
+            out = self._mini_survey_matrix.T @ v
+        elif self._mini_survey is not None:
             out = np.zeros(self._mini_survey.nD)
             # Need to use ufunc.at because there could be repeated indices
             # That need to be properly handled.
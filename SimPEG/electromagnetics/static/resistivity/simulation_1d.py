@@ -1,9 +1,11 @@
 import numpy as np
 import properties
+import warnings
 
-from ....utils import mkvc
+from ....utils import mkvc, Zero
 from ....simulation import BaseSimulation
 from .... import props
+from ...base_1d_stitched import BaseStitched1DSimulation
 
 from .survey import Survey
 
@@ -70,46 +72,130 @@ class Simulation1DLayers(BaseSimulation):
         if self.verbose:
             print(">> Compute fields")
 
-        # TODO: this for loop can slow down the speed, cythonize below for loop
-        T1 = self.rho[self.n_layer - 1] * np.ones_like(self.lambd)
-        for ii in range(self.n_layer - 1, 0, -1):
-            rho0 = self.rho[ii - 1]
-            t0 = self.thicknesses[ii - 1]
-            T0 = (T1 + rho0 * np.tanh(self.lambd * t0)) / (
-                1.0 + (T1 * np.tanh(self.lambd * t0) / rho0)
+        return self._kernel_data(self._kernel()[0])
+
+    def _kernel(self, deriv=False, rho=None, lambd=None):
+        """
+        Kernel of the layered earth at the points of the filter, from the
+        recursion of the bottom layer up to the surface, vectorized over all
+        the points.
+
+        :param bool deriv: also return the derivatives of the surface kernel
+        :param numpy.ndarray rho: resistivities of the layers, of shape
+            (n_layer, ...) with further dimensions holding soundings sharing
+            the thicknesses, defaults to the resistivities of the model
+        :param numpy.ndarray lambd: points of the kernel, defaults to the
+            points of the filter at the offsets
+        :rtype: tuple
+        :returns: (T, dT_drho, dT_dt) with T the surface kernel, dT_drho and
+            dT_dt arrays of shape (n_layer, ...) and (n_layer - 1, ...) of its
+            derivatives with respect to the resistivities and thicknesses of
+            the layers, or None if deriv is False
+        """
+        if lambd is None:
+            lambd = self.lambd.real
+        if rho is None:
+            rho = self.rho
+        rho = rho.reshape(rho.shape + (1,) * lambd.ndim)
+        tanh = np.tanh(lambd * self.thicknesses.reshape((-1,) + (1,) * (rho.ndim - 1)))
+
+        # Kernels at the top of every layer
+        T = np.empty((self.n_layer,) + np.broadcast(rho[0], lambd).shape)
+        T[-1] = rho[-1]
+        for ii in range(self.n_layer - 2, -1, -1):
+            T[ii] = (T[ii + 1] + rho[ii] * tanh[ii]) / (
+                1.0 + (T[ii + 1] * tanh[ii] / rho[ii])
             )
-            T1 = T0
-        PJ = (T0, None, None)
+
+        if not deriv:
+            return T[0], None, None
+
+        # Derivatives of the kernel of every layer with respect to the kernel
+        # below it, its resistivity and the tanh of its thickness
+        below = T[1:]
+        D = 1.0 + below * tanh / rho[:-1]
+        dT_dbelow = (1.0 - tanh ** 2) / D ** 2
+        dT_drho = tanh * (D + T[:-1] * D * below / rho[:-1] ** 2) / D ** 2
+        dT_dtanh = (rho[:-1] - below ** 2 / rho[:-1]) / D ** 2
+
+        # Adjoint sweep: derivative of the surface kernel with respect to the
+        # kernel of every layer
+        adjoint = np.empty_like(T)
+        adjoint[0] = 1.0
+        for ii in range(self.n_layer - 1):
+            adjoint[ii + 1] = adjoint[ii] * dT_dbelow[ii]
+
+        dT0_drho = np.empty_like(T)
+        dT0_drho[:-1] = adjoint[:-1] * dT_drho
+        dT0_drho[-1] = adjoint[-1]
+        dT0_dt = adjoint[:-1] * dT_dtanh * lambd * (1.0 - tanh ** 2)
+
+        return T[0], dT0_drho, dT0_dt
+
+    def _hankel(self, PJ, lambd, offset):
+        """
+        Hankel transform of the kernels PJ at the points lambd of the filter.
+        """
+        PJ = (PJ, None, None)
         try:
-            voltage = (
-                dlf(
-                    PJ,
-                    self.lambd,
-                    self.offset,
-                    self.fhtfilt,
-                    self.hankel_pts_per_dec,
-                    factAng=None,
-                    ab=33,
-                ).real
-                / (2 * np.pi)
-            )
+            return dlf(
+                PJ,
+                lambd,
+                offset,
+                self.fhtfilt,
+                self.hankel_pts_per_dec,
+                factAng=None,
+                ab=33,
+            ).real / (2 * np.pi)
         except TypeError:
-            voltage = (
-                dlf(
-                    PJ,
-                    self.lambd,
-                    self.offset,
-                    self.fhtfilt,
-                    self.hankel_pts_per_dec,
-                    ang_fact=None,
-                    ab=33,
-                ).real
-                / (2 * np.pi)
+            return dlf(
+                PJ,
+                lambd,
+                offset,
+                self.fhtfilt,
+                self.hankel_pts_per_dec,
+                ang_fact=None,
+                ab=33,
+            ).real / (2 * np.pi)
+
+    def _kernel_data(self, kernel):
+        """
+        Data of a kernel at the points of the filter, through its Hankel
+        transform. The data are linear in the kernel.
+
+        :param numpy.ndarray kernel: array of shape (..., n_offset, n_filter),
+            leading dimensions holding independent kernels
+        :rtype: numpy.ndarray
+        :returns: data of shape (..., nD) of every kernel
+        """
+        shape = kernel.shape[:-2]
+        kernel = kernel.reshape((-1,) + self.lambd.shape)
+        n_kernel = kernel.shape[0]
+
+        if n_kernel == 1:
+            voltage = self._hankel(kernel[0], self.lambd, self.offset)
+        elif self.hankel_pts_per_dec == 0:
+            # The standard filter transforms every offset separately, so all
+            # kernels are transformed at once as rows of stacked offsets
+            voltage = self._hankel(
+                kernel.reshape((-1, self.n_filter)),
+                np.tile(self.lambd, (n_kernel, 1)),
+                np.tile(self.offset, n_kernel),
+            )
+        else:
+            voltage = np.hstack(
+                [self._hankel(values, self.lambd, self.offset) for values in kernel]
             )
 
+        return self._voltage_data(voltage.reshape(shape + (-1,)))
+
+    def _voltage_data(self, voltage):
+        """
+        Data of the voltages of shape (..., n_offset) at the offsets
+        """
         # Assume dipole-dipole
-        V = voltage.reshape((self.survey.nD, 4), order="F")
-        data = V[:, 0] + V[:, 1] - (V[:, 2] + V[:, 3])
+        V = voltage.reshape(voltage.shape[:-1] + (4, -1))
+        data = V[..., 0, :] + V[..., 1, :] - (V[..., 2, :] + V[..., 3, :])
 
         if self.data_type == "apparent_resistivity":
             data /= self.geometric_factor
@@ -134,10 +220,18 @@ class Simulation1DLayers(BaseSimulation):
 
         return f
 
-    def getJ(self, m, f=None, factor=1e-2):
+    def getJ(self, m, f=None, factor=None):
         """
-        Generate Full sensitivity matrix using central difference
+        Generate Full sensitivity matrix
+
+        The derivatives of the kernel recursion, from one adjoint sweep over
+        the layers, are transformed to the data by the digital linear filter.
         """
+        if factor is not None:
+            warnings.warn(
+                "factor is no longer used, the sensitivity is computed analytically",
+                FutureWarning,
+            )
         if self._Jmatrix is not None:
             return self._Jmatrix
         else:
@@ -145,19 +239,14 @@ class Simulation1DLayers(BaseSimulation):
                 print("Calculating J and storing")
             self.model = m
 
-            # TODO: this makes code quite slow derive analytic sensitivity
-            N = self.survey.nD
-            M = self.model.size
-            Jmatrix = np.zeros((N, M), dtype=float, order="F")
-            for ii in range(M):
-                m0 = m.copy()
-                dm = m[ii] * factor
-                m0[ii] = m[ii] - dm * 0.5
-                m1 = m.copy()
-                m1[ii] = m[ii] + dm * 0.5
-                d0 = self.fields(m0)
-                d1 = self.fields(m1)
-                Jmatrix[:, ii] = (d1 - d0) / (dm)
+            _, dT_drho, dT_dt = self._kernel(deriv=True)
+
+            Jmatrix = np.zeros((self.survey.nD, self.model.size), order="F")
+            for deriv, dT in [(self.rhoDeriv, dT_drho), (self.thicknessesDeriv, dT_dt)]:
+                if isinstance(deriv, Zero) or len(dT) == 0:
+                    continue
+                J = self._kernel_data(dT).T
+                Jmatrix += (deriv.T @ J.T).T
             self._Jmatrix = Jmatrix
         return self._Jmatrix
 
@@ -268,3 +357,79 @@ class Simulation1DLayers(BaseSimulation):
                 2 * np.pi
             )
         return self._geometric_factor
+
+
+class Simulation1DLayersStitched(BaseStitched1DSimulation, Simulation1DLayers):
+    """
+    Stitched 1D DC simulation of many soundings over layered earths.
+
+    The survey holds the sources of every sounding in turn, all the soundings
+    sharing the electrode separations of the first one, and the layer
+    thicknesses. The resistivities (or conductivities) of the layers of every
+    sounding, top layer first, are ordered as an (n_sounding, n_layer) array.
+
+    The kernels of a chunk of soundings are evaluated in one recursion over
+    the layers, at the unique points of the standard digital linear filter,
+    and transformed to the data by a single product with the matrix of the
+    filter weights.
+    """
+
+    _property_name = "rho"
+
+    @property
+    def electrode_separations(self):
+        """
+        Electrode separations of a sounding
+        """
+        if getattr(self, "_electrode_separations", None) is None:
+            separations = {}
+            for key, values in static_utils.electrode_separations(self.survey).items():
+                values = np.reshape(values, (self.n_sounding, -1))
+                if not np.allclose(values, values[0], equal_nan=True):
+                    raise ValueError(
+                        "All soundings must share the electrode separations of "
+                        "the first sounding"
+                    )
+                separations[key] = values[0]
+            self._electrode_separations = separations
+        return self._electrode_separations
+
+    @property
+    def _filter_matrix(self):
+        """
+        Unique points of the filter at the offsets, and the matrix of shape
+        (n_sounding_data, n_points) transforming kernels at these points to
+        the data of a sounding.
+        """
+        if getattr(self, "_filter", None) is None:
+            lambd, inverse = np.unique(self.lambd.real, return_inverse=True)
+
+            # Weights of the filter at every offset, from the transform of unit
+            # kernels
+            n_offset = len(self.offset)
+            weights = self._hankel(
+                np.tile(np.eye(self.n_filter), (n_offset, 1)),
+                np.repeat(self.lambd, self.n_filter, axis=0),
+                np.repeat(self.offset, self.n_filter),
+            )
+
+            H = np.zeros((n_offset, len(lambd)))
+            np.add.at(
+                H, (np.repeat(np.arange(n_offset), self.n_filter), inverse), weights
+            )
+            self._filter = (lambd, self._voltage_data(H.T).T)
+        return self._filter
+
+    @property
+    def _sounding_bytes(self):
+        # Kernels of the layers, their derivatives and the adjoint sweep
+        return 8 * 8 * self.n_layer * len(self._filter_matrix[0])
+
+    def _evaluate_soundings(self, soundings, deriv=False):
+        rho = self.rho.reshape((-1, self.n_layer))[soundings].T
+        lambd, H = self._filter_matrix
+        T, dT_drho, _ = self._kernel(deriv=deriv, rho=rho, lambd=lambd)
+        if not deriv:
+            return (T @ H.T,)
+
+        return T @ H.T, np.moveaxis(dT_drho @ H.T, 0, -1)
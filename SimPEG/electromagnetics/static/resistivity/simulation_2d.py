@@ -1,21 +1,37 @@
+import inspect
+import threading
 import numpy as np
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
 from scipy.optimize import minimize
 import warnings
 import properties
 
 
 from ....utils import mkvc, sdiag, Zero
+from ....utils.parallel_utils import fork_available, worker_executor
 from ....base import BaseElectricalPDESimulation
 from ....data import Data
 
 from .survey import Survey
 from .fields_2d import Fields2D, Fields2DCellCentered, Fields2DNodal
 from .fields import FieldsDC, Fields3DCellCentered, Fields3DNodal
-from .utils import _mini_pole_pole
+from . import receivers
+from .utils import _mini_pole_pole, _survey_projection
 from scipy.special import k0e, k1e, k0
 from discretize.utils import make_boundary_bool
 
 
+def _refactors(Ainv):
+    """
+    Whether a solver refactors a new matrix of the same sparsity pattern in
+    place, with a ``factor(A)`` method such as the one of Pardiso.
+    """
+    factor = getattr(Ainv, "factor", None)
+    return callable(factor) and "A" in inspect.signature(factor).parameters
+
+
 class BaseDCSimulation2D(BaseElectricalPDESimulation):
     """
     Base 2.5D DC problem
@@ -29,12 +45,36 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
         "Number of kys to use in wavenumber space", required=False, default=11
     )
 
+    n_workers = properties.Integer(
+        "Number of wavenumbers factored and solved concurrently",
+        default=1,
+        min=1,
+    )
+
+    executor = properties.StringChoice(
+        "Workers solving the wavenumbers. 'threads' keep the factorizations for "
+        "Jvec and Jtvec and suit solvers releasing the GIL (Pardiso, Mumps). "
+        "'processes' are forked, and refactor the system of every wavenumber "
+        "for Jvec and Jtvec, for solvers holding the GIL.",
+        choices=["threads", "processes"],
+        default="threads",
+    )
+
+    max_factors = properties.Integer(
+        "Maximum number of wavenumber factorizations held in memory, all nky if "
+        "None. Wavenumbers without a factorization are refactored when solved "
+        "again by Jvec or Jtvec, using the least recently used factorization.",
+        required=False,
+        min=1,
+    )
+
     fieldsPair = Fields2D  # SimPEG.EM.Static.Fields_2D
     fieldsPair_fwd = FieldsDC
     # there's actually nT+1 fields, so we don't need to store the last one
     _Jmatrix = None
     fix_Jmatrix = False
     _mini_survey = None
+    _systems = None
 
     def __init__(self, *args, **kwargs):
         miniaturize = kwargs.pop("miniaturize", False)
@@ -108,6 +148,10 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
         self._quad_points = points
 
         self.Ainv = [None for i in range(self.nky)]
+        self._factor_lock = threading.Lock()
+        self._factor_used = {}
+        self._factor_in_use = set()
+        self._factor_count = 0
         self.nT = self.nky - 1  # Only for using TimeFields
 
         # Do stuff to simplify the forward and JTvec operation if number of dipole
@@ -120,22 +164,156 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
             print(">> Compute fields")
         if m is not None:
             self.model = m
-        if self.Ainv[0] is not None:
-            for i in range(self.nky):
-                self.Ainv[i].clean()
+        if self._use_processes:
+            # Factorizations of the forked workers are not returned
+            self._clean_factors()
         f = self.fieldsPair(self)
-        kys = self._quad_points
         f._quad_weights = self._quad_weights
-        for iky, ky in enumerate(kys):
-            A = self.getA(ky)
-            if self.Ainv[iky] is not None:
-                self.Ainv[iky].clean()
-            self.Ainv[iky] = self.solver(A, **self.solver_opts)
-            RHS = self.getRHS(ky)
-            u = self.Ainv[iky] * RHS
+
+        # Assembling shares the model matrices of all wavenumbers, so is kept
+        # serial, while the factorizations and solves run concurrently
+        A = [self.getA(ky) for ky in self._quad_points]
+        for iky, u in enumerate(self._map_ky("_fields_ky", A)):
             f[:, self._solutionType, iky] = u
         return f
 
+    def _fields_ky(self, iky, A):
+        """
+        Factor the system of a wavenumber and solve for its fields.
+        """
+        Ainv = self._factor_ky(iky, A[iky])
+        return Ainv * self.getRHS(self._quad_points[iky])
+
+    @property
+    def _use_processes(self):
+        return (
+            self.n_workers > 1
+            and self.nky > 1
+            and self.executor == "processes"
+            and fork_available()
+        )
+
+    def _map_ky(self, name, *args):
+        """
+        Results of the method ``name`` evaluated for every wavenumber, as
+        ``getattr(self, name)(iky, *args)``, by ``n_workers`` threads or forked
+        processes.
+
+        The results are yielded in the order of the wavenumbers, whatever the
+        order the workers complete them, so that their quadrature weighted sum
+        does not depend on the number of workers. At most ``n_workers``
+        results are pending at a time.
+        """
+        function = partial(self._call_ky, name)
+        if self.n_workers == 1 or self.nky == 1:
+            for iky in range(self.nky):
+                yield function(iky, *args)
+            return
+
+        # The arguments are bound rather than pickled for the forked workers
+        executor, task = worker_executor(
+            lambda iky: function(iky, *args),
+            self.n_workers,
+            processes=self.executor == "processes",
+        )
+        with executor:
+            pending = deque()
+            for iky in range(self.nky):
+                pending.append(executor.submit(task, iky))
+                if len(pending) == self.n_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _call_ky(self, name, iky, *args):
+        """
+        Evaluate the method ``name`` for a wavenumber, then release the
+        factorization it used.
+        """
+        try:
+            return getattr(self, name)(iky, *args)
+        finally:
+            with self._factor_lock:
+                self._factor_in_use.discard(iky)
+
+    def _factor_ky(self, iky, A=None):
+        """
+        Factorization of the system of a wavenumber, held until the method of
+        :meth:`_call_ky` using it returns.
+
+        The factorization held for the wavenumber is returned if ``A`` is not
+        given. Otherwise, the solver of the wavenumber, or the least recently
+        used solver not in use once ``max_factors`` are held, is refactored.
+        Solvers beyond ``max_factors`` are cleaned.
+        Solvers with a ``factor(A)`` method (Pardiso) then only redo their
+        numeric phase, reusing the ordering and symbolic analysis shared by all
+        the wavenumbers and models of the mesh.
+        """
+        with self._factor_lock:
+            Ainv = self.Ainv[iky]
+            self._factor_in_use.add(iky)
+            self._factor_count += 1
+            self._factor_used[iky] = self._factor_count
+            if Ainv is not None and A is None:
+                return Ainv
+
+            # Evict the least recently used solvers not in use
+            n_factors = max(self.max_factors or self.nky, self.n_workers)
+            held = {
+                i for i in range(self.nky) if self.Ainv[i] is not None
+            } | self._factor_in_use
+            evicted = []
+            while len(held) > n_factors:
+                oldest = min(held - self._factor_in_use, key=self._factor_used.get)
+                held.remove(oldest)
+                evicted.append(self.Ainv[oldest])
+                self.Ainv[oldest] = None
+
+        if Ainv is None and evicted:
+            Ainv = evicted.pop(0)
+        for solver in evicted:
+            solver.clean()
+
+        if A is None:
+            if self._systems is not None:
+                A = self._systems[iky]
+            else:
+                A = self.getA(self._quad_points[iky])
+        if Ainv is not None and _refactors(Ainv):
+            Ainv.factor(A)
+        else:
+            if Ainv is not None:
+                Ainv.clean()
+            Ainv = self.solver(A, **self.solver_opts)
+        self.Ainv[iky] = Ainv
+
+        return Ainv
+
+    @contextmanager
+    def _assembled_systems(self):
+        """
+        Context in which the wavenumbers refactored by the workers of Jvec and
+        Jtvec use systems assembled serially beforehand, as in :meth:`fields`,
+        since assembling shares the model matrices of all wavenumbers. Nothing
+        is assembled while the factorizations of all wavenumbers are held.
+        """
+        n_factors = max(self.max_factors or self.nky, self.n_workers)
+        if n_factors < self.nky or any(Ainv is None for Ainv in self.Ainv):
+            self._systems = [self.getA(ky) for ky in self._quad_points]
+        try:
+            yield
+        finally:
+            self._systems = None
+
+    def _clean_factors(self):
+        """
+        Clean the factorizations of all wavenumbers.
+        """
+        for iky, Ainv in enumerate(self.Ainv):
+            if Ainv is not None:
+                Ainv.clean()
+            self.Ainv[iky] = None
+
     def fields_to_space(self, f, y=0.0):
         f_fwd = self.fieldsPair_fwd(self)
         phi = f[:, self._solutionType, :].dot(self._quad_weights)
@@ -160,6 +338,11 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
         else:
             survey = self.survey
 
+        P = self._projection(survey, f)
+        if P is not None:
+            phi = f[:, self._solutionType, :].dot(weights)
+            return self._mini_survey_data(P @ mkvc(phi))
+
         temp = np.empty(survey.nD)
         count = 0
         for src in survey.source_list:
@@ -170,6 +353,22 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
 
         return self._mini_survey_data(temp)
 
+    def _projection(self, survey, f):
+        """
+        Projection of the potentials of all the sources of the survey to its
+        data, assembled once for every survey, and again once the data types
+        or geometric factors of the receivers change. None if receivers
+        project other fields than the potentials.
+        """
+        if getattr(self, "_projections", None) is None:
+            self._projections = {}
+        version = receivers._data_scale_version
+        cached = self._projections.get(id(survey))
+        if cached is None or cached[1] != version:
+            P = _survey_projection(survey, self.mesh, f)
+            self._projections[id(survey)] = (survey, version, P)
+        return self._projections[id(survey)][2]
+
     def getJ(self, m, f=None):
         """
         Generate Full sensitivity matrix
@@ -204,31 +403,51 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
         else:
             survey = self.survey
 
-        kys = self._quad_points
-        weights = self._quad_weights
+        # Assembled before the workers are forked, to be shared by them
+        P = self._projection(survey, f)
+
+        Jv = np.zeros(survey.nD)
+        with self._assembled_systems():
+            for Jv_ky in self._map_ky("_Jvec_ky", v, f, survey, P):
+                Jv += Jv_ky
+
+        return self._mini_survey_data(Jv)
+
+    def _Jvec_ky(self, iky, v, f, survey, P):
+        """
+        Quadrature weighted contribution of a wavenumber to J v, through the
+        projection P of :meth:`_projection` if it is not None.
+        """
+        ky = self._quad_points[iky]
+        Ainv = self._factor_ky(iky)
 
         Jv = np.zeros(survey.nD)
         # Assume y=0.
         # This needs some thoughts to implement in general when src is dipole
+        u_ky = f[:, self._solutionType, iky]
 
-        # TODO: this loop is pretty slow .. (Parellize)
-        for iky, ky in enumerate(kys):
-            u_ky = f[:, self._solutionType, iky]
-            count = 0
-            for i_src, src in enumerate(survey.source_list):
-                u_src = u_ky[:, i_src]
-                dA_dm_v = self.getADeriv(ky, u_src, v, adjoint=False)
-                # dRHS_dm_v = self.getRHSDeriv(ky, src, v) = 0
-                du_dm_v = self.Ainv[iky] * (-dA_dm_v)  # + dRHS_dm_v)
-                for rx in src.receiver_list:
-                    df_dmFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
-                    df_dm_v = df_dmFun(iky, src, du_dm_v, v, adjoint=False)
-                    Jv1_temp = rx.evalDeriv(src, self.mesh, f, df_dm_v)
-                    # Trapezoidal intergration
-                    Jv[count : count + len(Jv1_temp)] += weights[iky] * Jv1_temp
-                    count += len(Jv1_temp)
+        if P is not None:
+            # Solve the derivatives of the potentials of all sources at once
+            RHS = np.empty_like(u_ky)
+            for i_src in range(len(survey.source_list)):
+                RHS[:, i_src] = -self.getADeriv(ky, u_ky[:, i_src], v, adjoint=False)
+            return self._quad_weights[iky] * (P @ mkvc(Ainv * RHS))
 
-        return self._mini_survey_data(Jv)
+        count = 0
+        for i_src, src in enumerate(survey.source_list):
+            u_src = u_ky[:, i_src]
+            dA_dm_v = self.getADeriv(ky, u_src, v, adjoint=False)
+            # dRHS_dm_v = self.getRHSDeriv(ky, src, v) = 0
+            du_dm_v = Ainv * (-dA_dm_v)  # + dRHS_dm_v)
+            for rx in src.receiver_list:
+                df_dmFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
+                df_dm_v = df_dmFun(iky, src, du_dm_v, v, adjoint=False)
+                Jv1_temp = rx.evalDeriv(src, self.mesh, f, df_dm_v)
+                # Trapezoidal intergration
+                Jv[count : count + len(Jv1_temp)] = self._quad_weights[iky] * Jv1_temp
+                count += len(Jv1_temp)
+
+        return Jv
 
     def Jtvec(self, m, v, f=None):
         """
@@ -251,69 +470,131 @@ class BaseDCSimulation2D(BaseElectricalPDESimulation):
         Compute adjoint sensitivity matrix (J^T) and vector (v) product.
         Full J matrix can be computed by inputing v=None
         """
-        kys = self._quad_points
-        weights = self._quad_weights
         if self._mini_survey is not None:
             survey = self._mini_survey
         else:
             survey = self.survey
 
+        # Assembled before the workers are forked, to be shared by them
+        P = self._projection(survey, f)
+
         if v is not None:
             # Ensure v is a data object.
             if isinstance(v, Data):
                 v = v.dobs
             v = self._mini_survey_dataT(v)
             Jtv = np.zeros(m.size, dtype=float)
-
-            for iky, ky in enumerate(kys):
-                u_ky = f[:, self._solutionType, iky]
-                count = 0
-                for i_src, src in enumerate(survey.source_list):
-                    u_src = u_ky[:, i_src]
-                    df_duT_sum = 0
-                    df_dmT_sum = 0
-                    for rx in src.receiver_list:
-                        my_v = v[count : count + rx.nD]
-                        count += rx.nD
-                        # wrt f, need possibility wrt m
-                        PTv = rx.evalDeriv(src, self.mesh, f, my_v, adjoint=True)
-                        df_duTFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
-                        df_duT, df_dmT = df_duTFun(iky, src, None, PTv, adjoint=True)
-                        df_duT_sum += df_duT
-                        df_dmT_sum += df_dmT
-
-                    ATinvdf_duT = self.Ainv[iky] * df_duT_sum
-
-                    dA_dmT = self.getADeriv(ky, u_src, ATinvdf_duT, adjoint=True)
-                    # dRHS_dmT = self.getRHSDeriv(ky, src, ATinvdf_duT,
-                    #                            adjoint=True)
-                    du_dmT = -dA_dmT  # + dRHS_dmT=0
-                    Jtv += weights[iky] * (df_dmT + du_dmT).astype(float)
+            with self._assembled_systems():
+                for Jtv_ky in self._map_ky("_Jtvec_ky", v, f, survey, P):
+                    Jtv += Jtv_ky
             return mkvc(Jtv)
 
         else:
             # This is for forming full sensitivity matrix
             Jt = np.zeros((self.model.size, survey.nD), order="F")
-            for iky, ky in enumerate(kys):
-                u_ky = f[:, self._solutionType, iky]
-                istrt = 0
-                for i_src, src in enumerate(survey.source_list):
-                    u_src = u_ky[:, i_src]
-                    for rx in src.receiver_list:
-                        # wrt f, need possibility wrt m
-                        PT = rx.evalDeriv(src, self.mesh, f).toarray().T
-                        ATinvdf_duT = self.Ainv[iky] * PT
-
-                        dA_dmT = self.getADeriv(ky, u_src, ATinvdf_duT, adjoint=True)
-                        Jtv = -weights[iky] * dA_dmT  # RHS=0
-                        iend = istrt + rx.nD
-                        if rx.nD == 1:
-                            Jt[:, istrt] += Jtv
-                        else:
-                            Jt[:, istrt:iend] += Jtv
-                        istrt += rx.nD
+            with self._assembled_systems():
+                for Jt_ky in self._map_ky("_Jtvec_ky", None, f, survey, P):
+                    Jt += Jt_ky
             return (self._mini_survey_data(Jt.T)).T
 
+    def _Jtvec_ky(self, iky, v, f, survey, P):
+        """
+        Quadrature weighted contribution of a wavenumber to J^T v, or to the
+        full J^T if v is None, through the projection P of :meth:`_projection`
+        if it is not None.
+        """
+        ky = self._quad_points[iky]
+        weight = self._quad_weights[iky]
+        Ainv = self._factor_ky(iky)
+        u_ky = f[:, self._solutionType, iky]
+
+        if P is not None:
+            return self._Jtvec_ky_projected(iky, v, u_ky, P, survey)
+
+        if v is not None:
+            Jtv = np.zeros(self.model.size, dtype=float)
+            count = 0
+            for i_src, src in enumerate(survey.source_list):
+                u_src = u_ky[:, i_src]
+                df_duT_sum = 0
+                df_dmT_sum = 0
+                for rx in src.receiver_list:
+                    my_v = v[count : count + rx.nD]
+                    count += rx.nD
+                    # wrt f, need possibility wrt m
+                    PTv = rx.evalDeriv(src, self.mesh, f, my_v, adjoint=True)
+                    df_duTFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
+                    df_duT, df_dmT = df_duTFun(iky, src, None, PTv, adjoint=True)
+                    df_duT_sum += df_duT
+                    df_dmT_sum += df_dmT
+
+                ATinvdf_duT = Ainv * df_duT_sum
+
+                dA_dmT = self.getADeriv(ky, u_src, ATinvdf_duT, adjoint=True)
+                # dRHS_dmT = self.getRHSDeriv(ky, src, ATinvdf_duT,
+                #                            adjoint=True)
+                du_dmT = -dA_dmT  # + dRHS_dmT=0
+                Jtv += weight * (df_dmT + du_dmT).astype(float)
+
+        else:
+            Jtv = np.zeros((self.model.size, survey.nD), order="F")
+            istrt = 0
+            for i_src, src in enumerate(survey.source_list):
+                u_src = u_ky[:, i_src]
+                for rx in src.receiver_list:
+                    # wrt f, need possibility wrt m
+                    PT = rx.evalDeriv(src, self.mesh, f).toarray().T
+                    ATinvdf_duT = Ainv * PT
+
+                    dA_dmT = self.getADeriv(ky, u_src, ATinvdf_duT, adjoint=True)
+                    iend = istrt + rx.nD
+                    if rx.nD == 1:
+                        Jtv[:, istrt] = -weight * dA_dmT  # RHS=0
+                    else:
+                        Jtv[:, istrt:iend] = -weight * dA_dmT
+                    istrt += rx.nD
+
+        return Jtv
+
+    def _Jtvec_ky_projected(self, iky, v, u_ky, P, survey):
+        """
+        Contribution of a wavenumber to J^T v, or to the full J^T if v is None,
+        through the projection of the potentials of the survey. The adjoint
+        problems of all the sources, or of all the receivers of a source, are
+        solved at once.
+        """
+        ky = self._quad_points[iky]
+        weight = self._quad_weights[iky]
+        Ainv = self._factor_ky(iky)
+        n_src = len(survey.source_list)
+        n = u_ky.shape[0]
+
+        if v is not None:
+            Jtv = np.zeros(self.model.size, dtype=float)
+            ATinvdf_duT = Ainv * (P.T @ v).reshape((n, n_src), order="F")
+            ATinvdf_duT = ATinvdf_duT.reshape((n, n_src))
+            for i_src in range(n_src):
+                dA_dmT = self.getADeriv(
+                    ky, u_ky[:, i_src], ATinvdf_duT[:, i_src], adjoint=True
+                )
+                Jtv -= weight * dA_dmT.astype(float)  # RHS=0
+            return Jtv
+
+        Jtv = np.zeros((self.model.size, survey.nD), order="F")
+        offsets = np.r_[0, np.cumsum([src.nD for src in survey.source_list])]
+        for i_src in range(n_src):
+            if offsets[i_src] == offsets[i_src + 1]:
+                continue
+            P_src = P[offsets[i_src] : offsets[i_src + 1], i_src * n : (i_src + 1) * n]
+            ATinvdf_duT = Ainv * P_src.T.toarray()
+
+            dA_dmT = self.getADeriv(ky, u_ky[:, i_src], ATinvdf_duT, adjoint=True)
+            Jtv[:, offsets[i_src] : offsets[i_src + 1]] = -weight * np.reshape(
+                dA_dmT, (self.model.size, -1)
+            )  # RHS=0
+
+        return Jtv
+
     def getSourceTerm(self, ky):
         """
         takes concept of source and turns it into a matrix
@@ -3,6 +3,7 @@ import properties
 
 from .... import survey
 from ....utils import Zero
+from . import receivers
 
 
 class BaseSrc(survey.BaseSrc):
@@ -44,6 +45,7 @@ class BaseSrc(survey.BaseSrc):
                 f" saw {len(other)} current sources and {self.location.shape[0]} locations."
             )
         self._current = other
+        receivers._data_scale_changed()
 
     def eval(self, sim):
         if self._q is not None:
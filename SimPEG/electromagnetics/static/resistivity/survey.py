@@ -148,6 +148,7 @@ class Survey(BaseSurvey):
                     rx.data_type = data_type
                 if rx.data_type == "apparent_resistivity":
                     rx._geometric_factor[source] = geometric_factor[source, rx]
+        Rx._data_scale_changed()
         return geometric_factor
 
     def _set_abmn_locations(self):
@@ -0,0 +1,310 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import properties
+from scipy.spatial import cKDTree
+from discretize import TreeMesh
+
+from ....data import Data
+from ....data_misfit import L2DataMisfit
+from ....objective_function import ComboObjectiveFunction
+from ....utils import Zero
+from .... import maps
+from . import sources
+from .simulation import Simulation3DNodal
+from .survey import Survey
+
+
+class TiledDataMisfit(ComboObjectiveFunction):
+    """
+    Sum of the data misfits of the tiles of a survey, evaluated concurrently.
+
+    A :class:`SimPEG.objective_function.ComboObjectiveFunction` of the data
+    misfits of the tiles, whose fields, misfits and derivatives are evaluated
+    by ``n_workers`` threads. Every tile keeps the factorization and
+    sensitivities of its own simulation, and the solvers releasing the GIL
+    (Pardiso, Mumps) factor and solve the tiles in parallel. The sum over the
+    tiles is ordered as the tiles, whatever the number of workers.
+
+    :param list objfcts: data misfits of the tiles
+    :param list data_indices: indices of the data of every tile in the
+        global data
+    """
+
+    n_workers = properties.Integer(
+        "Number of tiles evaluated concurrently", default=1, min=1
+    )
+
+    def __init__(self, objfcts=[], multipliers=None, data_indices=None, **kwargs):
+        super(TiledDataMisfit, self).__init__(
+            objfcts=objfcts, multipliers=multipliers, **kwargs
+        )
+        self.data_indices = data_indices
+
+    def _map(self, function, tiles):
+        """
+        Results of ``function`` for the tiles, in the order of the tiles.
+        """
+        if self.n_workers == 1 or len(tiles) < 2:
+            return [function(i) for i in tiles]
+
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            return list(executor.map(function, tiles))
+
+    def _sum(self, name, m, *args, f=None):
+        """
+        Sum of the method ``name`` of the misfits, weighted by the multipliers.
+        """
+
+        def evaluate(i):
+            multiplier, objfct = self[i]
+            if f is not None:
+                value = getattr(objfct, name)(m, *args, f=f[i])
+            else:
+                value = getattr(objfct, name)(m, *args)
+            return multiplier * value
+
+        tiles = [
+            i for i, multiplier in enumerate(self.multipliers) if multiplier != 0.0
+        ]
+        total = Zero()
+        for value in self._map(evaluate, tiles):
+            if not isinstance(value, Zero):
+                total = total + value
+        return total
+
+    def fields(self, m):
+        """
+        Fields of the simulations of the tiles.
+
+        :param numpy.ndarray m: global model
+        :rtype: list
+        :return: fields of every tile
+        """
+        return self._map(
+            lambda i: self.objfcts[i].simulation.fields(m), range(len(self.objfcts))
+        )
+
+    def dpred(self, m, f=None):
+        """
+        Predicted global data, assembled from the tiles.
+
+        :param numpy.ndarray m: global model
+        :param list f: fields of the tiles
+        :rtype: numpy.ndarray
+        :return: data (nD,)
+        """
+        if f is None:
+            f = self.fields(m)
+
+        def predict(i):
+            return self.objfcts[i].simulation.dpred(m, f=f[i])
+
+        values = self._map(predict, range(len(self.objfcts)))
+        d = np.empty(sum(len(indices) for indices in self.data_indices))
+        for indices, value in zip(self.data_indices, values):
+            d[indices] = value
+        return d
+
+    def __call__(self, m, f=None):
+        return 0.0 + self._sum("__call__", m, f=f)
+
+    def deriv(self, m, f=None):
+        return self._sum("deriv", m, f=f)
+
+    def deriv2(self, m, v=None, f=None):
+        return self._sum("deriv2", m, v, f=f)
+
+
+def tile_sources(survey, n_tiles):
+    """
+    Group the sources of a survey into tiles of neighbouring sources.
+
+    The sources are split by recursive bisection of the centers of their
+    electrodes, along the widest extent of every group, so that the tiles
+    hold similar numbers of data.
+
+    :param SimPEG.electromagnetics.static.resistivity.survey.Survey survey: DC
+        survey
+    :param int n_tiles: number of tiles
+    :rtype: list
+    :return: sorted indices of the sources of every tile
+    """
+    n_source = len(survey.source_list)
+    if n_tiles < 1 or n_tiles > n_source:
+        raise ValueError(
+            "The {} sources of the survey cannot be split in {} tiles".format(
+                n_source, n_tiles
+            )
+        )
+
+    centers = np.vstack(
+        [np.nanmean(src.location, axis=0) for src in survey.source_list]
+    )
+    weights = np.array([src.nD for src in survey.source_list], dtype=float)
+
+    def bisect(index, n):
+        if n == 1:
+            return [np.sort(index)]
+
+        axis = np.argmax(np.ptp(centers[index], axis=0))
+        index = index[np.argsort(centers[index, axis], kind="stable")]
+        n_left = n // 2
+        cumulative = np.cumsum(weights[index])
+        split = np.searchsorted(cumulative, cumulative[-1] * n_left / n) + 1
+        split = min(max(split, n_left), len(index) - (n - n_left))
+        return bisect(index[:split], n_left) + bisect(index[split:], n - n_left)
+
+    return bisect(np.arange(n_source), n_tiles)
+
+
+def create_tile_mesh(global_mesh, locations, octree_levels=(4, 4, 4)):
+    """
+    Local TreeMesh of a tile, refined around its electrodes.
+
+    The local mesh spans the global mesh. Cells are as fine as the global mesh
+    within ``octree_levels[0]`` of the finest cells of the electrodes, one
+    level coarser within the next ``octree_levels[1]`` cells of that size,
+    and so on, and as coarse as possible beyond. The local cells are never
+    finer than the global cells they overlap, so that every local cell
+    averages global cells by :class:`SimPEG.maps.TileMap`.
+
+    :param discretize.TreeMesh global_mesh: global mesh
+    :param numpy.ndarray locations: (n, dim) electrode locations of the tile
+    :param tuple octree_levels: number of cells of every level around the
+        electrodes, from the finest
+    :rtype: discretize.TreeMesh
+    :return: local mesh
+    """
+    if global_mesh._meshType != "TREE":
+        raise ValueError("global_mesh must be a TreeMesh")
+
+    locations = np.atleast_2d(locations)
+    locations = locations[np.all(np.isfinite(locations), axis=1)]
+
+    h_min = np.min([h.min() for h in global_mesh.h])
+    radii = np.cumsum([n * h_min * 2**level for level, n in enumerate(octree_levels)])
+    distance, _ = cKDTree(locations).query(global_mesh.gridCC)
+    levels = global_mesh.max_level - np.searchsorted(radii, distance)
+    levels = np.minimum(
+        levels, global_mesh.cell_levels_by_index(np.arange(global_mesh.nC))
+    )
+    refined = distance <= radii[-1]
+
+    local_mesh = TreeMesh(global_mesh.h, x0=global_mesh.x0)
+    local_mesh.insert_cells(global_mesh.gridCC[refined], levels[refined], finalize=True)
+    return local_mesh
+
+
+def create_tiled_misfit(
+    data,
+    global_mesh,
+    global_active,
+    n_tiles,
+    simulation_class=Simulation3DNodal,
+    octree_levels=(4, 4, 4),
+    air_conductivity=1e-8,
+    n_workers=1,
+    **kwargs,
+):
+    """
+    Tiled data misfit of a 3D DC survey.
+
+    The sources of the survey are grouped into ``n_tiles`` tiles by
+    :func:`tile_sources`. Every tile simulates its sources and their receivers
+    on its own mesh from :func:`create_tile_mesh`, with the conductivity of
+    its cells averaged from the global model by a
+    :class:`SimPEG.maps.TileMap`. The model is the log conductivity of the
+    active cells of the global mesh. Local cells partly in the air average
+    the active global cells they hold, and cells holding none have the air
+    conductivity.
+
+    The keyword arguments are passed to the simulations of the tiles, e.g.
+    ``solver``, ``storeJ`` or ``store_sensitivities`` and
+    ``sensitivity_path``: every tile factors its own system and stores its
+    own sensitivities.
+
+    .. code:: python
+
+        dmis = create_tiled_misfit(data, mesh, active, 8, n_workers=4)
+        inv_prob = inverse_problem.BaseInvProblem(dmis, reg, opt)
+
+    :param SimPEG.data.Data data: DC data of the global survey, with their
+        uncertainties
+    :param discretize.TreeMesh global_mesh: global mesh
+    :param numpy.ndarray global_active: active cells of the global mesh
+    :param int n_tiles: number of tiles
+    :param type simulation_class: 3D DC simulation of the tiles
+    :param tuple octree_levels: number of cells of every level around the
+        electrodes of the local meshes, from the finest
+    :param float air_conductivity: conductivity of the local cells without
+        active global cells
+    :param int n_workers: number of tiles evaluated concurrently
+    :rtype: TiledDataMisfit
+    :return: sum of the data misfits of the tiles
+    """
+    survey = data.survey
+    offsets = np.r_[0, np.cumsum([src.nD for src in survey.source_list])]
+
+    misfits, data_indices = [], []
+    for tile in tile_sources(survey, n_tiles):
+        local_survey = Survey([_copy_source(survey.source_list[i]) for i in tile])
+        indices = np.hstack([np.arange(offsets[i], offsets[i + 1]) for i in tile])
+
+        local_mesh = create_tile_mesh(
+            global_mesh, local_survey.unique_electrode_locations, octree_levels
+        )
+        tile_map = maps.TileMap(global_mesh, global_active, local_mesh)
+
+        # TileMap sums the volumes of the active global cells of a local cell,
+        # scaled to average the local cells partly in the air
+        fraction = tile_map * np.ones(tile_map.shape[1])
+        sigma_map = (
+            maps.ExpMap(local_mesh)
+            * maps.InjectActiveCells(
+                local_mesh, tile_map.local_active, np.log(air_conductivity)
+            )
+            * maps.Weighting(nP=fraction.size, weights=1.0 / fraction)
+            * tile_map
+        )
+
+        simulation = simulation_class(
+            local_mesh, survey=local_survey, sigmaMap=sigma_map, **kwargs
+        )
+        misfits.append(
+            L2DataMisfit(
+                data=_local_data(data, local_survey, indices), simulation=simulation
+            )
+        )
+        data_indices.append(indices)
+
+    return TiledDataMisfit(misfits, data_indices=data_indices, n_workers=n_workers)
+
+
+def _copy_source(source):
+    """
+    Copy of a source sharing its receivers, whose source term is evaluated on
+    the mesh of the tile.
+    """
+    current = source.current
+    if isinstance(source, sources.Dipole):
+        current = current[0]
+    local = source.__class__(
+        source.receiver_list, location=source.location, current=current
+    )
+    for rx in source.receiver_list:
+        if source in rx._geometric_factor:
+            rx._geometric_factor[local] = rx._geometric_factor[source]
+    return local
+
+
+def _local_data(data, survey, indices):
+    """
+    Data of a tile, with their uncertainties.
+    """
+    kwargs = {}
+    for name in ["relative_error", "noise_floor"]:
+        value = getattr(data, name)
+        if value is not None:
+            kwargs[name] = np.asarray(value)[indices] if np.ndim(value) else value
+    return Data(survey, dobs=data.dobs[indices], **kwargs)
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse as sp
 
 from . import receivers
 from . import sources
@@ -53,6 +54,94 @@ def WennerSrcList(nElecs, aSpacing, in2D=False, plotIt=False):
     return source_list
 
 
+def _survey_projection(survey, mesh, f):
+    """Projection of the potentials of all the sources of a survey to its data.
+
+    Assembles the block diagonal sparse matrix P, with one block of the stacked
+    receivers of every source, such that the data of the survey are
+    ``P @ mkvc(phi)`` for phi the (n, nSrc) potentials of its sources.
+    Apparent resistivity data are scaled by their geometric factor. The
+    electrodes of pole and dipole receivers are interpolated all at once.
+
+    Returns None if receivers of the survey project other fields than the
+    potentials.
+    """
+    n = mesh.nC if f._GLoc("phi") == "CC" else mesh.nN
+
+    standard = True
+    for src in survey.source_list:
+        for rx in src.receiver_list:
+            if rx.projField != "phi" or rx.orientation is not None:
+                return None
+            standard = standard and type(rx) in (receivers.Dipole, receivers.Pole)
+
+    if not standard:
+        blocks = []
+        for src in survey.source_list:
+            rows = [rx.evalDeriv(src, mesh, f) for rx in src.receiver_list]
+            if rows:
+                blocks.append(sp.vstack(rows))
+            else:
+                blocks.append(sp.csr_matrix((0, n)))
+        return sp.block_diag(blocks, format="csr")
+
+    locations_m, locations_n, dipoles, shift = [], [], [], []
+    for i_src, src in enumerate(survey.source_list):
+        for rx in src.receiver_list:
+            if isinstance(rx, receivers.Dipole):
+                locations_m.append(rx.locations_m)
+                locations_n.append(rx.locations_n)
+                dipoles.append(np.ones(rx.nD, dtype=bool))
+            else:
+                locations_m.append(rx.locations)
+                dipoles.append(np.zeros(rx.nD, dtype=bool))
+            shift.append(np.full(rx.nD, i_src * n))
+
+    if len(locations_m) == 0:
+        return sp.csr_matrix((0, n * len(survey.source_list)))
+
+    dipoles = np.hstack(dipoles)
+    P = mesh.getInterpolationMat(np.vstack(locations_m), f._GLoc("phi"))
+    if locations_n:
+        P_n = mesh.getInterpolationMat(np.vstack(locations_n), f._GLoc("phi"))
+        # Scatter the N electrodes to the rows of the dipole data
+        rows_n = sp.csr_matrix(
+            (np.ones(P_n.shape[0]), (np.where(dipoles)[0], np.arange(P_n.shape[0]))),
+            shape=(P.shape[0], P_n.shape[0]),
+        )
+        P = P - rows_n @ P_n
+
+    # Scale the data and offset the columns by the source of every datum
+    P = sp.diags(_data_scale(survey)) @ P
+    P = P.tocoo()
+    return sp.csr_matrix(
+        (P.data, (P.row, P.col + np.hstack(shift)[P.row])),
+        shape=(P.shape[0], n * len(survey.source_list)),
+    )
+
+
+def _data_scale(survey):
+    """Scale of the potential differences of a survey to its data.
+
+    The inverse geometric factor of apparent resistivities, and 1 for the
+    other data, as set on the receivers when called.
+    """
+    scale = []
+    for src in survey.source_list:
+        for rx in src.receiver_list:
+            if rx.data_type == "apparent_resistivity":
+                try:
+                    scale.append(1.0 / rx.geometric_factor[src] * np.ones(rx.nD))
+                except KeyError:
+                    raise KeyError(
+                        "Receiver geometric factor has not been set, please execute "
+                        "survey.set_geometric_factor()"
+                    )
+            else:
+                scale.append(np.ones(rx.nD))
+    return np.hstack(scale) if scale else np.zeros(0)
+
+
 def _mini_pole_pole(survey, verbose=False):
     """Function to miniaturize a survey for use in DCSimulation.
 
@@ -107,3 +196,107 @@ def _mini_pole_pole(survey, verbose=False):
     invs = [inv_AM, inv_AN, inv_BM, inv_BN]
     mini_survey = Survey(unique_sources)
     return dipoles, invs, mini_survey
+
+
+def _reciprocal_pole_pole(survey):
+    """Decompose a survey into the pole-pole data of its electrode potentials.
+
+    Every datum combines the potentials of up to four pole-pole pairs of a
+    current (A, B) and a potential (M, N) electrode. By reciprocity, the
+    potential of a pair can be solved either from its current electrode or
+    from its potential electrode. The side with the fewest unique electrodes
+    is solved for, with one pole source for every one of its electrodes.
+
+    Returns the signs of the pole-pole data in the data of the survey, as a
+    pair of sparse matrices for the A and B current electrodes, to be
+    weighted by :func:`_reciprocal_combination`, the miniaturized pole-pole
+    survey of the solved electrodes, and whether the potential electrodes are
+    solved for.
+    """
+    dipole_tx, dipole_rx = [], []
+    for src in survey.source_list:
+        if type(src) not in (sources.Pole, sources.Dipole):
+            raise NotImplementedError(
+                "Reciprocity is only implemented for pole and dipole sources"
+            )
+        for rx in src.receiver_list:
+            if type(rx) not in (receivers.Pole, receivers.Dipole):
+                raise NotImplementedError(
+                    "Reciprocity is only implemented for pole and dipole receivers "
+                    "of the potentials"
+                )
+            dipole_tx.append(np.full(rx.nD, isinstance(src, sources.Dipole)))
+            dipole_rx.append(np.full(rx.nD, isinstance(rx, receivers.Dipole)))
+
+    dipole_tx, dipole_rx = np.hstack(dipole_tx), np.hstack(dipole_rx)
+
+    A = survey.locations_a
+    B = survey.locations_b[dipole_tx]
+    M = survey.locations_m
+    N = survey.locations_n[dipole_rx]
+    tx_elecs, inv_tx = np.unique(np.r_[A, B], axis=0, return_inverse=True)
+    rx_elecs, inv_rx = np.unique(np.r_[M, N], axis=0, return_inverse=True)
+    reciprocal = len(rx_elecs) < len(tx_elecs)
+
+    # Electrodes of every datum, -1 for the missing B and N electrodes
+    inv_A, inv_M = inv_tx[: len(A)], inv_rx[: len(M)]
+    inv_B = np.full(survey.nD, -1)
+    inv_B[dipole_tx] = inv_tx[len(A) :]
+    inv_N = np.full(survey.nD, -1)
+    inv_N[dipole_rx] = inv_rx[len(M) :]
+
+    # Signed (current, potential) electrode pairs of the data
+    rows, tx, rx, signs, current_b = [], [], [], [], []
+    for inv_C, is_b in [(inv_A, False), (inv_B, True)]:
+        for inv_P, sign in [(inv_M, 1.0), (inv_N, -1.0)]:
+            valid = (inv_C >= 0) & (inv_P >= 0)
+            rows.append(np.where(valid)[0])
+            tx.append(inv_C[valid])
+            rx.append(inv_P[valid])
+            signs.append(np.full(valid.sum(), sign))
+            current_b.append(np.full(valid.sum(), is_b))
+    rows, tx, rx, signs, current_b = map(np.hstack, (rows, tx, rx, signs, current_b))
+
+    # Pairs are ordered by solved electrode, then by the other electrode
+    if reciprocal:
+        solved, others = rx_elecs, tx_elecs
+        pairs = np.c_[rx, tx]
+    else:
+        solved, others = tx_elecs, rx_elecs
+        pairs = np.c_[tx, rx]
+    unique_pairs, inv_pairs = np.unique(pairs, axis=0, return_inverse=True)
+
+    inv_pairs = inv_pairs.reshape(-1)
+    shape = (survey.nD, len(unique_pairs))
+    combination = tuple(
+        sp.csr_matrix((signs[terms], (rows[terms], inv_pairs[terms])), shape=shape)
+        for terms in [~current_b, current_b]
+    )
+
+    splits = np.where(np.diff(unique_pairs[:, 0]))[0] + 1
+    unique_sources = []
+    for block in np.split(unique_pairs, splits):
+        rxs = receivers.Pole(others[block[:, 1]])
+        unique_sources.append(sources.Pole([rxs], solved[block[0, 0]]))
+
+    return combination, Survey(unique_sources), reciprocal
+
+
+def _reciprocal_combination(survey, combination):
+    """Combination of the pole-pole data of :func:`_reciprocal_pole_pole`.
+
+    Weights the signs of the pole-pole data by the currents of the sources and
+    the scale of :func:`_data_scale`, as set when called, into the sparse
+    matrix C such that the data of the survey are ``C @ d_mini``.
+    """
+    currents_a, currents_b = [], []
+    for src in survey.source_list:
+        for rx in src.receiver_list:
+            currents_a.append(np.full(rx.nD, src.current[0]))
+            currents_b.append(np.full(rx.nD, src.current[-1]))
+    scale = _data_scale(survey)
+    signs_a, signs_b = combination
+    return (
+        sp.diags(scale * np.hstack(currents_a)) @ signs_a
+        + sp.diags(scale * np.hstack(currents_b)) @ signs_b
+    ).tocsr()
@@ -391,26 +391,59 @@ class BaseSIPSimulation(BaseIPSimulation):
             if f is None:
                 f = self.fields(m)
 
-            # A = self.getA()
+            # Pseudo-chargeability of all the time channels as columns
+            v = np.column_stack([self.get_peta(t) for t in self.survey.unique_times])
+
+            Jv = self._time_channel_data(f, v, projected=True)
             for tind in range(len(self.survey.unique_times)):
-                # Pseudo-chareability
-                t = self.survey.unique_times[tind]
-                v = self.get_peta(t)
-                for src in self.survey.source_list:
-                    u_src = f[src, self._solutionType]  # solution vector
-                    dA_dm_v = self.getADeriv(u_src, v)
-                    dRHS_dm_v = self.getRHSDeriv(src, v)
-                    du_dm_v = self.Ainv * (-dA_dm_v + dRHS_dm_v)
-                    for rx in src.receiver_list:
-                        timeindex = rx.getTimeP(self.survey.unique_times)
-                        if timeindex[tind]:
-                            df_dmFun = getattr(
-                                f, "_{0!s}Deriv".format(rx.projField), None
-                            )
-                            df_dm_v = df_dmFun(src, du_dm_v, v, adjoint=False)
-                            Jv.append(rx.evalDeriv(src, self.mesh, f, df_dm_v))
+                Jv[tind] = [
+                    values
+                    for values, rx in Jv[tind]
+                    if rx.getTimeP(self.survey.unique_times)[tind]
+                ]
 
-            return np.hstack(Jv)
+            return np.hstack([values for time_data in Jv for values in time_data])
+
+    def _time_channel_data(self, f, v, projected=False):
+        """
+        Data of all the time channels for model perturbations stacked as the
+        columns of v, with one multi-column solve per source.
+
+        The DC operator does not depend on time, so that the time channels
+        share the factorization and the derivatives of A for every source.
+
+        :param Fields f: DC fields
+        :param numpy.ndarray v: array of shape (n_cells, n_times) of the model
+            perturbation of every time channel
+        :param bool projected: project the fields derivatives through the
+            receivers fields derivatives, as in forward
+        :rtype: list
+        :returns: for every time channel, the list of (data, receiver) of all
+            the receivers of all the sources
+        """
+        n_time = v.shape[1]
+        if n_time == 1:
+            v = v[:, 0]
+
+        data = [[] for _ in range(n_time)]
+        for src in self.survey.source_list:
+            u_src = f[src, self._solutionType]  # solution vector
+            dA_dm_v = self.getADeriv(u_src, v)
+            dRHS_dm_v = self.getRHSDeriv(src, v)
+            du_dm_v = self.Ainv * (-dA_dm_v + dRHS_dm_v)
+
+            for rx in src.receiver_list:
+                if projected:
+                    df_dmFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
+                    df_dm_v = df_dmFun(src, du_dm_v, v, adjoint=False)
+                else:
+                    df_dm_v = du_dm_v
+                values = rx.evalDeriv(src, self.mesh, f, df_dm_v)
+                values = np.reshape(values, (-1, n_time))
+                for tind in range(n_time):
+                    data[tind].append((values[:, tind], rx))
+
+        return data
 
     def dpred(self, m, f=None):
         """
@@ -454,27 +487,21 @@ class BaseSIPSimulation(BaseIPSimulation):
             if f is None:
                 f = self.fields(m)
 
-            for tind in range(len(self.survey.unique_times)):
-
-                t = self.survey.unique_times[tind]
-                v0 = self.PetaEtaDeriv(t, v)
-                v1 = self.PetaTauiDeriv(t, v)
-                v2 = self.PetaCDeriv(t, v)
-
-                for src in self.survey.source_list:
-                    u_src = f[src, self._solutionType]  # solution vector
-                    dA_dm_v = self.getADeriv(u_src, v0 + v1 + v2)
-                    dRHS_dm_v = self.getRHSDeriv(src, v0 + v1 + v2)
-                    du_dm_v = self.Ainv * (-dA_dm_v + dRHS_dm_v)
+            # Perturbations of the pseudo-chargeability of all the time channels
+            # as columns
+            dpeta = np.column_stack(
+                [
+                    self.PetaEtaDeriv(t, v)
+                    + self.PetaTauiDeriv(t, v)
+                    + self.PetaCDeriv(t, v)
+                    for t in self.survey.unique_times
+                ]
+            )
 
-                    for rx in src.receiver_list:
-                        # Assume same # of time
-                        # timeindex = rx.getTimeP(self.survey.unique_times)
-                        # if timeindex[tind]:
-                        Jv_temp = rx.evalDeriv(src, self.mesh, f, du_dm_v)
-                        Jv.append(Jv_temp)
+            # Assume same # of time
+            Jv = self._time_channel_data(f, dpeta)
 
-            return np.hstack(Jv)
+            return np.hstack([values for time_data in Jv for values, _ in time_data])
 
     def Jtvec(self, m, v, f=None):
 
@@ -512,34 +539,35 @@ class BaseSIPSimulation(BaseIPSimulation):
             n_time = len(self.survey.unique_times)
             du_dmT = np.zeros((self.mesh.nC, n_time), dtype=float, order="F")
 
-            for tind in range(n_time):
-                t = self.survey.unique_times[tind]
-                for src in self.survey.source_list:
-                    u_src = f[src, self._solutionType]
-                    for rx in src.receiver_list:
-                        # Ignore case when each rx has different # of times
-
-                        # timeindex = rx.getTimeP(self.survey.unique_times)
-                        # if timeindex[tind]:
-                        # wrt f, need possibility wrt m
-                        PTv = rx.evalDeriv(
-                            src, self.mesh, f, v[src, rx, t], adjoint=True
-                        )
-                        df_duTFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
-                        df_duT, _ = df_duTFun(src, None, PTv, adjoint=True)
-                        ATinvdf_duT = self.Ainv * df_duT
-                        dA_dmT = self.getADeriv(u_src, ATinvdf_duT, adjoint=True)
-                        # Unecessary at the moment
-
-                        # dRHS_dmT = self.getRHSDeriv(
-                        #     src, ATinvdf_duT, adjoint=True
-                        # )
-                        # du_dmT[:, tind] = -dA_dmT + dRHS_dmT
-
-                        du_dmT[:, tind] += -self.getADeriv(
-                            u_src, ATinvdf_duT, adjoint=True
-                        )
+            for src in self.survey.source_list:
+                u_src = f[src, self._solutionType]
 
+                # Adjoint sources of all the receivers and time channels, with
+                # the time channels as columns of a single solve
+                df_duT = 0.0
+                for rx in src.receiver_list:
+                    # Ignore case when each rx has different # of times
+                    # wrt f, need possibility wrt m
+                    PTv = np.column_stack(
+                        [
+                            rx.evalDeriv(src, self.mesh, f, v[src, rx, t], adjoint=True)
+                            for t in self.survey.unique_times
+                        ]
+                    )
+                    df_duTFun = getattr(f, "_{0!s}Deriv".format(rx.projField), None)
+                    df_duT = df_duT + df_duTFun(src, None, PTv, adjoint=True)[0]
+
+                ATinvdf_duT = self.Ainv * df_duT
+                ATinvdf_duT = ATinvdf_duT.reshape((ATinvdf_duT.shape[0], n_time))
+                if n_time == 1:
+                    ATinvdf_duT = ATinvdf_duT[:, 0]
+
+                # dRHS_dmT is unecessary at the moment
+                du_dmT += np.reshape(
+                    -self.getADeriv(u_src, ATinvdf_duT, adjoint=True), (-1, n_time)
+                )
+
+            for tind in range(n_time):
                 Jtv += (
                     self.PetaEtaDeriv(
                         self.survey.unique_times[tind], du_dmT[:, tind], adjoint=True
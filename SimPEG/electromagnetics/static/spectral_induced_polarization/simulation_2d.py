@@ -27,8 +27,6 @@ class BaseSIPSimulation2D(BaseSIPSimulation):
                 survey = self._mini_survey
             else:
                 survey = self.survey
-            kys = self._quad_points
-            weights = self._quad_weights
 
             if f is None:
                 f = self.fields(m)
@@ -37,33 +35,43 @@ class BaseSIPSimulation2D(BaseSIPSimulation):
                 (self.actMap.nP, int(self.survey.nD / self.survey.unique_times.size)),
                 order="F",
             )
-            for iky, ky in enumerate(kys):
-                u_ky = f[:, self._solutionType, iky]
-                istrt = 0
-                for i_src, src in enumerate(survey.source_list):
-                    u_src = u_ky[:, i_src]
-                    for rx in src.receiver_list:
-                        # wrt f, need possibility wrt m
-                        P = rx.getP(self.mesh, rx.projGLoc(f)).toarray()
-
-                        ATinvdf_duT = self.Ainv[iky] * (P.T)
-
-                        dA_dmT = self.getADeriv(ky, u_src, ATinvdf_duT, adjoint=True)
-                        Jtv = -weights[iky] * dA_dmT  # RHS=0
-                        iend = istrt + rx.nD
-                        if rx.nD == 1:
-                            Jt[:, istrt] += Jtv
-                        else:
-                            Jt[:, istrt:iend] += Jtv
-                        istrt += rx.nD
+            with self._assembled_systems():
+                for Jt_ky in self._map_ky("_getJ_ky", f, survey, Jt.shape):
+                    Jt += Jt_ky
 
             self._Jmatrix = self._mini_survey_data(Jt.T)
             # clean all factorization
-            if self.Ainv[0] is not None:
-                for i in range(self.nky):
-                    self.Ainv[i].clean()
+            self._clean_factors()
             return self._Jmatrix
 
+    def _getJ_ky(self, iky, f, survey, shape):
+        """
+        Quadrature weighted contribution of a wavenumber to the full J^T.
+        """
+        ky = self._quad_points[iky]
+        Ainv = self._factor_ky(iky)
+        u_ky = f[:, self._solutionType, iky]
+
+        Jt = np.zeros(shape, order="F")
+        istrt = 0
+        for i_src, src in enumerate(survey.source_list):
+            u_src = u_ky[:, i_src]
+            for rx in src.receiver_list:
+                # wrt f, need possibility wrt m
+                P = rx.getP(self.mesh, rx.projGLoc(f)).toarray()
+
+                ATinvdf_duT = Ainv * (P.T)
+
+                dA_dmT = self.getADeriv(ky, u_src, ATinvdf_duT, adjoint=True)
+                iend = istrt + rx.nD
+                if rx.nD == 1:
+                    Jt[:, istrt] = -self._quad_weights[iky] * dA_dmT  # RHS=0
+                else:
+                    Jt[:, istrt:iend] = -self._quad_weights[iky] * dA_dmT
+                istrt += rx.nD
+
+        return Jt
+
 
 class Simulation2DCellCentered(BaseSIPSimulation2D, BaseSimulation2DCellCentered):
     """
@@ -3,6 +3,7 @@ from .simulation import (
     Simulation3DElectricField,
     Simulation3DMagneticField,
     Simulation3DCurrentDensity,
+    Simulation3DWaveformConvolution,
 )
 from .fields import (
     Fields3DMagneticFluxDensity,
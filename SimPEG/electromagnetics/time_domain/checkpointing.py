@@ -0,0 +1,157 @@
+import numpy as np
+from scipy.special import comb
+
+
+class TimeLevels(object):
+    """
+    Storage of the solution of a TDEM simulation at some of its time levels.
+
+    It stands for the (nP, nSrc, nT+1) array of the solution in a
+    :class:`SimPEG.electromagnetics.time_domain.fields.FieldsTDEM` object,
+    but only holds the time levels of the time steps being solved. Reading
+    any other time level raises a KeyError.
+
+    :param tuple shape: shape (nP, nSrc, nT+1) of the solution
+    """
+
+    def __init__(self, shape):
+        self.shape = shape
+        self._levels = {}
+
+    def __contains__(self, tInd):
+        return tInd in self._levels
+
+    def __len__(self):
+        return len(self._levels)
+
+    def hold(self, tInd, u):
+        """
+        Hold the solution (nP, nSrc) at a time level.
+        """
+        self._levels[tInd] = np.reshape(u, self.shape[:2], order="F")
+
+    def release(self, tInd):
+        """
+        Release the solution at a time level.
+        """
+        self._levels.pop(tInd, None)
+
+    def level(self, tInd):
+        """
+        Solution (nP, nSrc) at a time level.
+        """
+        if tInd not in self._levels:
+            raise KeyError(
+                "The solution at time index {} is not held by the checkpointed "
+                "fields".format(tInd)
+            )
+        return self._levels[tInd]
+
+    def __getitem__(self, key):
+        ind, srcInd, timeInd = key
+        timeII = np.arange(self.shape[2])[timeInd]
+        if np.ndim(timeII) == 0:
+            return self.level(int(timeII))[ind, srcInd]
+        return np.stack([self.level(tInd)[ind, srcInd] for tInd in timeII], axis=-1)
+
+
+def _repetitions(n_steps, n_checkpoints):
+    """
+    Smallest number of repetitions r such that n_checkpoints reverse the
+    n_steps + 1 time levels, computing every time step at most r times.
+    """
+    r = 0
+    while comb(n_checkpoints + r, n_checkpoints, exact=True) < n_steps + 1:
+        r += 1
+    return r
+
+
+def _advance(n_steps, n_checkpoints):
+    """
+    Number of time steps to advance before the next checkpoint, so that the
+    reversal computes the fewest time steps.
+    """
+    r = _repetitions(n_steps, n_checkpoints)
+    advance = max(
+        n_steps + 1 - comb(n_checkpoints - 1 + r, n_checkpoints - 1, exact=True),
+        comb(n_checkpoints - 2 + r, n_checkpoints, exact=True),
+        1,
+    )
+    return min(advance, n_steps)
+
+
+def n_recomputed_steps(n_steps, n_checkpoints):
+    """
+    Number of time steps computed by :func:`reversed_time_levels`.
+
+    Reversing the ``n_steps + 1`` time levels from the first one, holding at
+    most ``n_checkpoints`` of them, computes
+
+    .. math::
+
+        r (n + 1) - \\binom{c + r}{c + 1}
+
+    time steps, where :math:`r` is the smallest number of repetitions with
+    :math:`\\binom{c + r}{c} \\geq n + 1`. Every time step is computed at most
+    :math:`r` times, and only once if the checkpoints hold all time levels.
+
+    :param int n_steps: number of time steps
+    :param int n_checkpoints: number of time levels held
+    :rtype: int
+    :return: number of time steps computed
+    """
+    r = _repetitions(n_steps, n_checkpoints)
+    return r * (n_steps + 1) - comb(n_checkpoints + r, n_checkpoints + 1, exact=True)
+
+
+def reversed_time_levels(u0, n_steps, n_checkpoints, step):
+    """
+    Time levels of a time stepping, in reverse order.
+
+    The time levels ``n_steps``, ..., 1, 0 are recomputed from the first one
+    with the binomial checkpointing of Griewank and Walther (revolve). At most
+    ``n_checkpoints`` time levels are held as checkpoints, the first one
+    included, besides the time level being computed. The number of time
+    steps computed is the fewest for this memory budget, given by
+    :func:`n_recomputed_steps`.
+
+    .. code:: python
+
+        for tInd, u in reversed_time_levels(u0, nT, 10, step):
+            ...
+
+    :param numpy.ndarray u0: first time level
+    :param int n_steps: number of time steps
+    :param int n_checkpoints: number of time levels held
+    :param callable step: time level tInd + 1 from ``step(tInd, u)``
+    :rtype: generator
+    :return: time indices and time levels, from the last one
+    """
+    if n_checkpoints < 1:
+        raise ValueError("At least one checkpoint is needed")
+
+    checkpoints = [(0, u0)]
+    last = n_steps
+    while last >= 0:
+        tInd, u = checkpoints[-1]
+        if tInd == last:
+            checkpoints.pop()
+            yield tInd, u
+            last -= 1
+            continue
+
+        if len(checkpoints) < n_checkpoints:
+            # advance to the next checkpoint, the later time levels are
+            # reversed from it before those in between
+            n_advance = _advance(last - tInd, n_checkpoints - len(checkpoints) + 1)
+        else:
+            n_advance = last - tInd
+
+        for t in range(tInd, tInd + n_advance):
+            u = step(t, u)
+
+        if tInd + n_advance == last:
+            yield last, u
+            last -= 1
+        else:
+            checkpoints.append((tInd + n_advance, u))
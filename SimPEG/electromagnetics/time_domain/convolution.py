@@ -0,0 +1,99 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def waveform_samples(waveform, n_samples=100):
+    """
+    Times sampling the current of a waveform between 0 and its off time.
+
+    The samples are spaced evenly, and include the times of the ramps and
+    peaks of the waveform, between which its current is linear for the
+    trapezoid and triangular waveforms.
+
+    :param SimPEG.electromagnetics.time_domain.sources.BaseWaveform waveform:
+        waveform
+    :param int n_samples: number of evenly spaced samples
+    :rtype: numpy.ndarray
+    :return: sorted sample times
+    """
+    off_time = waveform.off_time
+    times = [np.linspace(0.0, off_time, n_samples)]
+    for name in ["ramp_on", "ramp_off", "peak_time"]:
+        value = getattr(waveform, name, None)
+        if value is not None:
+            times.append(np.atleast_1d(value).astype(float))
+    times = np.unique(np.hstack(times))
+    return times[(times >= 0.0) & (times <= off_time)]
+
+
+def waveform_convolution_matrix(waveform, times, time_mesh, n_samples=100):
+    """
+    Matrix of the response to a waveform at off-time times, from the step-off
+    response at the nodes of a time mesh.
+
+    With :math:`r(t)` the response at the delay :math:`t` after switching off
+    a unit steady current, the response to a current :math:`w(\\tau)`, on
+    between 0 and its off time :math:`\\tau_{off}`, is
+
+    .. math::
+
+        d(t) = w(\\tau_{off}^-) r(t - \\tau_{off})
+        - \\int_0^{\\tau_{off}} w'(\\tau) r(t - \\tau) d\\tau
+        - w(0^+) r(t)
+
+    for :math:`t \\geq \\tau_{off}`. The last term is the current switched on
+    at 0, and is left out for waveforms with initial fields, whose current is
+    on before 0. :math:`w(\\tau_{off}^-)` is 0 unless the current is switched
+    off at once. The current is linear between the samples of
+    :func:`waveform_samples`, and the integral is computed by Gauss-Legendre
+    quadrature of the step-off response, linear between the nodes of the
+    time mesh.
+
+    :param SimPEG.electromagnetics.time_domain.sources.BaseWaveform waveform:
+        waveform
+    :param numpy.ndarray times: times of the response, from the off time
+    :param discretize.TensorMesh time_mesh: time mesh of the step-off response,
+        from 0 to the last time
+    :param int n_samples: number of evenly spaced samples of the waveform
+    :rtype: scipy.sparse.csr_matrix
+    :return: (len(times), time_mesh.nN) matrix
+    """
+    times = np.atleast_1d(times).astype(float)
+    off_time = waveform.off_time
+    if np.any(times < off_time):
+        raise ValueError(
+            "The response to a waveform is only convolved at times from its off "
+            "time {}, times from {} were given".format(off_time, times.min())
+        )
+    if times.max() > time_mesh.nodes_x[-1]:
+        raise ValueError(
+            "The step-off response is simulated until {}, the response to the "
+            "waveform is needed until {}".format(time_mesh.nodes_x[-1], times.max())
+        )
+
+    samples = waveform_samples(waveform, n_samples)
+    current = np.array([waveform.eval(t) for t in samples])
+
+    # currents switched on at 0 and off at the off time
+    tau = [0.0, off_time]
+    weights = [0.0 if waveform.has_initial_fields else -current[0], current[-1]]
+
+    # ramps, by 2-point Gauss-Legendre quadrature
+    points, point_weights = np.polynomial.legendre.leggauss(2)
+    widths = np.diff(samples)
+    ramps = widths > 0
+    slopes = np.diff(current)[ramps] / widths[ramps]
+    centers = 0.5 * (samples[1:] + samples[:-1])[ramps]
+    for point, point_weight in zip(points, point_weights):
+        tau.append(centers + 0.5 * point * widths[ramps])
+        weights.append(-0.5 * point_weight * widths[ramps] * slopes)
+
+    tau = np.hstack(tau)
+    weights = np.hstack(weights)
+    keep = weights != 0
+    tau, weights = tau[keep], weights[keep]
+
+    delays = times[:, None] - tau[None, :]
+    P = time_mesh.get_interpolation_matrix(delays.ravel(), "N")
+    R = sp.kron(sp.identity(len(times)), weights[None, :])
+    return sp.csr_matrix(R @ P)
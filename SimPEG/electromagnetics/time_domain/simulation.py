@@ -1,13 +1,21 @@
+import os
+import multiprocessing
 import numpy as np
 import scipy.sparse as sp
 import time
 import properties
+from collections import OrderedDict
 
 from ...data import Data
-from ...simulation import BaseTimeSimulation
+from ...simulation import BaseSimulation, BaseTimeSimulation
 from ...utils import mkvc, sdiag, speye, Zero
+from ...utils.code_utils import hash_arrays
+from ...utils.sensitivity_utils import MemmapSensitivity, create_sensitivity_file
 from ..base import BaseEMSimulation
 from .survey import Survey
+from .checkpointing import TimeLevels, reversed_time_levels
+from .convolution import waveform_convolution_matrix
+from .sources import StepOffWaveform
 from .fields import (
     Fields3DMagneticFluxDensity,
     Fields3DElectricField,
@@ -25,11 +33,64 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
     Euler.
     """
 
-    clean_on_model_update = ["_Adcinv"]  #: clear DC matrix factors on any model updates
+    #: clear the DC and time step matrix factors on any model updates
+    clean_on_model_update = ["_Adcinv", "_Ainv"]
     dt_threshold = 1e-8
 
     survey = properties.Instance("a survey object", Survey, required=True)
 
+    max_factors = properties.Integer(
+        "Maximum number of factorizations of the system matrices of the "
+        "distinct time step sizes held in memory, all of them if None. The "
+        "least recently used factorization is cleaned beyond.",
+        required=False,
+        min=1,
+    )
+
+    n_checkpoints = properties.Integer(
+        "Number of time levels of the solution held in memory, all of them if "
+        "None. The fields then only hold the initial fields and the predicted "
+        "data: Jvec recomputes the time levels and Jtvec reverses them with "
+        "binomial checkpointing, see "
+        "SimPEG.electromagnetics.time_domain.checkpointing.n_recomputed_steps",
+        required=False,
+        min=1,
+    )
+
+    storeJ = properties.Bool("store the sensitivity matrix?", default=False)
+
+    store_sensitivities = properties.StringChoice(
+        "Storage of the sensitivity matrix formed by getJ. 'disk' writes float32 "
+        "sensitivities to sensitivity_path, memory mapped and applied by blocks "
+        "of rows.",
+        choices=["ram", "disk"],
+        default="ram",
+    )
+
+    max_adjoint_block = properties.Float(
+        "Maximum memory (MB) of the adjoint problems of the data solved together "
+        "through time when forming J. A block holds at least one datum.",
+        default=512.0,
+        min=0.0,
+    )
+
+    sensitivity_chunk_size = properties.Float(
+        "Size (MB) of the blocks of rows of J read at once with "
+        "store_sensitivities='disk'",
+        default=128.0,
+        min=0.0,
+    )
+
+    n_threads = properties.Integer(
+        "Number of threads applying the blocks of rows of J with "
+        "store_sensitivities='disk'",
+        default=int(multiprocessing.cpu_count()),
+        min=1,
+    )
+
+    _Jmatrix = None
+    gtgdiag = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.muMap is not None:
@@ -60,6 +121,9 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
         tic = time.time()
         self.model = m
 
+        if self.n_checkpoints is not None:
+            return self._fields_checkpointed()
+
         f = self.fieldsPair(self)
 
         # set initial fields
@@ -69,46 +133,38 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
             print("{}\nCalculating fields(m)\n{}".format("*" * 50, "*" * 50))
 
         # timestep to solve forward
-        Ainv = None
         for tInd, dt in enumerate(self.time_steps):
-            # keep factors if dt is the same as previous step b/c A will be the
-            # same
-            if Ainv is not None and (
-                tInd > 0 and abs(dt - self.time_steps[tInd - 1]) > self.dt_threshold
-            ):
-                Ainv.clean()
-                Ainv = None
-
-            if Ainv is None:
-                A = self.getAdiag(tInd)
-                if self.verbose:
-                    print("Factoring...   (dt = {:e})".format(dt))
-                Ainv = self.solver(A, **self.solver_opts)
-                if self.verbose:
-                    print("Done")
-
-            rhs = self.getRHS(tInd + 1)  # this is on the nodes of the time mesh
-            Asubdiag = self.getAsubdiag(tInd)
+            sol = self._time_step(tInd, f[:, (self._fieldType + "Solution"), tInd])
+            f[:, self._fieldType + "Solution", tInd + 1] = sol
 
-            if self.verbose:
-                print("    Solving...   (tInd = {:d})".format(tInd + 1))
+        if self.verbose:
+            print("{}\nDone calculating fields(m)\n{}".format("*" * 50, "*" * 50))
 
-            # taking a step
-            sol = Ainv * (rhs - Asubdiag * f[:, (self._fieldType + "Solution"), tInd])
+        return f
 
-            if self.verbose:
-                print("    Done...")
+    def _time_step(self, tInd, u):
+        """
+        Solution (nP, nSrc) at the time index tInd + 1, from the solution at
+        tInd.
+        """
+        # factors are shared by the time steps of the same size
+        Ainv = self._get_Ainv(tInd)
 
-            if sol.ndim == 1:
-                sol.shape = (sol.size, 1)
-            f[:, self._fieldType + "Solution", tInd + 1] = sol
+        rhs = self.getRHS(tInd + 1)  # this is on the nodes of the time mesh
+        Asubdiag = self.getAsubdiag(tInd)
 
         if self.verbose:
-            print("{}\nDone calculating fields(m)\n{}".format("*" * 50, "*" * 50))
+            print("    Solving...   (tInd = {:d})".format(tInd + 1))
 
-        # clean factors and return
-        Ainv.clean()
-        return f
+        # taking a step
+        sol = Ainv * (rhs - Asubdiag * u)
+
+        if self.verbose:
+            print("    Done...")
+
+        if sol.ndim == 1:
+            sol.shape = (sol.size, 1)
+        return sol
 
     def Jvec(self, m, v, f=None):
         """
@@ -134,6 +190,13 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
         ftype = self._fieldType + "Solution"  # the thing we solved for
         self.model = m
 
+        if self.storeJ:
+            J = self.getJ(m, f=f)
+            return J.dot(v)
+
+        if isinstance(f._fields[ftype], TimeLevels):
+            return self._Jvec_checkpointed(v, f)
+
         # mat to store previous time-step's solution deriv times a vector for
         # each source
         # size: nu x nSrc
@@ -156,21 +219,7 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
         # store the field derivs we need to project to calc full deriv
         df_dm_v = self.Fields_Derivs(self)
 
-        Adiaginv = None
-
-        for tInd, dt in zip(range(self.nT), self.time_steps):
-            # keep factors if dt is the same as previous step b/c A will be the
-            # same
-            if Adiaginv is not None and (tInd > 0 and dt != self.time_steps[tInd - 1]):
-                Adiaginv.clean()
-                Adiaginv = None
-
-            if Adiaginv is None:
-                A = self.getAdiag(tInd)
-                Adiaginv = self.solver(A, **self.solver_opts)
-
-            Asubdiag = self.getAsubdiag(tInd)
-
+        for tInd in range(self.nT + 1):
             for i, src in enumerate(self.survey.source_list):
 
                 # here, we are lagging by a timestep, so filling in as we go
@@ -184,20 +233,14 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
                         tInd, src, dun_dm_v[:, i], v
                     )
 
-                un_src = f[src, ftype, tInd + 1]
-
-                # cell centered on time mesh
-                dA_dm_v = self.getAdiagDeriv(tInd, un_src, v)
-                # on nodes of time mesh
-                dRHS_dm_v = self.getRHSDeriv(tInd + 1, src, v)
-
-                dAsubdiag_dm_v = self.getAsubdiagDeriv(tInd, f[src, ftype, tInd], v)
+            # the data of the last time level
+            if tInd == self.nT:
+                break
 
-                JRHS = dRHS_dm_v - dAsubdiag_dm_v - dA_dm_v
-
-                # step in time and overwrite
-                if tInd != len(self.time_steps + 1):
-                    dun_dm_v[:, i] = Adiaginv * (JRHS - Asubdiag * dun_dm_v[:, i])
+            # step in time and overwrite, all sources at once
+            dun_dm_v = self._Jvec_time_step(
+                tInd, f[:, ftype, tInd], f[:, ftype, tInd + 1], dun_dm_v, v
+            )
 
         Jv = []
         for src in self.survey.source_list:
@@ -211,7 +254,6 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
                         mkvc(df_dm_v[src, "%sDeriv" % rx.projField, :]),
                     )
                 )
-        Adiaginv.clean()
         # del df_dm_v, dun_dm_v, Asubdiag
         # return mkvc(Jv)
         return np.hstack(Jv)
@@ -246,13 +288,20 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
         if not isinstance(v, Data):
             v = Data(self.survey, v)
 
+        if self.storeJ:
+            J = self.getJ(m, f=f)
+            return np.asarray(J.T.dot(v.dobs))
+
+        if isinstance(f._fields[ftype], TimeLevels):
+            return self._Jtvec_checkpointed(m, v, f)
+
         df_duT_v = self.Fields_Derivs(self)
 
-        # same size as fields at a single timestep
+        # same size as fields at a single timestep, for all sources
         ATinv_df_duT_v = np.zeros(
             (
-                len(self.survey.source_list),
                 len(f[self.survey.source_list[0], ftype, 0]),
+                len(self.survey.source_list),
             ),
             dtype=float,
         )
@@ -296,67 +345,564 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
 
         del PT_v  # no longer need this
 
-        AdiagTinv = None
+        # Do the back-solve through time, all sources at once
+        for tInd in reversed(range(self.nT)):
+            ATinv_df_duT_v, JTv_t = self._Jtvec_time_step(
+                tInd,
+                f[:, ftype, tInd],
+                f[:, ftype, tInd + 1],
+                df_duT_v[:, "{}Deriv".format(self._fieldType), tInd + 1],
+                ATinv_df_duT_v,
+            )
+            JTv = JTv + mkvc(JTv_t)
 
-        # Do the back-solve through time
-        # if the previous timestep is the same: no need to refactor the matrix
-        # for tInd, dt in zip(range(self.nT), self.time_steps):
+        # Treat the initial condition
+        for isrc, src in enumerate(self.survey.source_list):
+            JTv = JTv + self._JtvecInitialCondition(
+                src,
+                mkvc(df_duT_v[src, "{}Deriv".format(self._fieldType), 0]),
+                ATinv_df_duT_v[:, isrc],
+                mkvc(f[src, ftype, 0]),
+            )
 
-        for tInd in reversed(range(self.nT)):
-            # tInd = tIndP - 1
-            if AdiagTinv is not None and (
-                tInd <= self.nT and self.time_steps[tInd] != self.time_steps[tInd + 1]
-            ):
-                AdiagTinv.clean()
-                AdiagTinv = None
-
-            # refactor if we need to
-            if AdiagTinv is None:  # and tInd > -1:
-                Adiag = self.getAdiag(tInd)
-                AdiagTinv = self.solver(Adiag.T, **self.solver_opts)
-
-            if tInd < self.nT - 1:
-                Asubdiag = self.getAsubdiag(tInd + 1)
-
-            for isrc, src in enumerate(self.survey.source_list):
-
-                # solve against df_duT_v
-                if tInd >= self.nT - 1:
-                    # last timestep (first to be solved)
-                    ATinv_df_duT_v[isrc, :] = (
-                        AdiagTinv
-                        * df_duT_v[src, "{}Deriv".format(self._fieldType), tInd + 1]
-                    )
-                elif tInd > -1:
-                    ATinv_df_duT_v[isrc, :] = AdiagTinv * (
-                        mkvc(df_duT_v[src, "{}Deriv".format(self._fieldType), tInd + 1])
-                        - Asubdiag.T * mkvc(ATinv_df_duT_v[isrc, :])
-                    )
+        # del df_duT_v, ATinv_df_duT_v, A, Asubdiag
+        return mkvc(JTv).astype(float)
+
+    def dpred(self, m=None, f=None):
+        if f is None and self.n_checkpoints is not None:
+            f = self.fields(self.model if m is None else m)
+
+        # checkpointed fields hold the data predicted while time stepping
+        if getattr(f, "_dpred", None) is not None:
+            return f._dpred
+        return super().dpred(m=m, f=f)
 
-                dAsubdiagT_dm_v = self.getAsubdiagDeriv(
-                    tInd, f[src, ftype, tInd], ATinv_df_duT_v[isrc, :], adjoint=True
+    def getJ(self, m, f=None):
+        """
+        Sensitivity matrix (nD, nP).
+
+        The rows of J are formed by blocks of data, whose adjoint problems are
+        solved together through time, see ``max_adjoint_block``. With
+        ``store_sensitivities='disk'``, J is a
+        :class:`SimPEG.utils.sensitivity_utils.MemmapSensitivity`
+        of a float32 file in ``sensitivity_path``.
+
+        :param numpy.ndarray m: inversion model (nP,)
+        :param SimPEG.electromagnetics.time_domain.fields.FieldsTDEM f: fields
+        :rtype: numpy.ndarray
+        :return: sensitivity matrix
+        """
+        self.model = m
+        if self._Jmatrix is None:
+            if f is None:
+                f = self.fields(m)
+            if self.store_sensitivities == "disk":
+                self._Jmatrix = self._getJ_disk(f)
+            else:
+                self._Jmatrix = self._getJ_blocks(
+                    f, np.empty((self.survey.nD, self.model.size))
                 )
+        return self._Jmatrix
+
+    def _getJ_disk(self, f):
+        """
+        Sensitivity matrix stored in ``sensitivity_path`` as float32, as a
+        :class:`SimPEG.utils.sensitivity_utils.MemmapSensitivity`.
+
+        The sensitivities are written by blocks of data to a file named by a
+        hash of the mesh, time steps, survey and model, or reused if that file
+        exists. Files written for previous models by the simulation are
+        removed.
+        """
+        filename = os.path.join(
+            self.sensitivity_path, "J_{}.npy".format(self._sensitivity_key())
+        )
+        if not os.path.exists(filename):
+            if self.verbose:
+                print(f"writing sensitivity to {filename}")
+            partial = filename[:-4] + ".partial.npy"
+            values = create_sensitivity_file(partial, (self.survey.nD, self.model.size))
+            self._getJ_blocks(f, values)
+            values.flush()
+            del values
+            os.replace(partial, filename)
+
+            for name in getattr(self, "_sensitivity_files", []):
+                if name != filename and os.path.exists(name):
+                    os.remove(name)
+            self._sensitivity_files = [filename]
+
+        return MemmapSensitivity(
+            filename,
+            sp.identity(self.model.size, format="csr"),
+            chunk_size=self.sensitivity_chunk_size,
+            n_threads=self.n_threads,
+        )
+
+    def _sensitivity_key(self):
+        """
+        Hash of the mesh, time steps, survey, model and physical properties
+        defining the sensitivities.
+        """
+        survey = []
+        for src in self.survey.source_list:
+            # the waveform as seen by the simulation, at the time levels
+            waveform = [src.waveform.eval(t) for t in self.times]
+            survey += [_source_key(src), waveform, src.waveform.has_initial_fields]
+            for rx in src.receiver_list:
+                survey += [
+                    type(rx).__name__,
+                    np.asarray(rx.locations),
+                    rx.times,
+                    str(rx.orientation),
+                ]
+
+        model = []
+        for name in self._act_map_names:
+            deriv = sp.csr_matrix(getattr(self, name[:-3] + "Deriv"))
+            model += [name, deriv.shape, deriv.indptr, deriv.indices, deriv.data]
+
+        return hash_arrays(
+            type(self).__name__,
+            self.mesh.cell_centers,
+            self.mesh.cell_volumes,
+            self.t0,
+            self.time_steps,
+            self.model,
+            self.sigma,
+            self.mu,
+            *model,
+            *survey,
+        )
+
+    def getJtJdiag(self, m, W=None):
+        """
+        Return the diagonal of JtJ
+        """
+        if self.gtgdiag is None:
+            J = self.getJ(m)
+
+            if W is None:
+                W = np.ones(J.shape[0])
+            else:
+                W = W.diagonal() ** 2
+
+            if isinstance(J, MemmapSensitivity):
+                self.gtgdiag = J.jtj_diag(W)
+            else:
+                self.gtgdiag = np.einsum("i,ij,ij->j", W, J, J)
+        return self.gtgdiag
+
+    @property
+    def deleteTheseOnModelUpdate(self):
+        toDelete = super().deleteTheseOnModelUpdate
+        if self._Jmatrix is not None:
+            toDelete = toDelete + ["_Jmatrix"]
+        if self.gtgdiag is not None:
+            toDelete = toDelete + ["gtgdiag"]
+        return toDelete
+
+    def _receiver_projections(self, f):
+        """
+        Projections of the time levels of the fields to the data, for every
+        receiver of every source
+        """
+        return [
+            [
+                sp.csc_matrix(rx.getP(self.mesh, self.time_mesh, f))
+                for rx in src.receiver_list
+            ]
+            for src in self.survey.source_list
+        ]
+
+    def _fields_checkpointed(self):
+        """
+        Fields holding the initial fields, and the data predicted while time
+        stepping.
+        """
+        f = self.fieldsPair(self)
+        ftype = self._fieldType + "Solution"
+
+        levels = TimeLevels(f._storageShape(f.knownFields[ftype]))
+        levels.hold(0, self.getInitialFields())
+        f._fields[ftype] = levels
+
+        if self.verbose:
+            print("{}\nCalculating fields(m)\n{}".format("*" * 50, "*" * 50))
+
+        Ps = self._receiver_projections(f)
+        d = [
+            [np.zeros(rx.nD) for rx in src.receiver_list]
+            for src in self.survey.source_list
+        ]
+
+        u = levels.level(0)
+        for tInd in range(self.nT + 1):
+            if tInd > 0:
+                u = self._time_step(tInd - 1, u)
+                levels.hold(tInd, u)
+
+            for i, src in enumerate(self.survey.source_list):
+                for rx, P, d_rx in zip(src.receiver_list, Ps[i], d[i]):
+                    d_rx += _time_level(P, tInd, self.nT + 1) * mkvc(
+                        f[src, rx.projField, tInd]
+                    )
+
+            if tInd > 0:
+                levels.release(tInd)
+
+        if self.verbose:
+            print("{}\nDone calculating fields(m)\n{}".format("*" * 50, "*" * 50))
+
+        data = Data(self.survey)
+        for i, src in enumerate(self.survey.source_list):
+            for rx, d_rx in zip(src.receiver_list, d[i]):
+                data[src, rx] = d_rx
+        f._dpred = data.dobs
+        return f
+
+    def _Jvec_checkpointed(self, v, f):
+        """
+        Jvec of checkpointed fields, recomputing the time levels
+        """
+        ftype = self._fieldType + "Solution"
+        levels = f._fields[ftype]
+        Ps = self._receiver_projections(f)
+
+        dun_dm_v = np.hstack(
+            [
+                mkvc(self.getInitialFieldsDeriv(src, v, f=f), 2)
+                for src in self.survey.source_list
+            ]
+        )
+        Jv = [
+            [np.zeros(rx.nD) for rx in src.receiver_list]
+            for src in self.survey.source_list
+        ]
+
+        u = levels.level(0)
+        for tInd in range(self.nT + 1):
+            for i, src in enumerate(self.survey.source_list):
+                df_dm_v = {}
+                for rx, P, Jv_rx in zip(src.receiver_list, Ps[i], Jv[i]):
+                    if rx.projField not in df_dm_v:
+                        df_dmFun = getattr(f, "_%sDeriv" % rx.projField, None)
+                        df_dm_v[rx.projField] = mkvc(
+                            df_dmFun(tInd, src, dun_dm_v[:, i], v)
+                        )
+                    Jv_rx += _time_level(P, tInd, self.nT + 1) * df_dm_v[rx.projField]
+
+            if tInd == self.nT:
+                break
 
-                dRHST_dm_v = self.getRHSDeriv(
-                    tInd + 1, src, ATinv_df_duT_v[isrc, :], adjoint=True
-                )  # on nodes of time mesh
+            # recompute the next time level, then step the derivative
+            un = self._time_step(tInd, u)
+            levels.hold(tInd + 1, un)
+            dun_dm_v = self._Jvec_time_step(tInd, u, un, dun_dm_v, v)
+
+            if tInd > 0:
+                levels.release(tInd)
+            u = un
+
+        if self.nT > 0:
+            levels.release(self.nT)
+
+        return np.hstack([Jv_rx for Jv_src in Jv for Jv_rx in Jv_src])
+
+    def _Jtvec_checkpointed(self, m, v, f):
+        """
+        Jtvec of checkpointed fields, reversing the time levels with at most
+        n_checkpoints of them held
+        """
+        ftype = self._fieldType + "Solution"
+        levels = f._fields[ftype]
+        Ps = self._receiver_projections(f)
+
+        JTv = np.zeros(m.shape, dtype=float)
+        ATinv_df_duT_v = np.zeros(levels.shape[:2])
+
+        n_checkpoints = self.n_checkpoints or self.nT + 1
+        time_levels = reversed_time_levels(
+            levels.level(0), self.nT, n_checkpoints, self._time_step
+        )
+        for tInd, u in time_levels:
+            levels.hold(tInd, u)
+
+            # adjoint of the receivers at this time level
+            df_duT_v = np.zeros(levels.shape[:2])
+            for i, src in enumerate(self.survey.source_list):
+                for rx, P in zip(src.receiver_list, Ps[i]):
+                    PT_v = _time_level(P, tInd, self.nT + 1).T * mkvc(v[src, rx])
+                    df_duTFun = getattr(f, "_{}Deriv".format(rx.projField), None)
+                    cur = df_duTFun(tInd, src, None, PT_v, adjoint=True)
+                    df_duT_v[:, i] += mkvc(cur[0])
+                    JTv = cur[1] + JTv
 
-                un_src = f[src, ftype, tInd + 1]
-                # cell centered on time mesh
-                dAT_dm_v = self.getAdiagDeriv(
-                    tInd, un_src, ATinv_df_duT_v[isrc, :], adjoint=True
+            if tInd < self.nT:
+                # back-solve the time step to the next time level
+                ATinv_df_duT_v, JTv_t = self._Jtvec_time_step(
+                    tInd, u, un, df_duT_v_next, ATinv_df_duT_v
                 )
+                JTv = JTv + mkvc(JTv_t)
+                levels.release(tInd + 1)
 
-                JTv = JTv + mkvc(-dAT_dm_v - dAsubdiagT_dm_v + dRHST_dm_v)
+            df_duT_v_next, un = df_duT_v, u
 
         # Treat the initial condition
-
-        # del df_duT_v, ATinv_df_duT_v, A, Asubdiag
-        if AdiagTinv is not None:
-            AdiagTinv.clean()
+        for i, src in enumerate(self.survey.source_list):
+            JTv = JTv + self._JtvecInitialCondition(
+                src, df_duT_v[:, i], ATinv_df_duT_v[:, i], u[:, i]
+            )
 
         return mkvc(JTv).astype(float)
 
+    def _reversed_time_levels(self, f):
+        """
+        Time indices and solutions (nP, nSrc) of the fields, from the last time
+        level, recomputed from the checkpoints of checkpointed fields.
+        """
+        ftype = self._fieldType + "Solution"
+        levels = f._fields[ftype]
+        if not isinstance(levels, TimeLevels):
+            for tInd in reversed(range(self.nT + 1)):
+                yield tInd, f[:, ftype, tInd]
+            return
+
+        n_checkpoints = self.n_checkpoints or self.nT + 1
+        time_levels = reversed_time_levels(
+            levels.level(0), self.nT, n_checkpoints, self._time_step
+        )
+        for tInd, u in time_levels:
+            levels.hold(tInd, u)
+            yield tInd, u
+            if tInd > 0:
+                levels.release(tInd)
+
+    def _getJ_blocks(self, f, out):
+        """
+        Fill the (nD, nP) array out with the sensitivities, by blocks of data
+        whose adjoint problems are solved together through time.
+        """
+        ftype = self._fieldType + "Solution"
+        n_fields = f._storageShape(f.knownFields[ftype])[0]
+        n_block = max(
+            1, int(self.max_adjoint_block * 1e6 // (8 * (3 * n_fields + out.shape[1])))
+        )
+
+        Ps = self._receiver_projections(f)
+        receivers = []
+        offset = 0
+        for i, src in enumerate(self.survey.source_list):
+            for rx, P in zip(src.receiver_list, Ps[i]):
+                receivers.append((i, src, rx, P, offset))
+                offset += rx.nD
+
+        for start in range(0, self.survey.nD, n_block):
+            stop = min(start + n_block, self.survey.nD)
+            block = []
+            for i, src, rx, P, offset in receivers:
+                rows = np.arange(max(start, offset), min(stop, offset + rx.nD))
+                if rows.size > 0:
+                    block.append((i, src, rx, P[rows - offset], rows - start))
+            out[start:stop] = self._Jtmatrix_block(f, block, stop - start).T
+        return out
+
+    def _Jtmatrix_block(self, f, block, n_data):
+        """
+        Transposed rows (nP, n_data) of J of a block of data, from their
+        adjoint problems solved together through time. The block lists the
+        source index, source, receiver, projection and columns of the data of
+        each of its receivers.
+        """
+        source_list = self.survey.source_list
+        srcII = np.empty(n_data, dtype=int)
+        for i, src, rx, P, cols in block:
+            srcII[cols] = i
+
+        JT = np.zeros((self.model.size, n_data))
+        ATinv_df_duT_v = None
+
+        for tInd, u in self._reversed_time_levels(f):
+            # adjoint of the receivers at this time level
+            df_duT_v = np.zeros((u.shape[0], n_data))
+            for i, src, rx, P, cols in block:
+                PT = _time_level(P, tInd, self.nT + 1).T.toarray()
+                df_duTFun = getattr(f, "_{}Deriv".format(rx.projField), None)
+                cur = df_duTFun(tInd, src, None, PT, adjoint=True)
+                df_duT_v[:, cols] += _columns(cur[0], (u.shape[0], cols.size))
+                JT[:, cols] += _columns(cur[1], (JT.shape[0], cols.size))
+
+            if ATinv_df_duT_v is None:
+                ATinv_df_duT_v = np.zeros(df_duT_v.shape)
+            if tInd < self.nT:
+                ATinv_df_duT_v = self._Jtvec_solve(tInd, df_duT_v_next, ATinv_df_duT_v)
+                for i in np.unique(srcII):
+                    cols = np.flatnonzero(srcII == i)
+                    JT_t = self._JtvecDeriv(
+                        tInd,
+                        source_list[i],
+                        u[:, i],
+                        un[:, i],
+                        ATinv_df_duT_v[:, cols],
+                    )
+                    JT[:, cols] += _columns(JT_t, (JT.shape[0], cols.size))
+
+            df_duT_v_next, un = df_duT_v, u
+
+        # Treat the initial condition
+        for j, i in enumerate(srcII):
+            JT[:, j] = JT[:, j] + self._JtvecInitialCondition(
+                source_list[i], df_duT_v[:, j], ATinv_df_duT_v[:, j], u[:, i]
+            )
+
+        return JT
+
+    def _Jvec_time_step(self, tInd, u, un, dun_dm_v, v):
+        """
+        Derivative of the solution of all sources at tInd + 1 times v, from
+        that at tInd. The solutions at tInd and tInd + 1 are u and un, the
+        derivatives are (nP, nSrc).
+        """
+        shape = dun_dm_v.shape
+
+        # factors shared with fields
+        Adiaginv = self._get_Ainv(tInd)
+        Asubdiag = self.getAsubdiag(tInd)
+
+        # cell centered on time mesh
+        dA_dm_v = self.getAdiagDeriv(tInd, un, v)
+        # on nodes of time mesh
+        dRHS_dm_v = self._getRHSDerivSources(tInd + 1, v)
+        dAsubdiag_dm_v = self.getAsubdiagDeriv(tInd, u, v)
+
+        JRHS = (
+            _columns(dRHS_dm_v, shape)
+            - _columns(dAsubdiag_dm_v, shape)
+            - _columns(dA_dm_v, shape)
+        )
+
+        return _columns(Adiaginv * (JRHS - Asubdiag * dun_dm_v), shape)
+
+    def _Jtvec_time_step(self, tInd, u, un, df_duT_v, ATinv_df_duT_v):
+        """
+        Back-solve the time step tInd for all sources, from df_duT_v at
+        tInd + 1 and the solution of the adjoint problem at tInd + 1. The
+        solutions at tInd and tInd + 1 are u and un. Returns the solution of
+        the adjoint problem at tInd, (nP, nSrc), and its contribution to
+        Jtvec.
+        """
+        ATinv_df_duT_v = self._Jtvec_solve(tInd, df_duT_v, ATinv_df_duT_v)
+
+        dAsubdiagT_dm_v = self.getAsubdiagDeriv(tInd, u, ATinv_df_duT_v, adjoint=True)
+
+        # on nodes of time mesh
+        dRHST_dm_v = self._getRHSDerivSources(tInd + 1, ATinv_df_duT_v, adjoint=True)
+
+        # cell centered on time mesh
+        dAT_dm_v = self.getAdiagDeriv(tInd, un, ATinv_df_duT_v, adjoint=True)
+
+        return ATinv_df_duT_v, -dAT_dm_v - dAsubdiagT_dm_v + dRHST_dm_v
+
+    def _Jtvec_solve(self, tInd, df_duT_v, ATinv_df_duT_v):
+        """
+        Solution (nP, n) of the adjoint problems at tInd, from df_duT_v at
+        tInd + 1 and their solution at tInd + 1.
+        """
+        shape = ATinv_df_duT_v.shape
+
+        # factors of the transposed system, those of fields if symmetric
+        AdiagTinv = self._get_Ainv(tInd, adjoint=True)
+
+        df_duT_v = _columns(df_duT_v, shape)
+        if tInd < self.nT - 1:
+            Asubdiag = self.getAsubdiag(tInd + 1)
+            df_duT_v = df_duT_v - Asubdiag.T * ATinv_df_duT_v
+
+        return _columns(AdiagTinv * df_duT_v, shape)
+
+    def _JtvecDeriv(self, tInd, src, u, un, ATinv_df_duT_v):
+        """
+        Contribution of the time step tInd to Jtvec, for the solutions
+        (nP, n) of the adjoint problems of a source at tInd. The solutions of
+        the source at tInd and tInd + 1 are u and un.
+        """
+        dAsubdiagT_dm_v = self.getAsubdiagDeriv(tInd, u, ATinv_df_duT_v, adjoint=True)
+        # on nodes of time mesh
+        dRHST_dm_v = self.getRHSDeriv(tInd + 1, src, ATinv_df_duT_v, adjoint=True)
+        # cell centered on time mesh
+        dAT_dm_v = self.getAdiagDeriv(tInd, un, ATinv_df_duT_v, adjoint=True)
+        return -dAT_dm_v - dAsubdiagT_dm_v + dRHST_dm_v
+
+    def _getRHSDerivSources(self, tInd, v, adjoint=False):
+        """
+        Derivative of the RHS of all sources times v, (nP, nSrc), or its
+        adjoint summed over the sources for v (nP, nSrc).
+        """
+        source_list = self.survey.source_list
+        if adjoint:
+            RHSDeriv = Zero()
+            for i, src in enumerate(source_list):
+                RHSDeriv = RHSDeriv + self.getRHSDeriv(tInd, src, v[:, i], adjoint=True)
+            return RHSDeriv
+
+        RHSDeriv = Zero()
+        for i, src in enumerate(source_list):
+            RHSDeriv_src = self.getRHSDeriv(tInd, src, v)
+            if isinstance(RHSDeriv_src, Zero):
+                continue
+            RHSDeriv_src = mkvc(RHSDeriv_src)
+            if isinstance(RHSDeriv, Zero):
+                RHSDeriv = np.zeros((RHSDeriv_src.size, len(source_list)))
+            RHSDeriv[:, i] = RHSDeriv_src
+        return RHSDeriv
+
+    def _JtvecInitialCondition(self, src, df_duT_v, ATinv_df_duT_v, u):
+        """
+        Adjoint contribution of the initial fields of a source to Jtvec, from
+        the adjoint of the fields at the first time level, that of the first
+        time step and the initial fields.
+        """
+        return Zero()
+
+    @property
+    def _symmetric_system(self):
+        """
+        Whether the system matrices are symmetric, so that their factors also
+        solve the adjoint problems
+        """
+        return self._fieldType in ["e", "h"] or self._makeASymmetric
+
+    def _get_Ainv(self, tInd, adjoint=False):
+        """
+        Factorization of the system matrix at a time index, or of its
+        transpose for the adjoint problem.
+
+        Factorizations are held for the distinct time step sizes, within
+        dt_threshold, and shared by fields, Jvec and Jtvec until the model
+        changes. The transposed system is only factored if the system is not
+        symmetric. At most max_factors factorizations are held.
+        """
+        if getattr(self, "_Ainv", None) is None:
+            self._Ainv = _Factorizations()
+        self._Ainv.max_factors = self.max_factors
+
+        dt = self.time_steps[tInd]
+        transpose = adjoint and not self._symmetric_system
+        for key_dt, key_transpose in self._Ainv:
+            if key_transpose == transpose and abs(key_dt - dt) <= self.dt_threshold:
+                dt = key_dt
+                break
+
+        def factor():
+            A = self.getAdiag(tInd)
+            if transpose:
+                A = A.T
+            if self.verbose:
+                print("Factoring...   (dt = {:e})".format(dt))
+            return self.solver(A, **self.solver_opts)
+
+        return self._Ainv.get((dt, transpose), factor)
+
     def getSourceTerm(self, tInd):
         """
         Assemble the source term. This ensures that the RHS is a vector / array
@@ -442,6 +988,60 @@ class BaseTDEMSimulation(BaseTimeSimulation, BaseEMSimulation):
         return self._Adcinv
 
 
+def _columns(x, shape):
+    """
+    Array (nP, nSrc) of the fields of all sources, of zeros for a Zero.
+    """
+    if isinstance(x, Zero):
+        return np.zeros(shape)
+    return np.reshape(x, shape, order="F")
+
+
+def _time_level(P, tInd, n_levels):
+    """
+    Columns of a projection of all the time levels acting on one of them.
+    """
+    n = P.shape[1] // n_levels
+    return P[:, tInd * n : (tInd + 1) * n]
+
+
+class _Factorizations(object):
+    """
+    Factorizations of the system matrices, keyed by time step size, cleaned
+    in least recently used order beyond max_factors.
+    """
+
+    def __init__(self, max_factors=None):
+        self.max_factors = max_factors
+        self._factors = OrderedDict()
+
+    def __iter__(self):
+        return iter(list(self._factors))
+
+    def __len__(self):
+        return len(self._factors)
+
+    def get(self, key, factor):
+        """
+        Factorization of a key, from ``factor()`` if it is not held.
+        """
+        if key in self._factors:
+            self._factors.move_to_end(key)
+            return self._factors[key]
+
+        Ainv = factor()
+        self._factors[key] = Ainv
+        while self.max_factors is not None and len(self._factors) > self.max_factors:
+            _, oldest = self._factors.popitem(last=False)
+            oldest.clean()
+        return Ainv
+
+    def clean(self):
+        for Ainv in self._factors.values():
+            Ainv.clean()
+        self._factors.clear()
+
+
 ###############################################################################
 #                                                                             #
 #                                E-B Formulation                              #
@@ -633,6 +1233,37 @@ class Simulation3DMagneticFluxDensity(BaseTDEMSimulation):
             return self.MfMui.T * RHSDeriv
         return RHSDeriv
 
+    def _getRHSDerivSources(self, tInd, v, adjoint=False):
+        C = self.mesh.edgeCurl
+        MeSigmaI = self.MeSigmaI
+        MfMui = self.MfMui
+
+        _, s_e = self.getSourceTerm(tInd)
+        source_list = self.survey.source_list
+
+        if adjoint:
+            if self._makeASymmetric is True:
+                v = MfMui * v
+            CT_v = C.T * v
+            RHSDeriv = self.MeSigmaIDeriv(s_e, CT_v, adjoint)
+
+            MeSigmaIT_CT_v = MeSigmaI.T * CT_v
+            for i, src in enumerate(source_list):
+                s_mDeriv, s_eDeriv = src.evalDeriv(
+                    self, self.times[tInd], adjoint=adjoint
+                )
+                RHSDeriv = RHSDeriv + s_eDeriv(MeSigmaIT_CT_v[:, i]) + s_mDeriv(v[:, i])
+            return RHSDeriv
+
+        RHSDeriv = C * _columns(self.MeSigmaIDeriv(s_e, v, adjoint), s_e.shape)
+        for i, src in enumerate(source_list):
+            s_mDeriv, s_eDeriv = src.evalDeriv(self, self.times[tInd], adjoint=adjoint)
+            RHSDeriv[:, i] = RHSDeriv[:, i] + C * MeSigmaI * s_eDeriv(v) + s_mDeriv(v)
+
+        if self._makeASymmetric is True:
+            return self.MfMui.T * RHSDeriv
+        return RHSDeriv
+
 
 # ------------------------------- Simulation3DElectricField ------------------------------- #
 class Simulation3DElectricField(BaseTDEMSimulation):
@@ -676,167 +1307,25 @@ class Simulation3DElectricField(BaseTDEMSimulation):
     fieldsPair = Fields3DElectricField  #: A Fields3DElectricField
     Fields_Derivs = FieldsDerivativesEB
 
-    # @profile
-    def Jtvec(self, m, v, f=None):
-
-        """
-        Jvec computes the adjoint of the sensitivity times a vector
-        """
-
-        if f is None:
-            f = self.fields(m)
-
-        self.model = m
-        ftype = self._fieldType + "Solution"  # the thing we solved for
-
-        # Ensure v is a data object.
-        if not isinstance(v, Data):
-            v = Data(self.survey, v)
-
-        df_duT_v = self.Fields_Derivs(self)
-
-        # same size as fields at a single timestep
-        ATinv_df_duT_v = np.zeros(
-            (
-                len(self.survey.source_list),
-                len(f[self.survey.source_list[0], ftype, 0]),
-            ),
-            dtype=float,
-        )
-        JTv = np.zeros(m.shape, dtype=float)
-
-        # Loop over sources and receivers to create a fields object:
-        # PT_v, df_duT_v, df_dmT_v
-        # initialize storage for PT_v (don't need to preserve over sources)
-        PT_v = self.Fields_Derivs(self)
-        for src in self.survey.source_list:
-            # Looping over initializing field class is appending memory!
-            # PT_v = Fields_Derivs(self.mesh) # initialize storage
-            # #for PT_v (don't need to preserve over sources)
-            # initialize size
-            df_duT_v[src, "{}Deriv".format(self._fieldType), :] = np.zeros_like(
-                f[src, self._fieldType, :]
-            )
-
-            for rx in src.receiver_list:
-                PT_v[src, "{}Deriv".format(rx.projField), :] = rx.evalDeriv(
-                    src, self.mesh, self.time_mesh, f, mkvc(v[src, rx]), adjoint=True
-                )
-                # this is +=
-
-                # PT_v = np.reshape(curPT_v,(len(curPT_v)/self.time_mesh.nN,
-                # self.time_mesh.nN), order='F')
-                df_duTFun = getattr(f, "_{}Deriv".format(rx.projField), None)
-
-                for tInd in range(self.nT + 1):
-                    cur = df_duTFun(
-                        tInd,
-                        src,
-                        None,
-                        mkvc(PT_v[src, "{}Deriv".format(rx.projField), tInd]),
-                        adjoint=True,
-                    )
-
-                    df_duT_v[src, "{}Deriv".format(self._fieldType), tInd] = df_duT_v[
-                        src, "{}Deriv".format(self._fieldType), tInd
-                    ] + mkvc(cur[0], 2)
-                    JTv = cur[1] + JTv
-
-        # no longer need this
-        del PT_v
-
-        AdiagTinv = None
-
-        # Do the back-solve through time
-        # if the previous timestep is the same: no need to refactor the matrix
-        # for tInd, dt in zip(range(self.nT), self.time_steps):
+    def _JtvecInitialCondition(self, src, df_duT_v, ATinv_df_duT_v, u):
+        if src.srcType != "galvanic":
+            return Zero()
 
-        for tInd in reversed(range(self.nT)):
-            # tInd = tIndP - 1
-            if AdiagTinv is not None and (
-                tInd <= self.nT and self.time_steps[tInd] != self.time_steps[tInd + 1]
-            ):
-                AdiagTinv.clean()
-                AdiagTinv = None
-
-            # refactor if we need to
-            if AdiagTinv is None:  # and tInd > -1:
-                Adiag = self.getAdiag(tInd)
-                AdiagTinv = self.solver(Adiag.T, **self.solver_opts)
-
-            if tInd < self.nT - 1:
-                Asubdiag = self.getAsubdiag(tInd + 1)
-
-            for isrc, src in enumerate(self.survey.source_list):
-
-                # solve against df_duT_v
-                if tInd >= self.nT - 1:
-                    # last timestep (first to be solved)
-                    ATinv_df_duT_v[isrc, :] = (
-                        AdiagTinv
-                        * df_duT_v[src, "{}Deriv".format(self._fieldType), tInd + 1]
-                    )
-                elif tInd > -1:
-                    ATinv_df_duT_v[isrc, :] = AdiagTinv * (
-                        mkvc(df_duT_v[src, "{}Deriv".format(self._fieldType), tInd + 1])
-                        - Asubdiag.T * mkvc(ATinv_df_duT_v[isrc, :])
-                    )
-
-                dAsubdiagT_dm_v = self.getAsubdiagDeriv(
-                    tInd, f[src, ftype, tInd], ATinv_df_duT_v[isrc, :], adjoint=True
-                )
-
-                dRHST_dm_v = self.getRHSDeriv(
-                    tInd + 1, src, ATinv_df_duT_v[isrc, :], adjoint=True
-                )  # on nodes of time mesh
-
-                un_src = f[src, ftype, tInd + 1]
-                # cell centered on time mesh
-                dAT_dm_v = self.getAdiagDeriv(
-                    tInd, un_src, ATinv_df_duT_v[isrc, :], adjoint=True
-                )
-
-                JTv = JTv + mkvc(-dAT_dm_v - dAsubdiagT_dm_v + dRHST_dm_v)
-
-        # Treating initial condition when a galvanic source is included
-        tInd = -1
         Grad = self.mesh.nodalGrad
+        Asubdiag = self.getAsubdiag(0)
 
-        for isrc, src in enumerate(self.survey.source_list):
-            if src.srcType == "galvanic":
-
-                ATinv_df_duT_v[isrc, :] = Grad * (
-                    self.Adcinv
-                    * (
-                        Grad.T
-                        * (
-                            mkvc(
-                                df_duT_v[
-                                    src, "{}Deriv".format(self._fieldType), tInd + 1
-                                ]
-                            )
-                            - Asubdiag.T * mkvc(ATinv_df_duT_v[isrc, :])
-                        )
-                    )
-                )
-
-                dRHST_dm_v = self.getRHSDeriv(
-                    tInd + 1, src, ATinv_df_duT_v[isrc, :], adjoint=True
-                )  # on nodes of time mesh
-
-                un_src = f[src, ftype, tInd + 1]
-                # cell centered on time mesh
-                dAT_dm_v = self.MeSigmaDeriv(
-                    un_src, ATinv_df_duT_v[isrc, :], adjoint=True
-                )
+        ATinv_df_duT_v = Grad * (
+            self.Adcinv * (Grad.T * (df_duT_v - Asubdiag.T * ATinv_df_duT_v))
+        )
 
-                JTv = JTv + mkvc(-dAT_dm_v + dRHST_dm_v)
+        dRHST_dm_v = self.getRHSDeriv(
+            0, src, ATinv_df_duT_v, adjoint=True
+        )  # on nodes of time mesh
 
-        # del df_duT_v, ATinv_df_duT_v, A, Asubdiag
-        if AdiagTinv is not None:
-            AdiagTinv.clean()
+        # cell centered on time mesh
+        dAT_dm_v = self.MeSigmaDeriv(u, ATinv_df_duT_v, adjoint=True)
 
-        return mkvc(JTv).astype(float)
+        return mkvc(-dAT_dm_v + dRHST_dm_v)
 
     def getAdiag(self, tInd):
         """
@@ -1147,3 +1636,237 @@ class Simulation3DCurrentDensity(BaseTDEMSimulation):
             #      self.MfRhoIDeriv(G * u, D.T * v, adjoint=True)
             return self.MfRhoIDeriv(G * u, G * v, adjoint=True)
         return D * self.MfRhoIDeriv(G * u, v)
+
+
+# ------------------------------- Simulation3DWaveformConvolution ------------------------------- #
+class Simulation3DWaveformConvolution(BaseSimulation):
+    """
+    TDEM simulation of sources of any waveform, by convolution of the step-off
+    responses of a TDEM simulation.
+
+    The TDEM simulation solves the responses to the sources switched off at
+    0, on a time mesh from 0 whose time steps need not resolve the ramps of
+    the waveforms. Its survey is set to a step-off source for each distinct
+    source of the survey apart from its waveform, with receivers sampling the
+    time levels. The data of each source are the convolution of the step-off
+    responses with its waveform, by
+    :func:`SimPEG.electromagnetics.time_domain.convolution.waveform_convolution_matrix`.
+    Sources of different waveforms thus share their step-off responses, and
+    the sensitivities are those of the TDEM simulation convolved with the
+    waveforms. The receivers measure off-time data.
+
+    .. code:: python
+
+        step_off = tdem.Simulation3DMagneticFluxDensity(
+            mesh, time_steps=[(1e-6, 10), (1e-5, 10), (1e-4, 10)], sigmaMap=mapping
+        )
+        simulation = tdem.Simulation3DWaveformConvolution(step_off, survey=survey)
+    """
+
+    survey = properties.Instance("a survey object", Survey, required=True)
+
+    simulation = properties.Instance(
+        "TDEM simulation of the step-off responses", BaseTDEMSimulation, required=True
+    )
+
+    n_waveform_samples = properties.Integer(
+        "Number of evenly spaced samples of the current of a waveform between 0 "
+        "and its off time, the times of its ramps and peak included",
+        default=100,
+        min=2,
+    )
+
+    _convolution = None
+    _convolution_time_mesh = None
+    _Jmatrix = None
+    gtgdiag = None
+
+    def __init__(self, simulation=None, **kwargs):
+        if simulation is not None:
+            kwargs["simulation"] = simulation
+            kwargs.setdefault("mesh", simulation.mesh)
+        super().__init__(**kwargs)
+
+    @properties.observer(["survey", "simulation", "n_waveform_samples"])
+    def _remove_convolution_on_update(self, change):
+        self._convolution = None
+
+    @property
+    def convolution(self):
+        """
+        Sparse matrix (nD, nD_step_off) convolving the data of the step-off
+        sources with the waveforms of the sources.
+        """
+        time_mesh = self.simulation.time_mesh
+        if self._convolution is None or self._convolution_time_mesh is not time_mesh:
+            if self.simulation.t0 != 0.0:
+                raise ValueError(
+                    "The step-off responses are simulated from 0, the time mesh "
+                    "of the simulation starts at {}".format(self.simulation.t0)
+                )
+            self._convolution = self._step_off_convolution()
+            self._convolution_time_mesh = time_mesh
+        return self._convolution
+
+    def _step_off_convolution(self):
+        """
+        Set the survey of the TDEM simulation to the step-off sources, and
+        return the convolution of their data.
+        """
+        step_off = OrderedDict()
+        keys = []
+        for src in self.survey.source_list:
+            src_key = _source_key(src)
+            receivers = step_off.setdefault(src_key, (src, OrderedDict()))[1]
+            rx_keys = []
+            for rx in src.receiver_list:
+                rx_key = _receiver_key(rx)
+                if rx_key not in receivers:
+                    receivers[rx_key] = type(rx)(
+                        locations=rx.locations,
+                        times=self.simulation.times,
+                        orientation=rx.orientation,
+                    )
+                rx_keys.append(rx_key)
+            keys.append((src_key, rx_keys))
+
+        source_list = []
+        offsets = {}
+        nD = 0
+        for src_key, (src, receivers) in step_off.items():
+            source_list.append(_step_off_source(src, list(receivers.values())))
+            for rx_key, rx in receivers.items():
+                offsets[src_key, rx_key] = nD
+                nD += rx.nD
+        self.simulation.survey = Survey(source_list)
+
+        Q = []
+        for src, (src_key, rx_keys) in zip(self.survey.source_list, keys):
+            for rx, rx_key in zip(src.receiver_list, rx_keys):
+                Qt = waveform_convolution_matrix(
+                    src.waveform,
+                    rx.times,
+                    self.simulation.time_mesh,
+                    n_samples=self.n_waveform_samples,
+                )
+                # the data are ordered by time, then location
+                Q_rx = sp.coo_matrix(sp.kron(Qt, speye(rx.nD // len(rx.times))))
+                Q.append(
+                    sp.coo_matrix(
+                        (Q_rx.data, (Q_rx.row, Q_rx.col + offsets[src_key, rx_key])),
+                        shape=(rx.nD, nD),
+                    )
+                )
+        return sp.csr_matrix(sp.vstack(Q))
+
+    def fields(self, m=None):
+        """
+        Step-off fields of the TDEM simulation.
+
+        :param numpy.ndarray m: inversion model (nP,)
+        :rtype: SimPEG.electromagnetics.time_domain.fields.FieldsTDEM
+        :return f: fields object
+        """
+        if m is not None:
+            self.model = m
+        # the step-off sources of the simulation are set with the convolution
+        self.convolution
+        return self.simulation.fields(self.model)
+
+    def dpred(self, m=None, f=None):
+        if f is None:
+            f = self.fields(m)
+        return self.convolution @ self.simulation.dpred(f=f)
+
+    def Jvec(self, m, v, f=None):
+        """
+        Sensitivity times a vector, the step-off sensitivity convolved with
+        the waveforms.
+        """
+        if f is None:
+            f = self.fields(m)
+        self.model = m
+        return self.convolution @ self.simulation.Jvec(m, v, f=f)
+
+    def Jtvec(self, m, v, f=None):
+        """
+        Adjoint sensitivity times a vector.
+        """
+        if f is None:
+            f = self.fields(m)
+        self.model = m
+        if isinstance(v, Data):
+            v = v.dobs
+        return self.simulation.Jtvec(m, self.convolution.T @ v, f=f)
+
+    def getJ(self, m, f=None):
+        """
+        Sensitivity matrix (nD, nP), from that of the TDEM simulation.
+        """
+        self.model = m
+        if self._Jmatrix is None:
+            if f is None:
+                f = self.fields(m)
+            J = self.simulation.getJ(m, f=f)
+            if isinstance(J, MemmapSensitivity):
+                # read the step-off sensitivities by blocks of rows
+                self._Jmatrix = (J.T @ self.convolution.T.toarray()).T
+            else:
+                self._Jmatrix = self.convolution @ J
+        return self._Jmatrix
+
+    def getJtJdiag(self, m, W=None):
+        """
+        Return the diagonal of JtJ
+        """
+        if self.gtgdiag is None:
+            J = self.getJ(m)
+
+            if W is None:
+                W = np.ones(J.shape[0])
+            else:
+                W = W.diagonal() ** 2
+
+            self.gtgdiag = np.einsum("i,ij,ij->j", W, J, J)
+        return self.gtgdiag
+
+    @property
+    def deleteTheseOnModelUpdate(self):
+        toDelete = super().deleteTheseOnModelUpdate
+        if self._Jmatrix is not None:
+            toDelete = toDelete + ["_Jmatrix"]
+        if self.gtgdiag is not None:
+            toDelete = toDelete + ["gtgdiag"]
+        return toDelete
+
+
+def _source_key(src):
+    """
+    Hash of a source apart from its waveform and receivers.
+    """
+    values = [type(src).__name__]
+    for name in sorted(src._props):
+        if name not in ["_uid", "receiver_list", "waveform"]:
+            value = getattr(src, name)
+            values += [name, "None" if value is None else value]
+    return hash_arrays(*values)
+
+
+def _receiver_key(rx):
+    """
+    Hash of a receiver apart from its times.
+    """
+    return hash_arrays(type(rx).__name__, rx.locations, str(rx.orientation))
+
+
+def _step_off_source(src, receiver_list):
+    """
+    Copy of a source with a step-off waveform, switched off at 0.
+    """
+    kwargs = {
+        name: getattr(src, name)
+        for name in src._props
+        if name not in ["_uid", "receiver_list", "waveform"]
+        and getattr(src, name) is not None
+    }
+    return type(src)(receiver_list=receiver_list, waveform=StepOffWaveform(), **kwargs)
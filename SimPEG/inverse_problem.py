@@ -145,6 +145,10 @@ class BaseInvProblem(BaseSimPEG):
             if isinstance(self.dmisfit, BaseDataMisfit):
                 f = self.dmisfit.simulation.fields(m)
 
+            elif hasattr(self.dmisfit, "fields"):
+                # Combined misfits evaluating the fields of their simulations
+                f = self.dmisfit.fields(m)
+
             elif isinstance(self.dmisfit, BaseObjectiveFunction):
                 f = []
                 for objfct in self.dmisfit.objfcts:
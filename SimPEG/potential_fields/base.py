@@ -1,11 +1,28 @@
-import os
 import discretize
 import properties
 import numpy as np
-import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from ..simulation import LinearSimulation
+import scipy.sparse as sp
 from scipy.sparse import csr_matrix as csr
 from SimPEG.utils import mkvc
+from .compression import CompressedSensitivity, morton_ordering
+from SimPEG.utils.code_utils import hash_arrays
+from SimPEG.utils.parallel_utils import (
+    fork_available,
+    shared_array,
+    worker_executor,
+)
+from .sensitivity_cache import SensitivityCache
+from .chunked import ChunkedSensitivity, chunk_index
+from .convolution import ConvolutionSensitivity
+from .far_field import (
+    FarFieldSensitivity,
+    cluster_cells,
+    group_by_cluster,
+    interaction_lists,
+)
 
 ###############################################################################
 #                                                                             #
@@ -19,15 +36,77 @@ class BasePFSimulation(LinearSimulation):
         "Array of active cells (ground)", dtype=(bool, int), default=None
     )
 
-    n_cpu = properties.Integer(
-        "Number of processors used for the forward simulation",
-        default=int(multiprocessing.cpu_count()),
+    store_sensitivities = properties.StringChoice(
+        "Compute and store G",
+        choices=["disk", "ram", "forward_only", "compressed"],
+        default="ram",
     )
 
-    store_sensitivities = properties.StringChoice(
-        "Compute and store G", choices=["disk", "ram", "forward_only"], default="ram"
+    sensitivity_cache_size = properties.Float(
+        "Maximum disk space (GB) of the sensitivity cache used with "
+        "store_sensitivities='disk'. Least recently used rows are evicted "
+        "beyond it. Unbounded if not set.",
+        min=0.0,
+    )
+
+    sensitivity_chunk_size = properties.Float(
+        "Size (MB) of the chunks of rows of G streamed from disk with "
+        "store_sensitivities='disk'",
+        default=128.0,
+        min=0.0,
     )
 
+    compression_tolerance = properties.Float(
+        "Relative L2 accuracy of the rows of G stored with "
+        "store_sensitivities='compressed'",
+        default=1e-2,
+        min=0.0,
+    )
+
+    receiver_block_size = properties.Integer(
+        "Number of receivers evaluated at once by the vectorized kernel. "
+        "Blocks are sized from max_block_size if not set. With "
+        "store_sensitivities='forward_only', only one block of rows of G is held "
+        "in memory at a time.",
+        min=1,
+    )
+
+    engine = properties.StringChoice(
+        "Method applying G. 'fft' convolves the depth slices of a TensorMesh, "
+        "uniform in x and y, with receivers gridded at the cell spacing and at a "
+        "constant height, without forming G. 'far_field' approximates the "
+        "contributions of clusters of cells far from the receivers to "
+        "far_field_accuracy.",
+        choices=["integral", "fft", "far_field"],
+        default="integral",
+    )
+
+    far_field_accuracy = properties.Float(
+        "Relative accuracy of the far field contributions of engine='far_field'. "
+        "Clusters of cells far enough from a receiver for their first order "
+        "expansion to reach it are reduced to their monopole and dipole moments.",
+        default=1e-2,
+        min=0.0,
+    )
+
+    n_workers = properties.Integer(
+        "Number of worker processes used to compute the sensitivities",
+        default=1,
+        min=1,
+    )
+
+    max_block_size = properties.Float(
+        "Size (MB) of the rows of G of a block of receivers, (receivers x "
+        "components x cells) doubles, setting the number of receivers of a "
+        "block if receiver_block_size is not set. Temporaries of the vectorized "
+        "kernel take a few times this memory.",
+        default=128.0,
+        min=0.0,
+    )
+
+    #: Maximum number of cells of the clusters evaluated exactly by engine='far_field'
+    far_field_leaf_size = 32
+
     def __init__(self, mesh, **kwargs):
 
         LinearSimulation.__init__(self, mesh, **kwargs)
@@ -70,53 +149,475 @@ class BasePFSimulation(LinearSimulation):
 
         self.nC = self.modelMap.shape[0]
 
-        components = np.array(list(self.survey.components.keys()))
-        active_components = np.hstack(
-            [np.c_[values] for values in self.survey.components.values()]
-        ).tolist()
-        nD = self.survey.nD
+        if self.store_sensitivities == "compressed":
+            return self._compressed_linear_operator()
 
         if self.store_sensitivities == "disk":
-            sens_name = self.sensitivity_path + "sensitivity.npy"
-            if os.path.exists(sens_name):
-                # do not pull array completely into ram, just need to check the size
-                kernel = np.load(sens_name, mmap_mode="r")
-                if kernel.shape == (nD, self.nC):
-                    print(f"Found sensitivity file at {sens_name} with expected shape")
-                    kernel = np.asarray(kernel)
-                    return kernel
-        # Single threaded
-        if self.store_sensitivities != "forward_only":
-            kernel = np.vstack(
-                [
-                    self.evaluate_integral(receiver, components[component])
-                    for receiver, component in zip(
-                        self.survey.receiver_locations.tolist(), active_components
-                    )
-                ]
+            return self._cached_linear_operator()
+
+        return self._compute_rows()
+
+    def _convolution_linear_operator(self):
+        """
+        Build the :class:`SimPEG.potential_fields.convolution.ConvolutionSensitivity`
+        of the simulation from the kernel of one cell of every depth slice,
+        evaluated for all horizontal offsets between the receivers and the cells.
+        """
+        self.nC = self.modelMap.shape[0]
+
+        mesh = self.mesh
+        if not isinstance(mesh, discretize.TensorMesh) or mesh.dim != 3:
+            raise ValueError("The 'fft' engine requires a 3D TensorMesh.")
+
+        hx, hy = mesh.h[0], mesh.h[1]
+        if np.ptp(hx) > 1e-6 * hx[0] or np.ptp(hy) > 1e-6 * hy[0]:
+            raise ValueError(
+                "The 'fft' engine requires a mesh with uniform cells along x and y."
+            )
+
+        locations = self.survey.receiver_locations
+        if np.ptp(locations[:, 2]) > 1e-6 * mesh.h[2].min():
+            raise ValueError(
+                "The 'fft' engine requires all receivers at the same height."
             )
+
+        # Indices of the receivers on a grid at the cell spacing
+        origin = locations[:, :2].min(axis=0)
+        offsets = (locations[:, 1::-1] - origin[::-1]) / np.r_[hy[0], hx[0]]
+        receiver_indices = np.round(offsets).astype(int)
+        if np.abs(offsets - receiver_indices).max() > 1e-6:
+            raise ValueError(
+                "The 'fft' engine requires receivers gridded at the cell spacing "
+                "of the mesh."
+            )
+        nry, nrx = receiver_indices.max(axis=0) + 1
+        nx, ny, nz = mesh.shape_cells
+
+        # Kernel of the first cell of every slice, for receivers at all offsets
+        x = origin[0] + hx[0] * np.arange(-(nx - 1), nrx)
+        y = origin[1] + hy[0] * np.arange(-(ny - 1), nry)
+        X, Y = np.meshgrid(x, y)
+        virtual_locations = np.c_[
+            X.ravel(), Y.ravel(), np.full(X.size, locations[0, 2])
+        ]
+        nodes = np.ones((nz, 1))
+        Xn = nodes * mesh.nodes_x[:2]
+        Yn = nodes * mesh.nodes_y[:2]
+        Zn = np.c_[mesh.nodes_z[:-1], mesh.nodes_z[1:]]
+
+        components = list(self.survey.components.keys())
+        n_block = self._block_size(nz, len(components))
+        kernel = np.vstack(
+            [
+                self._reference_kernel(
+                    virtual_locations[start : start + n_block], components, Xn, Yn, Zn
+                )
+                for start in range(0, len(virtual_locations), n_block)
+            ]
+        )
+        kernel = kernel.reshape((len(y), len(x), len(components), -1, nz))
+        kernel = kernel.transpose((2, 3, 4, 0, 1))
+
+        if getattr(self, "actInd", None) is not None:
+            indices = np.arange(mesh.nC)[self.actInd]
         else:
-            kernel = np.hstack(
-                [
-                    self.evaluate_integral(receiver, components[component]).dot(
-                        self.model
-                    )
-                    for receiver, component in zip(
-                        self.survey.receiver_locations.tolist(), active_components
+            indices = np.arange(mesh.nC)
+        projection = csr(
+            (np.ones(len(indices)), (indices, range(len(indices)))),
+            shape=(mesh.nC, len(indices)),
+        )
+
+        active_components = np.hstack(
+            [np.c_[values] for values in self.survey.components.values()]
+        )
+
+        return ConvolutionSensitivity(
+            kernel,
+            (nz, ny, nx),
+            receiver_indices,
+            np.flatnonzero(active_components.ravel()),
+            projection,
+            mapping=self._kernel_mapping(),
+        )
+
+    def _far_field_linear_operator(self):
+        """
+        Build the :class:`SimPEG.potential_fields.far_field.FarFieldSensitivity`
+        of the simulation from the exact kernel of the clusters of cells near
+        every receiver, and the expansion coefficients of the clusters in its
+        far field.
+        """
+        self.nC = self.modelMap.shape[0]
+
+        lower = np.c_[self.Xn[:, 0], self.Yn[:, 0], self.Zn[:, 0]]
+        upper = np.c_[self.Xn[:, 1], self.Yn[:, 1], self.Zn[:, 1]]
+        n_cells = lower.shape[0]
+        clusters = cluster_cells(lower, upper, leaf_size=self.far_field_leaf_size)
+
+        locations = self.survey.receiver_locations
+        near_pairs, far_pairs = interaction_lists(
+            clusters, locations, self.far_field_accuracy
+        )
+
+        # Data row of every receiver and component, -1 if not measured
+        components = list(self.survey.components.keys())
+        active_components = np.hstack(
+            [np.c_[values] for values in self.survey.components.values()]
+        )
+        data_rows = -np.ones(active_components.shape, dtype=int)
+        data_rows[active_components] = np.arange(active_components.sum())
+
+        # Blocks of columns of the kernel, one per magnetization component
+        n_segments = self._reference_kernel(
+            locations[:1], components, self.Xn[:1], self.Yn[:1], self.Zn[:1]
+        ).shape[1]
+
+        # Exact rows of the leaves near the receivers
+        near = ([], [], [])
+        for leaf, receivers in group_by_cluster(near_pairs):
+            cells = clusters["ordering"][
+                clusters["start"][leaf] : clusters["end"][leaf]
+            ]
+            kernel = self._reference_kernel(
+                locations[receivers],
+                components,
+                self.Xn[cells],
+                self.Yn[cells],
+                self.Zn[cells],
+            )
+            columns = n_cells * np.arange(n_segments)[:, None] + cells
+            _append_entries(near, data_rows[receivers].ravel(), columns.ravel(), kernel)
+
+        # Expansion coefficients of the clusters in the far field, from the kernel
+        # of their bounding box and its centered differences along x, y and z
+        far_clusters = np.unique(far_pairs[:, 0])
+        far = ([], [], [])
+        for index, (cluster, receivers) in enumerate(group_by_cluster(far_pairs)):
+            box_lower = clusters["lower"][cluster]
+            box_upper = clusters["upper"][cluster]
+            steps = 0.25 * (box_upper - box_lower)
+            shifts = np.r_[np.zeros((1, 3)), -np.diag(steps), np.diag(steps)]
+
+            kernel = self._reference_kernel(
+                (locations[receivers] + shifts[:, None, :]).reshape((-1, 3)),
+                components,
+                np.c_[box_lower[0], box_upper[0]],
+                np.c_[box_lower[1], box_upper[1]],
+                np.c_[box_lower[2], box_upper[2]],
+            )
+            kernel = kernel.reshape((7, -1, n_segments)) / np.prod(
+                box_upper - box_lower
+            )
+            gradient = (kernel[1:4] - kernel[4:]) / (2 * steps[:, None, None])
+
+            columns = (
+                4 * (n_segments * index + np.arange(n_segments)) + np.arange(4)[:, None]
+            )
+            _append_entries(
+                far,
+                data_rows[receivers].ravel(),
+                columns.T.ravel(),
+                np.stack([kernel[0]] + list(gradient), axis=2).reshape(
+                    (kernel.shape[1], -1)
+                ),
+            )
+
+        # Monopole and dipole moments of the model over the far field clusters
+        centers = 0.5 * (lower + upper)
+        volumes = np.prod(upper - lower, axis=1)
+        moments = ([], [], [])
+        for index, cluster in enumerate(far_clusters):
+            cells = clusters["ordering"][
+                clusters["start"][cluster] : clusters["end"][cluster]
+            ]
+            offsets = centers[cells] - 0.5 * (
+                clusters["lower"][cluster] + clusters["upper"][cluster]
+            )
+            values = volumes[cells] * np.c_[np.ones(len(cells)), offsets].T
+            for segment in range(n_segments):
+                moments[0].append(
+                    np.repeat(
+                        4 * (n_segments * index + segment) + np.arange(4), len(cells)
                     )
-                ]
+                )
+                moments[1].append(np.tile(n_cells * segment + cells, 4))
+                moments[2].append(values.ravel())
+
+        n_columns = n_segments * n_cells
+        near = _assemble(near, (self.survey.nD, n_columns))
+        far = _assemble(far, (self.survey.nD, 4 * n_segments * len(far_clusters)))
+        moments = _assemble(moments, (far.shape[1], n_columns))
+
+        mapping = self._kernel_mapping()
+        if mapping is not None:
+            near = sp.csr_matrix(near @ mapping)
+            moments = sp.csr_matrix(moments @ mapping)
+
+        return FarFieldSensitivity(near, far, moments)
+
+    def _reference_kernel(self, receiver_locations, components, Xn, Yn, Zn):
+        """
+        Kernel rows of the cells bounded by the nodes Xn, Yn and Zn in place of
+        the active cells of the simulation.
+        """
+        active_nodes = self.Xn, self.Yn, self.Zn
+        try:
+            self.Xn, self.Yn, self.Zn = Xn, Yn, Zn
+            return self.evaluate_integral(receiver_locations, components)
+        finally:
+            self.Xn, self.Yn, self.Zn = active_nodes
+
+    def _kernel_mapping(self):
+        """
+        Mapping from the model to the columns of the kernel returned by
+        _reference_kernel, identity if None.
+        """
+        return None
+
+    def _compute_rows(self, receivers=None, out=None):
+        """
+        Rows of G, or of the forward data if store_sensitivities='forward_only',
+        for all or a subset of the receivers.
+
+        :param numpy.ndarray receivers: indices of the receivers, all if None
+        :param numpy.ndarray out: array, or memory map, the rows are written to
+        """
+        n_rows = self._receiver_n_rows()
+        if receivers is not None:
+            n_rows = n_rows[receivers]
+
+        if self.store_sensitivities == "forward_only":
+            shape = (n_rows.sum(),)
+        else:
+            shape = (n_rows.sum(), self.nC)
+
+        if self.n_workers > 1:
+            return self._parallel_rows(shape, receivers, out=out)
+
+        # Single threaded
+        kernel = np.empty(shape) if out is None else out
+        for rows, block in self._receiver_blocks(receivers):
+            values = self._evaluate_block(*block)
+            if kernel.ndim == 1:
+                values = values.dot(self.model)
+            kernel[rows] = values
+
+        return kernel
+
+    def _parallel_rows(self, shape, receivers=None, out=None):
+        """
+        Distribute the blocks of receivers over ``n_workers`` processes, each
+        filling its rows of G (or of the forward data) in place.
+
+        Workers are forked so that they share the simulation and write into an
+        anonymous shared memory map, or into ``out`` if it is a memory mapped
+        file, see :func:`SimPEG.utils.parallel_utils.worker_executor`.
+        """
+        if isinstance(out, np.memmap) or (out is not None and not fork_available()):
+            kernel = out
+        else:
+            kernel = shared_array(shape)
+
+        blocks = list(self._receiver_blocks(receivers))
+        if len(blocks) > 0:
+            executor, fill_rows = worker_executor(
+                partial(_fill_rows, self, kernel), self.n_workers
             )
-        if self.store_sensitivities == "disk":
-            print(f"writing sensitivity to {sens_name}")
-            os.makedirs(self.sensitivity_path, exist_ok=True)
-            np.save(sens_name, kernel)
+            rows, blocks = zip(*blocks)
+            chunk_size = max(1, len(rows) // (4 * self.n_workers))
+            with executor:
+                for _ in executor.map(fill_rows, rows, blocks, chunksize=chunk_size):
+                    pass
+
+        if out is not None and kernel is not out:
+            out[:] = kernel
+            return out
+
         return kernel
 
+    def _cached_linear_operator(self):
+        """
+        Rows of G held in the sensitivity cache in ``sensitivity_path``, as a
+        :class:`SimPEG.potential_fields.chunked.ChunkedSensitivity` streamed
+        from disk. Only the rows of receivers not found in the cache, for the
+        same mesh, active cells and kernel parameters, are computed, and written
+        in place to a new block file.
+        """
+        cache = SensitivityCache(
+            self.sensitivity_path, max_size=self.sensitivity_cache_size
+        )
+        key = self._sensitivity_cache_key()
+        receiver_keys = self._receiver_cache_keys()
+        n_rows = self._receiver_n_rows()
+
+        copies, found = cache.locate(key, receiver_keys, n_rows)
+        missing = np.where(~found)[0]
+        if found.any() and self.verbose:
+            print(
+                f"Found {found.sum()} of {len(found)} receivers in the sensitivity "
+                f"cache at {self.sensitivity_path}"
+            )
+
+        if len(missing) > 0:
+            if self.verbose:
+                print(f"writing sensitivity to {self.sensitivity_path}")
+            missing_keys = [receiver_keys[ii] for ii in missing]
+            name, rows = cache.allocate(key, missing_keys, n_rows[missing], self.nC)
+            self._compute_rows(missing, out=rows)
+            rows.flush()
+            del rows
+            cache.commit(name, key, missing_keys, n_rows[missing], keep=copies)
+
+            offsets = np.r_[0, np.cumsum(n_rows)]
+            target = [np.arange(offsets[ii], offsets[ii + 1]) for ii in missing]
+            copies[name] = (np.arange(n_rows[missing].sum()), np.hstack(target))
+
+        return ChunkedSensitivity(
+            self.sensitivity_path,
+            chunk_index(copies, self.nC, chunk_size=self.sensitivity_chunk_size),
+            (n_rows.sum(), self.nC),
+        )
+
+    def _sensitivity_cache_key(self):
+        """
+        Hash of the state defining the kernel, under which rows of G are cached.
+        """
+        return hash_arrays(type(self).__name__, self.Xn, self.Yn, self.Zn, self.nC)
+
+    def _receiver_cache_keys(self):
+        """
+        Hash of the location and active components of every receiver.
+        """
+        components = np.array(list(self.survey.components.keys()))
+        active_components = np.hstack(
+            [np.c_[values] for values in self.survey.components.values()]
+        )
+
+        return [
+            hash_arrays(location, components[active])
+            for location, active in zip(
+                self.survey.receiver_locations, active_components
+            )
+        ]
+
+    def _receiver_n_rows(self):
+        """
+        Number of rows of G, i.e. of active components, of every receiver.
+        """
+        return np.hstack(
+            [np.c_[values] for values in self.survey.components.values()]
+        ).sum(axis=1)
+
+    def _compressed_linear_operator(self):
+        """
+        Compress the rows of G block by block into a
+        :class:`SimPEG.potential_fields.compression.CompressedSensitivity`,
+        without holding the dense matrix.
+        """
+        cell_centers = np.c_[
+            self.Xn.mean(axis=1), self.Yn.mean(axis=1), self.Zn.mean(axis=1)
+        ]
+        kernel = CompressedSensitivity(
+            morton_ordering(cell_centers),
+            self.nC,
+            tolerance=self.compression_tolerance,
+        )
+        kernel.coefficients = sp.vstack(
+            [
+                kernel.compress(self._evaluate_block(*block))
+                for _, block in self._receiver_blocks()
+            ],
+            format="csr",
+        )
+
+        return kernel
+
+    def _row_blocks(self):
+        """
+        Dense blocks of rows of G aligned with the blocks of receivers. Rows are
+        recomputed from the kernel if the sensitivities are not stored.
+
+        :rtype: generator
+        :returns: tuples of (slice of the data rows, dense rows of G)
+        """
+        if self.store_sensitivities == "forward_only" and self.engine == "integral":
+            self.nC = self.modelMap.shape[0]
+            for rows, block in self._receiver_blocks():
+                yield rows, self._evaluate_block(*block)
+        elif isinstance(self.G, ChunkedSensitivity):
+            # Stream blocks of whole receivers of about sensitivity_chunk_size
+            n_rows = self._receiver_n_rows()
+            n_chunk = self.sensitivity_chunk_size * 1e6 // (8 * self.G.shape[1])
+            n_block = max(1, int(n_chunk // max(n_rows.max(), 1)))
+            offsets = np.r_[0, np.cumsum(n_rows)]
+            bounds = np.r_[offsets[:-1:n_block], offsets[-1]]
+            yield from self.G.iter_rows(
+                [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+            )
+        else:
+            G = self.G
+            for rows, _ in self._receiver_blocks():
+                block = G[rows]
+                if isinstance(block, (CompressedSensitivity, FarFieldSensitivity)):
+                    block = block.toarray()
+                yield rows, np.asarray(block)
+
+    def _block_size(self, n_cells, n_components):
+        """
+        Number of receivers of a block of rows of G within ``max_block_size``.
+        """
+        n_bytes = 8 * max(n_cells, 1) * max(n_components, 1)
+        return max(1, int(self.max_block_size * 1e6 // n_bytes))
+
+    def _receiver_blocks(self, receivers=None):
+        """
+        Split the survey into blocks of receivers evaluated at once by the
+        vectorized kernel.
+
+        :param numpy.ndarray receivers: indices of the receivers, all if None
+        :rtype: generator
+        :returns: tuples of (slice of the data rows, (receiver_locations, active_components))
+            for every block of at most ``receiver_block_size`` receivers. Data
+            rows are counted over the selected receivers only.
+        """
+        active_components = np.hstack(
+            [np.c_[values] for values in self.survey.components.values()]
+        )
+        receiver_locations = self.survey.receiver_locations
+        if receivers is not None:
+            active_components = active_components[receivers]
+            receiver_locations = receiver_locations[receivers]
+
+        n_block = self.receiver_block_size
+        if n_block is None:
+            n_block = self._block_size(
+                self.nC, active_components.sum(axis=1).max(initial=0)
+            )
+
+        n_active = np.r_[0, np.cumsum(active_components.sum(axis=1))]
+        for start in range(0, receiver_locations.shape[0], n_block):
+            end = min(start + n_block, receiver_locations.shape[0])
+            yield slice(n_active[start], n_active[end]), (
+                receiver_locations[start:end],
+                active_components[start:end],
+            )
+
+    def _evaluate_block(self, receiver_locations, active_components):
+        """
+        Kernel rows of the active components for a block of receivers, in
+        receiver-major order.
+        """
+        components = list(self.survey.components.keys())
+        rows = self.evaluate_integral(receiver_locations, components)
+
+        return rows[active_components.ravel()]
+
     def evaluate_integral(self):
         """
         evaluate_integral
 
-        Compute the forward linear relationship between the model and the physics at a point.
+        Compute the forward linear relationship between the model and the physics
+        at a point, or at a block of points of shape (n_receivers, 3).
         :param self:
         :return:
         """
@@ -161,22 +662,83 @@ class BasePFSimulation(LinearSimulation):
 
     @property
     def n_cpu(self):
-        """The parallelized property has been removed. If interested, try out
-        loading dask for parallelism by doing ``import SimPEG.dask``.
+        """The n_cpu property has been removed. Please set the n_workers
+        property instead, or try out loading dask for parallelism by doing
+        ``import SimPEG.dask``.
         """
         raise TypeError(
-            "n_cpu has been removed. If interested, try out "
+            "n_cpu has been removed. Please set n_workers instead, or try out "
             "loading dask for parallelism by doing ``import SimPEG.dask``."
         )
 
-    @parallelized.setter
+    @n_cpu.setter
     def n_cpu(self, other):
         raise TypeError(
-            "Do not set n_cpu. If interested, try out "
+            "Do not set n_cpu. Please set n_workers instead, or try out "
             "loading dask for parallelism by doing ``import SimPEG.dask``."
         )
 
 
+class MatrixFreeSensitivity(object):
+    """
+    Sensitivity matrix of a potential field simulation that is never stored.
+
+    Blocks of rows are recomputed from the kernel of the simulation for every
+    product, so that ``G @ x``, ``G.T @ y`` and ``G.dot`` only hold one block of
+    rows in memory at a time, trading compute for memory.
+
+    :param BasePFSimulation simulation: simulation evaluating the kernel
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    @property
+    def shape(self):
+        return (self.simulation.survey.nD, self.simulation.modelMap.shape[0])
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def T(self):
+        return _TransposedMatrixFreeSensitivity(self)
+
+    def dot(self, other):
+        out = np.empty((self.shape[0],) + other.shape[1:])
+        for rows, block in self.simulation._row_blocks():
+            out[rows] = block @ other
+
+        return out
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+
+class _TransposedMatrixFreeSensitivity(object):
+    """
+    Transpose of a :class:`MatrixFreeSensitivity`, for ``G.T @ y``.
+    """
+
+    def __init__(self, matrix):
+        self.T = matrix
+
+    @property
+    def shape(self):
+        return self.T.shape[::-1]
+
+    def dot(self, other):
+        out = np.zeros((self.shape[0],) + other.shape[1:])
+        for rows, block in self.T.simulation._row_blocks():
+            out += block.T @ other[rows]
+
+        return out
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+
 class BaseEquivalentSourceLayerSimulation(BasePFSimulation):
     """Base equivalent source layer simulation class
 
@@ -212,6 +774,43 @@ class BaseEquivalentSourceLayerSimulation(BasePFSimulation):
         self.Zn = np.c_[cell_z_bottom, cell_z_top]
 
 
+def _append_entries(entries, rows, columns, values):
+    """
+    Append the entries of a dense block of values to (rows, columns, values)
+    lists, skipping the rows flagged with -1.
+    """
+    block_rows = np.repeat(rows, len(columns))
+    block_columns = np.tile(columns, len(rows))
+    measured = block_rows >= 0
+    entries[0].append(block_rows[measured])
+    entries[1].append(block_columns[measured])
+    entries[2].append(values.ravel()[measured])
+
+
+def _assemble(entries, shape):
+    """
+    Sparse matrix from (rows, columns, values) lists of entries.
+    """
+    if len(entries[0]) == 0:
+        return sp.csr_matrix(shape)
+
+    return sp.csr_matrix(
+        (np.hstack(entries[2]), (np.hstack(entries[0]), np.hstack(entries[1]))),
+        shape=shape,
+    )
+
+
+def _fill_rows(simulation, kernel, rows, block):
+    """
+    Compute the kernel rows of a block of receivers into the shared output.
+    """
+    values = simulation._evaluate_block(*block)
+    if kernel.ndim == 1:
+        values = values.dot(simulation.model)
+
+    kernel[rows] = values
+
+
 def progress(iter, prog, final):
     """
     progress(iter,prog,final)
@@ -230,19 +829,23 @@ def progress(iter, prog, final):
     return prog
 
 
-def get_dist_wgt(mesh, receiver_locations, actv, R, R0):
+def get_dist_wgt(mesh, receiver_locations, actv, R, R0, n_workers=1):
     """
-    get_dist_wgt(xn,yn,zn,receiver_locations,R,R0)
+    get_dist_wgt(mesh, receiver_locations, actv, R, R0, n_workers=1)
 
     Function creating a distance weighting function required for the magnetic
     inverse problem.
 
+    Distances from blocks of receivers to the active cells are evaluated at
+    once, with blocks optionally spread over a pool of threads.
+
     INPUT
-    xn, yn, zn : Node location
+    mesh        : TensorMesh or TreeMesh
     receiver_locations       : Observation locations [obsx, obsy, obsz]
     actv        : Active cell vector [0:air , 1: ground]
     R           : Decay factor (mag=3, grav =2)
     R0          : Small factor added (default=dx/4)
+    n_workers   : Number of threads computing the blocks of receivers
 
     OUTPUT
     wr       : [nC] Vector of distance weighting
@@ -254,80 +857,64 @@ def get_dist_wgt(mesh, receiver_locations, actv, R, R0):
 
     # Find non-zero cells
     if actv.dtype == "bool":
-        inds = (
-            np.asarray([inds for inds, elem in enumerate(actv, 1) if elem], dtype=int)
-            - 1
-        )
+        inds = np.where(actv)[0]
     else:
         inds = actv
 
-    nC = len(inds)
-
-    # Create active cell projector
-    P = csr((np.ones(nC), (inds, range(nC))), shape=(mesh.nC, nC))
-
     # Geometrical constant
     p = 1 / np.sqrt(3)
 
-    # Create cell center location
-    Ym, Xm, Zm = np.meshgrid(mesh.vectorCCy, mesh.vectorCCx, mesh.vectorCCz)
-    hY, hX, hZ = np.meshgrid(mesh.hy, mesh.hx, mesh.hz)
-
-    # Remove air cells
-    Xm = P.T * mkvc(Xm)
-    Ym = P.T * mkvc(Ym)
-    Zm = P.T * mkvc(Zm)
-
-    hX = P.T * mkvc(hX)
-    hY = P.T * mkvc(hY)
-    hZ = P.T * mkvc(hZ)
-
-    V = P.T * mkvc(mesh.vol)
-    wr = np.zeros(nC)
-
-    ndata = receiver_locations.shape[0]
-    count = -1
-    print("Begin calculation of distance weighting for R= " + str(R))
-
-    for dd in range(ndata):
-
-        nx1 = (Xm - hX * p - receiver_locations[dd, 0]) ** 2
-        nx2 = (Xm + hX * p - receiver_locations[dd, 0]) ** 2
-
-        ny1 = (Ym - hY * p - receiver_locations[dd, 1]) ** 2
-        ny2 = (Ym + hY * p - receiver_locations[dd, 1]) ** 2
-
-        nz1 = (Zm - hZ * p - receiver_locations[dd, 2]) ** 2
-        nz2 = (Zm + hZ * p - receiver_locations[dd, 2]) ** 2
-
-        R1 = np.sqrt(nx1 + ny1 + nz1)
-        R2 = np.sqrt(nx1 + ny1 + nz2)
-        R3 = np.sqrt(nx2 + ny1 + nz1)
-        R4 = np.sqrt(nx2 + ny1 + nz2)
-        R5 = np.sqrt(nx1 + ny2 + nz1)
-        R6 = np.sqrt(nx1 + ny2 + nz2)
-        R7 = np.sqrt(nx2 + ny2 + nz1)
-        R8 = np.sqrt(nx2 + ny2 + nz2)
-
-        temp = (
-            (R1 + R0) ** -R
-            + (R2 + R0) ** -R
-            + (R3 + R0) ** -R
-            + (R4 + R0) ** -R
-            + (R5 + R0) ** -R
-            + (R6 + R0) ** -R
-            + (R7 + R0) ** -R
-            + (R8 + R0) ** -R
-        )
-
-        wr = wr + (V * temp / 8.0) ** 2.0
+    # Cell centers and sizes of the active cells
+    centers = mesh.gridCC[inds]
+    sizes = mesh.h_gridded[inds]
+    V = mesh.vol[inds]
+
+    # Inner points of the cells along each axis
+    inner = [centers - sizes * p, centers + sizes * p]
+
+    def decay(distance):
+        # Repeated products are much cheaper than pow for integer decays
+        if float(R).is_integer() and R >= 1:
+            out = distance.copy()
+            for _ in range(int(R) - 1):
+                out *= distance
+            return 1.0 / out
+        return distance ** -R
+
+    def block_sum(locations):
+        # Squared distances along each axis to the inner points of the cells
+        dx, dy, dz = [
+            [(points[:, axis] - locations[:, axis, None]) ** 2 for points in inner]
+            for axis in range(3)
+        ]
+
+        temp = np.zeros((locations.shape[0], len(inds)))
+        for dx2 in dx:
+            for dy2 in dy:
+                for dz2 in dz:
+                    temp += decay(np.sqrt(dx2 + dy2 + dz2) + R0)
+
+        return np.sum(temp ** 2.0, axis=0)
+
+    n_block = max(1, int(2 ** 16 // max(len(inds), 1)))
+    blocks = [
+        receiver_locations[start : start + n_block]
+        for start in range(0, receiver_locations.shape[0], n_block)
+    ]
+    # Partial sums are accumulated in the order of the blocks
+    wr = np.zeros(len(inds))
+    if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for partial in executor.map(block_sum, blocks):
+                wr += partial
+    else:
+        for block in blocks:
+            wr += block_sum(block)
 
-        count = progress(dd, count, ndata)
+    wr *= (V / 8.0) ** 2.0
 
     wr = np.sqrt(wr) / V
     wr = mkvc(wr)
     wr = np.sqrt(wr / (np.max(wr)))
 
-    print("Done 100% ...distance weighting completed!!\n")
-
     return wr
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def chunk_index(copies, n_columns, chunk_size=128.0):
+    """
+    Split the rows held by block files into chunks read at once.
+
+    Rows of every block are sorted by their position in the file, so that a
+    chunk reads a contiguous, or at least increasing, range of the file.
+
+    :param dict copies: mapping of every block file to (source, target) arrays
+        of its rows and of the matching rows of the matrix
+    :param int n_columns: number of columns of the matrix
+    :param float chunk_size: maximum size (MB) of a chunk
+    :rtype: list
+    :returns: tuples of (block file, source rows, target rows) of every chunk
+    """
+    n_chunk = max(1, int(chunk_size * 1e6 // (8 * max(n_columns, 1))))
+
+    chunks = []
+    for name, (source, target) in copies.items():
+        order = np.argsort(source, kind="stable")
+        source, target = source[order], target[order]
+        for start in range(0, len(source), n_chunk):
+            rows = source[start : start + n_chunk]
+            if rows[-1] - rows[0] + 1 == len(rows):
+                # Contiguous rows are read as a slice
+                rows = slice(int(rows[0]), int(rows[-1]) + 1)
+            chunks.append((name, rows, target[start : start + n_chunk]))
+
+    return chunks
+
+
+class ChunkedSensitivity(object):
+    """
+    Sensitivity matrix stored on disk, applied by streaming chunks of rows.
+
+    Rows are held in the ``.npy`` block files of a
+    :class:`SimPEG.potential_fields.sensitivity_cache.SensitivityCache` and
+    located by a chunk index. ``G @ x``, ``G.T @ y`` and ``G.dot`` read the
+    chunks in file order, only holding one chunk in memory while the next one
+    is prefetched by a background thread. Row access ``G[i]`` and slicing
+    ``G[rows]`` return dense rows.
+
+    The block files are memory mapped when the matrix is created, so that they
+    stay readable if later evicted from the cache.
+
+    :param str path: directory of the block files
+    :param list chunks: chunk index returned by :func:`chunk_index`
+    :param tuple shape: shape of the matrix
+    :param bool prefetch: read the next chunk while the current one is applied
+    """
+
+    def __init__(self, path, chunks, shape, prefetch=True):
+        self.path = path
+        self.chunks = chunks
+        self._shape = tuple(shape)
+        self.prefetch = prefetch
+
+        self.blocks = {
+            name: np.load(os.path.join(path, name), mmap_mode="r")
+            for name in {chunk[0] for chunk in chunks}
+        }
+
+        # Block file and row of every row of the matrix, for row access
+        names = sorted(self.blocks)
+        self._row_block = np.full(self.shape[0], -1, dtype=int)
+        self._row_source = np.zeros(self.shape[0], dtype=int)
+        for name, source, target in chunks:
+            self._row_block[target] = names.index(name)
+            self._row_source[target] = np.arange(self.blocks[name].shape[0])[source]
+        self._names = names
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def nbytes(self):
+        """Memory used by the matrix, excluding its block files"""
+        return self._row_block.nbytes + self._row_source.nbytes
+
+    @property
+    def T(self):
+        return _TransposedChunkedSensitivity(self)
+
+    def _read(self, chunk):
+        name, source, _ = chunk
+        return np.array(self.blocks[name][source])
+
+    def _prefetched(self, read, items):
+        """
+        Apply ``read`` to the items in order, reading the next item in a
+        background thread while the current one is consumed.
+        """
+        if not self.prefetch or len(items) < 2:
+            for item in items:
+                yield read(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(read, items[0])
+            for ii in range(len(items)):
+                values = future.result()
+                if ii + 1 < len(items):
+                    future = executor.submit(read, items[ii + 1])
+                yield values
+
+    def iter_chunks(self):
+        """
+        Dense chunks of rows of the matrix, in file order.
+
+        :rtype: generator
+        :returns: tuples of (target rows, dense rows)
+        """
+        for chunk, rows in zip(self.chunks, self._prefetched(self._read, self.chunks)):
+            yield chunk[2], rows
+
+    def iter_rows(self, indices):
+        """
+        Dense rows of the matrix for a sequence of row indices, or slices.
+
+        :param list indices: indices of the rows of every block
+        :rtype: generator
+        :returns: tuples of (index, dense rows)
+        """
+        for index, rows in zip(
+            indices, self._prefetched(self.__getitem__, list(indices))
+        ):
+            yield index, rows
+
+    def dot(self, other):
+        out = None
+        for target, rows in self.iter_chunks():
+            values = rows @ other
+            if out is None:
+                out = np.zeros((self.shape[0],) + values.shape[1:], dtype=values.dtype)
+            out[target] = values
+
+        if out is None:
+            out = np.zeros((self.shape[0],) + np.shape(other)[1:])
+
+        return out
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self[index : index + 1][0]
+
+        targets = np.arange(self.shape[0])[index]
+        out = np.empty((len(targets), self.shape[1]))
+        for ii, name in enumerate(self._names):
+            selected = np.where(self._row_block[targets] == ii)[0]
+            if len(selected) == 0:
+                continue
+            source = self._row_source[targets[selected]]
+            order = np.argsort(source, kind="stable")
+            out[selected[order]] = self.blocks[name][source[order]]
+
+        return out
+
+    def toarray(self):
+        """
+        Dense matrix read from the block files.
+        """
+        return self[:]
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.toarray(), dtype=dtype)
+
+
+class _TransposedChunkedSensitivity(object):
+    """
+    Transpose of a :class:`ChunkedSensitivity`, for ``G.T @ y``.
+    """
+
+    def __init__(self, matrix):
+        self.T = matrix
+
+    @property
+    def shape(self):
+        return self.T.shape[::-1]
+
+    def dot(self, other):
+        out = np.zeros((self.shape[0],) + np.shape(other)[1:])
+        for target, rows in self.T.iter_chunks():
+            out += rows.T @ other[target]
+
+        return out
+
+    def __matmul__(self, other):
+        return self.dot(other)
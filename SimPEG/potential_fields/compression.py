@@ -0,0 +1,223 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def morton_ordering(locations):
+    """
+    Order locations along a Morton (Z-order) space filling curve, so that cells
+    neighbouring in space are mostly neighbours in the ordering.
+
+    :param numpy.ndarray locations: array of shape (n_locations, dim) of cell centers
+    :rtype: numpy.ndarray
+    :returns: permutation of the locations
+    """
+    locations = np.asarray(locations, dtype=float)
+    extent = locations.max(axis=0) - locations.min(axis=0)
+    extent[extent == 0] = 1.0
+    n_bits = 63 // locations.shape[1]
+    quantized = (
+        (locations - locations.min(axis=0)) / extent * (2 ** n_bits - 1)
+    ).astype(np.uint64)
+
+    code = np.zeros(locations.shape[0], dtype=np.uint64)
+    for bit in range(n_bits):
+        for dim in range(locations.shape[1]):
+            code |= ((quantized[:, dim] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(
+                bit * locations.shape[1] + dim
+            )
+
+    return np.argsort(code, kind="stable")
+
+
+def haar_transform(values, inverse=False):
+    """
+    Orthonormal Haar wavelet transform along the last axis.
+
+    :param numpy.ndarray values: array with a power of two length along the last axis
+    :param bool inverse: compute the inverse (synthesis) transform
+    :rtype: numpy.ndarray
+    :returns: transformed copy of the values
+    """
+    values = np.array(values, dtype=float)
+    length = values.shape[-1]
+    scale = np.sqrt(2.0)
+
+    if not inverse:
+        n = length
+        while n > 1:
+            even, odd = values[..., 0:n:2], values[..., 1:n:2]
+            values[..., : n // 2], values[..., n // 2 : n] = (
+                (even + odd) / scale,
+                (even - odd) / scale,
+            )
+            n //= 2
+    else:
+        n = 2
+        while n <= length:
+            average, detail = values[..., : n // 2], values[..., n // 2 : n]
+            values[..., 0:n:2], values[..., 1:n:2] = (
+                (average + detail) / scale,
+                (average - detail) / scale,
+            )
+            n *= 2
+
+    return values
+
+
+class CompressedSensitivity(object):
+    """
+    Wavelet compressed storage of a dense sensitivity matrix.
+
+    Rows are transformed with an orthonormal Haar wavelet over the cells sorted
+    along a Morton curve, and the smallest coefficients of each row are dropped
+    so that the relative L2 error of every row stays below ``tolerance``.
+    Smooth far-field contributions collapse onto a few coarse coefficients,
+    which are stored as a sparse single precision matrix.
+
+    The object behaves as the dense matrix for ``G @ x``, ``G.T @ y``, ``G.dot``
+    and row access ``G[i]``. Slicing rows (``G[::3]``) returns a compressed
+    matrix sharing the same wavelet basis.
+
+    :param numpy.ndarray ordering: permutation of the cells along the Morton curve
+    :param int n_columns: number of columns of the matrix, a multiple of the number of cells
+    :param float tolerance: relative L2 accuracy of every compressed row
+    """
+
+    def __init__(self, ordering, n_columns, tolerance=1e-3, coefficients=None):
+        self.ordering = ordering
+        self.n_cells = len(ordering)
+        self.n_segments = n_columns // self.n_cells
+        self.n_pad = int(2 ** np.ceil(np.log2(max(self.n_cells, 1))))
+        self.tolerance = tolerance
+
+        if coefficients is None:
+            coefficients = sp.csr_matrix(
+                (0, self.n_segments * self.n_pad), dtype=np.float32
+            )
+        self.coefficients = coefficients
+
+    @property
+    def shape(self):
+        return (self.coefficients.shape[0], self.n_segments * self.n_cells)
+
+    @property
+    def dtype(self):
+        return self.coefficients.dtype
+
+    @property
+    def nbytes(self):
+        """Memory used by the compressed coefficients"""
+        return (
+            self.coefficients.data.nbytes
+            + self.coefficients.indices.nbytes
+            + self.coefficients.indptr.nbytes
+        )
+
+    @property
+    def T(self):
+        return _TransposedCompressedSensitivity(self)
+
+    def forward_transform(self, rows):
+        """
+        Wavelet coefficients of dense rows of shape (n_rows, n_columns).
+        """
+        rows = np.asarray(rows).reshape((-1, self.n_segments, self.n_cells))
+        padded = np.zeros((rows.shape[0], self.n_segments, self.n_pad))
+        padded[..., : self.n_cells] = rows[..., self.ordering]
+
+        return haar_transform(padded).reshape((rows.shape[0], -1))
+
+    def inverse_transform(self, coefficients):
+        """
+        Dense rows of shape (n_rows, n_columns) from their wavelet coefficients.
+        """
+        coefficients = np.asarray(coefficients).reshape(
+            (-1, self.n_segments, self.n_pad)
+        )
+        values = haar_transform(coefficients, inverse=True)[..., : self.n_cells]
+
+        rows = np.empty_like(values)
+        rows[..., self.ordering] = values
+
+        return rows.reshape((coefficients.shape[0], -1))
+
+    def compress(self, rows):
+        """
+        Compress a block of dense rows.
+
+        :rtype: scipy.sparse.csr_matrix
+        :returns: sparse wavelet coefficients of the rows, to be stacked in
+            ``coefficients``
+        """
+        coefficients = self.forward_transform(rows)
+
+        # Drop the smallest coefficients of each row up to the tolerated energy
+        energy = coefficients ** 2
+        order = np.argsort(energy, axis=1)
+        cumulated = np.cumsum(np.take_along_axis(energy, order, axis=1), axis=1)
+        budget = self.tolerance ** 2 * cumulated[:, -1:]
+        n_drop = (cumulated <= budget).sum(axis=1)
+
+        rank = np.empty_like(order)
+        np.put_along_axis(
+            rank, order, np.arange(coefficients.shape[1])[None, :], axis=1
+        )
+        coefficients[rank < n_drop[:, None]] = 0.0
+
+        return sp.csr_matrix(coefficients.astype(np.float32))
+
+    def dot(self, other):
+        if sp.issparse(other) or np.ndim(other) > 1:
+            # Reconstruct the dense rows by blocks
+            n_block = max(1, int(2 ** 20 // max(self.shape[1], 1)))
+            return np.vstack(
+                [
+                    self[start : start + n_block].toarray() @ other
+                    for start in range(0, self.shape[0], n_block)
+                ]
+            )
+
+        return self.coefficients @ self.forward_transform(other)[0].astype(self.dtype)
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.inverse_transform(self.coefficients[index].toarray())[0]
+
+        return CompressedSensitivity(
+            self.ordering,
+            self.shape[1],
+            tolerance=self.tolerance,
+            coefficients=self.coefficients[index],
+        )
+
+    def toarray(self):
+        """
+        Dense reconstruction of the compressed matrix.
+        """
+        return self.inverse_transform(self.coefficients.toarray())
+
+
+class _TransposedCompressedSensitivity(object):
+    """
+    Transpose of a :class:`CompressedSensitivity`, for ``G.T @ y``.
+    """
+
+    def __init__(self, matrix):
+        self.T = matrix
+
+    @property
+    def shape(self):
+        return self.T.shape[::-1]
+
+    def dot(self, other):
+        coefficients = self.T.coefficients.T @ other
+        if np.ndim(other) > 1:
+            return self.T.inverse_transform(coefficients.T).T
+
+        return self.T.inverse_transform(coefficients)[0]
+
+    def __matmul__(self, other):
+        return self.dot(other)
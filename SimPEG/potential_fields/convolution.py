@@ -0,0 +1,246 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy import fft
+
+
+class ConvolutionSensitivity(object):
+    """
+    Sensitivity matrix of a potential field simulation on a regular grid,
+    applied by 2D FFT convolutions.
+
+    On a tensor mesh uniform in x and y, with receivers gridded at the cell
+    spacing and at a constant height, the kernel between a receiver and a cell
+    of a given depth slice only depends on their horizontal offset. Every depth
+    slice of G is then a block Toeplitz matrix with Toeplitz blocks (BTTB), so
+    that ``G @ x`` and ``G.T @ y`` reduce to one 2D convolution per slice and
+    cost O(nz N log N) instead of O(nD nC).
+
+    :param numpy.ndarray kernel: array of shape (n_components, n_segments, nz, ny + nry - 1, nx + nrx - 1)
+        of the kernel of a cell of every depth slice for all horizontal offsets
+    :param tuple cells_shape: (nz, ny, nx) shape of the mesh
+    :param numpy.ndarray receiver_indices: array of shape (n_receivers, 2) of
+        (y, x) indices of the receivers on their grid
+    :param numpy.ndarray rows: flat indices, in (n_receivers, n_components), of
+        the data rows
+    :param scipy.sparse.csr_matrix projection: projection from the active to all cells of the mesh
+    :param scipy.sparse.spmatrix mapping: mapping from the model to the
+        n_segments blocks of active cells of the kernel, identity if None
+    """
+
+    def __init__(
+        self, kernel, cells_shape, receiver_indices, rows, projection, mapping=None
+    ):
+        self.kernel = kernel
+        self.cells_shape = cells_shape
+        self.receiver_indices = receiver_indices
+        self.rows = rows
+        self.projection = projection
+        self.mapping = mapping
+
+        self.n_segments = kernel.shape[1]
+        _, ny, nx = cells_shape
+        self.grid_shape = (kernel.shape[3] - ny + 1, kernel.shape[4] - nx + 1)
+        self.fft_shape = tuple(
+            fft.next_fast_len(n, real=True) for n in kernel.shape[3:]
+        )
+        self.kernel_fft = fft.rfft2(kernel, s=self.fft_shape)
+
+    @property
+    def shape(self):
+        n_columns = self.projection.shape[1] * self.n_segments
+        if self.mapping is not None:
+            n_columns = self.mapping.shape[1]
+        return (len(self.rows), n_columns)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def T(self):
+        return _TransposedConvolutionSensitivity(self)
+
+    @property
+    def n_components(self):
+        return self.kernel.shape[0]
+
+    def _cells_to_grid(self, values):
+        """
+        Values of the active cells of every segment onto the padded mesh grid.
+        """
+        values = values.reshape((self.n_segments, -1)).T
+
+        return (self.projection @ values).T.reshape(
+            (self.n_segments,) + self.cells_shape
+        )
+
+    def _grid_to_data(self, grid):
+        """
+        Data rows sampled from the (n_components, nry, nrx) grids of the receivers.
+        """
+        values = grid[:, self.receiver_indices[:, 0], self.receiver_indices[:, 1]]
+
+        return values.T.ravel()[self.rows]
+
+    def _data_to_grid(self, data):
+        """
+        Scatter data rows onto (n_components, nry, nrx) grids of the receivers.
+        """
+        values = np.zeros(len(self.receiver_indices) * self.n_components)
+        values[self.rows] = data
+        values = values.reshape((-1, self.n_components)).T
+
+        grid = np.zeros((self.n_components,) + self.grid_shape)
+        np.add.at(
+            grid,
+            (slice(None), self.receiver_indices[:, 0], self.receiver_indices[:, 1]),
+            values,
+        )
+
+        return grid
+
+    def _padded_receivers(self, grid):
+        """
+        Receiver grids placed at their offset in the convolution domain.
+        """
+        _, ny, nx = self.cells_shape
+        padded = np.zeros(grid.shape[:-2] + self.fft_shape)
+        padded[
+            ..., ny - 1 : ny - 1 + grid.shape[-2], nx - 1 : nx - 1 + grid.shape[-1]
+        ] = grid
+
+        return padded
+
+    def dot(self, other):
+        if np.ndim(other) > 1:
+            return np.column_stack([self.dot(column) for column in np.asarray(other).T])
+
+        values = np.asarray(other, dtype=np.float64)
+        if self.mapping is not None:
+            values = self.mapping @ values
+
+        cells = fft.rfft2(self._cells_to_grid(values), s=self.fft_shape)
+        data = fft.irfft2(
+            np.einsum("aszyx,szyx->ayx", self.kernel_fft, cells), s=self.fft_shape
+        )
+
+        _, ny, nx = self.cells_shape
+        nry, nrx = self.grid_shape
+        return self._grid_to_data(data[:, ny - 1 : ny - 1 + nry, nx - 1 : nx - 1 + nrx])
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+    def transpose_dot(self, other):
+        """
+        Product ``G.T @ other`` as correlations of the kernel with the data.
+        """
+        if np.ndim(other) > 1:
+            return np.column_stack(
+                [self.transpose_dot(column) for column in np.asarray(other).T]
+            )
+
+        data = fft.rfft2(
+            self._padded_receivers(self._data_to_grid(np.asarray(other, dtype=float))),
+            s=self.fft_shape,
+        )
+        cells = fft.irfft2(
+            np.einsum("aszyx,ayx->szyx", self.kernel_fft.conj(), data), s=self.fft_shape
+        )
+
+        return self._grid_to_cells(cells)
+
+    def _grid_to_cells(self, grid):
+        """
+        Values of the active cells of every segment from the convolution domain,
+        mapped back onto the model.
+        """
+        _, ny, nx = self.cells_shape
+        grid = grid[..., :ny, :nx].reshape((self.n_segments, -1))
+        values = (self.projection.T @ grid.T).T.ravel()
+        if self.mapping is not None:
+            values = self.mapping.T @ values
+
+        return np.asarray(values)
+
+    def gram_diagonal(self, weights):
+        """
+        Diagonal of ``G.T @ W @ G`` for weights combining the components of
+        every receiver.
+
+        :param numpy.ndarray weights: array of shape (n_data,) of the diagonal
+            of W, or (n_receivers, n_components, n_components) of the weights
+            of the products of components of every receiver
+        :rtype: numpy.ndarray
+        """
+        if weights.ndim == 1:
+            diagonal = np.zeros(len(self.receiver_indices) * self.n_components)
+            diagonal[self.rows] = weights
+            weights = np.zeros((len(self.receiver_indices),) + 2 * (self.n_components,))
+            indices = np.arange(self.n_components)
+            weights[:, indices, indices] = diagonal.reshape((-1, self.n_components))
+
+        weights = 0.5 * (weights + weights.transpose((0, 2, 1)))
+
+        # Correlate the weights with the products of the component kernels
+        weights_fft = {}
+        for a in range(self.n_components):
+            for b in range(self.n_components):
+                if np.any(weights[:, a, b]):
+                    grid = np.zeros(self.grid_shape)
+                    np.add.at(
+                        grid,
+                        (self.receiver_indices[:, 0], self.receiver_indices[:, 1]),
+                        weights[:, a, b],
+                    )
+                    weights_fft[(a, b)] = fft.rfft2(
+                        self._padded_receivers(grid), s=self.fft_shape
+                    )
+
+        mapping = self.mapping
+        if mapping is None:
+            mapping = sp.identity(self.projection.shape[1] * self.n_segments)
+        mapping = sp.csr_matrix(mapping)
+        n_active = self.projection.shape[1]
+
+        diagonal = np.zeros(mapping.shape[1])
+        for k in range(self.n_segments):
+            for l in range(k, self.n_segments):
+                products = np.zeros(self.kernel_fft.shape[2:], dtype=complex)
+                for (a, b), values in weights_fft.items():
+                    products += (
+                        fft.rfft2(
+                            self.kernel[a, k] * self.kernel[b, l], s=self.fft_shape
+                        ).conj()
+                        * values
+                    )
+                cells = fft.irfft2(products, s=self.fft_shape)[
+                    ..., : self.cells_shape[1], : self.cells_shape[2]
+                ]
+                cells = self.projection.T @ cells.ravel()
+
+                segments = mapping[k * n_active : (k + 1) * n_active].multiply(
+                    mapping[l * n_active : (l + 1) * n_active]
+                )
+                diagonal += (1 if k == l else 2) * (segments.T @ cells)
+
+        return diagonal
+
+
+class _TransposedConvolutionSensitivity(object):
+    """
+    Transpose of a :class:`ConvolutionSensitivity`, for ``G.T @ y``.
+    """
+
+    def __init__(self, matrix):
+        self.T = matrix
+
+    @property
+    def shape(self):
+        return self.T.shape[::-1]
+
+    def dot(self, other):
+        return self.T.transpose_dot(other)
+
+    def __matmul__(self, other):
+        return self.dot(other)
@@ -0,0 +1,197 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def cluster_cells(lower, upper, leaf_size=32):
+    """
+    Hierarchical clustering of cells by recursive bisection of their bounding
+    boxes along their longest dimension.
+
+    :param numpy.ndarray lower: array of shape (n_cells, 3) of the lower corner of the cells
+    :param numpy.ndarray upper: array of shape (n_cells, 3) of the upper corner of the cells
+    :param int leaf_size: maximum number of cells of the leaves
+    :rtype: dict
+    :returns: clusters with keys
+
+        - 'ordering': permutation of the cells, such that every cluster holds a
+          contiguous range of it
+        - 'start', 'end': range of the cells of every cluster in the ordering
+        - 'lower', 'upper': bounding box of every cluster
+        - 'children': array of shape (n_clusters, 2) of the children of every
+          cluster, -1 for the leaves
+    """
+    centers = 0.5 * (lower + upper)
+    ordering = np.arange(lower.shape[0])
+
+    start, end, children = [0], [lower.shape[0]], [[-1, -1]]
+    node = 0
+    while node < len(start):
+        cells = ordering[start[node] : end[node]]
+        if len(cells) > leaf_size:
+            extent = upper[cells].max(axis=0) - lower[cells].min(axis=0)
+            split = np.argsort(centers[cells, np.argmax(extent)], kind="stable")
+            ordering[start[node] : end[node]] = cells[split]
+
+            middle = start[node] + len(cells) // 2
+            children[node] = [len(start), len(start) + 1]
+            start += [start[node], middle]
+            end += [middle, end[node]]
+            children += [[-1, -1], [-1, -1]]
+        node += 1
+
+    start, end = np.array(start), np.array(end)
+    cluster_lower = np.vstack(
+        [lower[ordering[ii:jj]].min(axis=0) for ii, jj in zip(start, end)]
+    )
+    cluster_upper = np.vstack(
+        [upper[ordering[ii:jj]].max(axis=0) for ii, jj in zip(start, end)]
+    )
+
+    return {
+        "ordering": ordering,
+        "start": start,
+        "end": end,
+        "lower": cluster_lower,
+        "upper": cluster_upper,
+        "children": np.array(children, dtype=int),
+    }
+
+
+def interaction_lists(clusters, receiver_locations, accuracy):
+    """
+    Split the interactions between receivers and clusters of cells into near
+    and far fields.
+
+    A cluster is in the far field of a receiver if the relative error of its
+    first order expansion, estimated as ``10 * (radius / distance) ** 2`` for
+    kernels decaying up to 1/r^4, is below ``accuracy``. Otherwise its
+    children are visited, down to the leaves evaluated exactly.
+
+    :param dict clusters: clusters of cells returned by :func:`cluster_cells`
+    :param numpy.ndarray receiver_locations: array of shape (n_receivers, 3)
+    :param float accuracy: relative accuracy of the far field contributions
+
+    :rtype: tuple
+    :returns: (near, far) arrays of shape (n_pairs, 2) of (cluster, receiver)
+        pairs, with leaf clusters only in near
+    """
+    centers = 0.5 * (clusters["lower"] + clusters["upper"])
+    radii = 0.5 * np.linalg.norm(clusters["upper"] - clusters["lower"], axis=1)
+    is_leaf = clusters["children"][:, 0] < 0
+
+    near, far = [], []
+    nodes = np.zeros(receiver_locations.shape[0], dtype=int)
+    receivers = np.arange(receiver_locations.shape[0])
+    while len(nodes) > 0:
+        distances = np.linalg.norm(
+            receiver_locations[receivers] - centers[nodes], axis=1
+        )
+        admissible = 10.0 * radii[nodes] ** 2 < accuracy * distances**2
+
+        far.append(np.c_[nodes[admissible], receivers[admissible]])
+        leaves = ~admissible & is_leaf[nodes]
+        near.append(np.c_[nodes[leaves], receivers[leaves]])
+
+        split = ~admissible & ~is_leaf[nodes]
+        nodes = clusters["children"][nodes[split]].ravel()
+        receivers = np.repeat(receivers[split], 2)
+
+    return np.vstack(near), np.vstack(far)
+
+
+def group_by_cluster(pairs):
+    """
+    Iterate over the receivers interacting with every cluster.
+
+    :param numpy.ndarray pairs: array of shape (n_pairs, 2) of (cluster, receiver) pairs
+    :rtype: generator
+    :returns: tuples of (cluster, array of receivers)
+    """
+    pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+    clusters, starts = np.unique(pairs[:, 0], return_index=True)
+    for cluster, receivers in zip(clusters, np.split(pairs[:, 1], starts[1:])):
+        yield cluster, receivers
+
+
+class FarFieldSensitivity(object):
+    """
+    Sensitivity matrix approximated by exact near field rows and coarse far
+    field contributions of clusters of cells.
+
+    The contribution of a cluster far from a receiver is expanded to first
+    order about its center, from the volume weighted sum of the model over its
+    cells (monopole) and its first moment (dipole). The matrix is stored as::
+
+        G = near + far @ moments
+
+    with ``near`` the sparse exact rows of the cells close to every receiver,
+    ``far`` the sparse expansion coefficients of the clusters in the far field
+    of every receiver, and ``moments`` the sparse matrix of moments of the
+    clusters.
+
+    :param scipy.sparse.csr_matrix near: exact near field entries
+    :param scipy.sparse.csr_matrix far: far field expansion coefficients
+    :param scipy.sparse.csr_matrix moments: moments of the clusters
+    """
+
+    def __init__(self, near, far, moments):
+        self.near = near
+        self.far = far
+        self.moments = moments
+
+    @property
+    def shape(self):
+        return self.near.shape
+
+    @property
+    def dtype(self):
+        return self.near.dtype
+
+    @property
+    def nbytes(self):
+        """Memory used by the near field entries and far field coefficients"""
+        return sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+            for matrix in [self.near, self.far, self.moments]
+        )
+
+    @property
+    def T(self):
+        return _TransposedFarFieldSensitivity(self)
+
+    def dot(self, other):
+        return self.near @ other + self.far @ (self.moments @ other)
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self[index : index + 1].toarray()[0]
+
+        return FarFieldSensitivity(self.near[index], self.far[index], self.moments)
+
+    def toarray(self):
+        """
+        Dense reconstruction of the approximated matrix.
+        """
+        return (self.near + self.far @ self.moments).toarray()
+
+
+class _TransposedFarFieldSensitivity(object):
+    """
+    Transpose of a :class:`FarFieldSensitivity`, for ``G.T @ y``.
+    """
+
+    def __init__(self, matrix):
+        self.T = matrix
+
+    @property
+    def shape(self):
+        return self.T.shape[::-1]
+
+    def dot(self, other):
+        return self.T.near.T @ other + self.T.moments.T @ (self.T.far.T @ other)
+
+    def __matmul__(self, other):
+        return self.dot(other)
@@ -2,7 +2,11 @@ from SimPEG.utils import mkvc, sdiag, setKwargs
 from SimPEG import props
 from ...simulation import BaseSimulation
 from ...base import BasePDESimulation
-from ..base import BasePFSimulation, BaseEquivalentSourceLayerSimulation
+from ..base import (
+    BasePFSimulation,
+    BaseEquivalentSourceLayerSimulation,
+    MatrixFreeSensitivity,
+)
 import scipy.constants as constants
 from scipy.constants import G as NewtG
 import numpy as np
@@ -25,7 +29,7 @@ class Simulation3DIntegral(BasePFSimulation):
     def fields(self, m):
         self.model = m
 
-        if self.store_sensitivities == "forward_only":
+        if self.store_sensitivities == "forward_only" and self.engine == "integral":
             self.model = m
             # Compute the linear operation without forming the full dense G
             fields = mkvc(self.linear_operator())
@@ -46,9 +50,12 @@ class Simulation3DIntegral(BasePFSimulation):
             W = W.diagonal() ** 2
         if getattr(self, "_gtg_diagonal", None) is None:
 
-            diag = np.zeros(self.G.shape[1])
-            for i in range(len(W)):
-                diag += W[i] * (self.G[i] * self.G[i])
+            if self.engine == "fft":
+                diag = self.G.gram_diagonal(W)
+            else:
+                diag = np.zeros(self.G.shape[1])
+                for rows, block in self._row_blocks():
+                    diag += W[rows] @ (block * block)
             self._gtg_diagonal = diag
         else:
             diag = self._gtg_diagonal
@@ -80,7 +87,14 @@ class Simulation3DIntegral(BasePFSimulation):
         Gravity forward operator
         """
         if getattr(self, "_G", None) is None:
-            self._G = self.linear_operator()
+            if self.engine == "fft":
+                self._G = self._convolution_linear_operator()
+            elif self.engine == "far_field":
+                self._G = self._far_field_linear_operator()
+            elif self.store_sensitivities == "forward_only":
+                self._G = MatrixFreeSensitivity(self)
+            else:
+                self._G = self.linear_operator()
 
         return self._G
 
@@ -100,14 +114,16 @@ class Simulation3DIntegral(BasePFSimulation):
         Compute the forward linear relationship between the model and the physics at a point
         and for all components of the survey.
 
-        :param numpy.ndarray receiver_location:  array with shape (n_receivers, 3)
-            Array of receiver locations as x, y, z columns.
+        :param numpy.ndarray receiver_location:  array with shape (3,) or (n_receivers, 3)
+            Array of receiver locations as x, y, z columns. A block of receivers is
+            evaluated at once as a broadcasted (n_receivers x n_cells) computation.
         :param list[str] components: List of gravity components chosen from:
             'gx', 'gy', 'gz', 'gxx', 'gxy', 'gxz', 'gyy', 'gyz', 'gzz', 'guv'
         :param float tolerance: Small constant to avoid singularity near nodes and edges.
         :rtype numpy.ndarray: rows
-        :returns: ndarray with shape (n_components, n_cells)
-            Dense array mapping of the contribution of all active cells to data components::
+        :returns: ndarray with shape (n_receivers * n_components, n_cells)
+            Dense array mapping of the contribution of all active cells to data
+            components, ordered by receiver then component::
 
                 rows =
                     g_1 = [g_1x g_1y g_1z]
@@ -125,41 +141,41 @@ class Simulation3DIntegral(BasePFSimulation):
         else:
             min_hz = self.mesh.h[2].min()
 
-        # comp. pos. differences for tne, bsw nodes. Adjust if location within
+        receiver_location = np.atleast_2d(receiver_location)
+        shape = (receiver_location.shape[0], self.Xn.shape[0])
+
+        # comp. pos. differences for tne, bsw nodes, stored as (2, n_receivers, nC)
+        # so that every corner is contiguous. Adjust if location within
         # tolerance of a node or edge
-        dx = self.Xn - receiver_location[0]
+        dx = self.Xn.T[:, None, :] - receiver_location[None, :, 0, None]
         dx[np.abs(dx) / min_hx < tolerance] = tolerance * min_hx
-        dy = self.Yn - receiver_location[1]
+        dy = self.Yn.T[:, None, :] - receiver_location[None, :, 1, None]
         dy[np.abs(dy) / min_hy < tolerance] = tolerance * min_hy
-        dz = self.Zn - receiver_location[2]
+        dz = self.Zn.T[:, None, :] - receiver_location[None, :, 2, None]
         dz[np.abs(dz) / min_hz < tolerance] = tolerance * min_hz
 
-        rows = {component: np.zeros(self.Xn.shape[0]) for component in components}
+        rows = {component: np.zeros(shape) for component in components}
 
-        gxx = np.zeros(self.Xn.shape[0])
-        gyy = np.zeros(self.Xn.shape[0])
+        gxx = np.zeros(shape)
+        gyy = np.zeros(shape)
 
         for aa in range(2):
             for bb in range(2):
                 for cc in range(2):
 
-                    r = (
-                        mkvc(dx[:, aa]) ** 2
-                        + mkvc(dy[:, bb]) ** 2
-                        + mkvc(dz[:, cc]) ** 2
-                    ) ** (0.50)
+                    r = (dx[aa] ** 2 + dy[bb] ** 2 + dz[cc] ** 2) ** (0.50)
 
-                    dz_r = dz[:, cc] + r
-                    dy_r = dy[:, bb] + r
-                    dx_r = dx[:, aa] + r
+                    dz_r = dz[cc] + r
+                    dy_r = dy[bb] + r
+                    dx_r = dx[aa] + r
 
-                    dxr = dx[:, aa] * r
-                    dyr = dy[:, bb] * r
-                    dzr = dz[:, cc] * r
+                    dxr = dx[aa] * r
+                    dyr = dy[bb] * r
+                    dzr = dz[cc] * r
 
-                    dydz = dy[:, bb] * dz[:, cc]
-                    dxdy = dx[:, aa] * dy[:, bb]
-                    dxdz = dx[:, aa] * dz[:, cc]
+                    dydz = dy[bb] * dz[cc]
+                    dxdy = dx[aa] * dy[bb]
+                    dxdz = dx[aa] * dz[cc]
 
                     if "gx" in components:
                         rows["gx"] += (
@@ -167,9 +183,9 @@ class Simulation3DIntegral(BasePFSimulation):
                             * (-1) ** bb
                             * (-1) ** cc
                             * (
-                                dy[:, bb] * np.log(dz_r)
-                                + dz[:, cc] * np.log(dy_r)
-                                - dx[:, aa] * np.arctan(dydz / dxr)
+                                dy[bb] * np.log(dz_r)
+                                + dz[cc] * np.log(dy_r)
+                                - dx[aa] * np.arctan(dydz / dxr)
                             )
                         )
 
@@ -179,9 +195,9 @@ class Simulation3DIntegral(BasePFSimulation):
                             * (-1) ** bb
                             * (-1) ** cc
                             * (
-                                dx[:, aa] * np.log(dz_r)
-                                + dz[:, cc] * np.log(dx_r)
-                                - dy[:, bb] * np.arctan(dxdz / dyr)
+                                dx[aa] * np.log(dz_r)
+                                + dz[cc] * np.log(dx_r)
+                                - dy[bb] * np.arctan(dxdz / dyr)
                             )
                         )
 
@@ -191,13 +207,13 @@ class Simulation3DIntegral(BasePFSimulation):
                             * (-1) ** bb
                             * (-1) ** cc
                             * (
-                                dx[:, aa] * np.log(dy_r)
-                                + dy[:, bb] * np.log(dx_r)
-                                - dz[:, cc] * np.arctan(dxdy / dzr)
+                                dx[aa] * np.log(dy_r)
+                                + dy[bb] * np.log(dx_r)
+                                - dz[cc] * np.arctan(dxdy / dzr)
                             )
                         )
 
-                    arg = dy[:, bb] * dz[:, cc] / dxr
+                    arg = dy[bb] * dz[cc] / dxr
 
                     if (
                         ("gxx" in components)
@@ -212,11 +228,11 @@ class Simulation3DIntegral(BasePFSimulation):
                                 dxdy / (r * dz_r)
                                 + dxdz / (r * dy_r)
                                 - np.arctan(arg)
-                                + dx[:, aa]
+                                + dx[aa]
                                 * (1.0 / (1 + arg ** 2.0))
                                 * dydz
                                 / dxr ** 2.0
-                                * (r + dx[:, aa] ** 2.0 / r)
+                                * (r + dx[aa] ** 2.0 / r)
                             )
                         )
 
@@ -227,12 +243,12 @@ class Simulation3DIntegral(BasePFSimulation):
                             * (-1) ** cc
                             * (
                                 np.log(dz_r)
-                                + dy[:, bb] ** 2.0 / (r * dz_r)
-                                + dz[:, cc] / r
+                                + dy[bb] ** 2.0 / (r * dz_r)
+                                + dz[cc] / r
                                 - 1.0
                                 / (1 + arg ** 2.0)
-                                * (dz[:, cc] / r ** 2)
-                                * (r - dy[:, bb] ** 2.0 / r)
+                                * (dz[cc] / r ** 2)
+                                * (r - dy[bb] ** 2.0 / r)
                             )
                         )
 
@@ -243,16 +259,16 @@ class Simulation3DIntegral(BasePFSimulation):
                             * (-1) ** cc
                             * (
                                 np.log(dy_r)
-                                + dz[:, cc] ** 2.0 / (r * dy_r)
-                                + dy[:, bb] / r
+                                + dz[cc] ** 2.0 / (r * dy_r)
+                                + dy[bb] / r
                                 - 1.0
                                 / (1 + arg ** 2.0)
-                                * (dy[:, bb] / (r ** 2))
-                                * (r - dz[:, cc] ** 2.0 / r)
+                                * (dy[bb] / (r ** 2))
+                                * (r - dz[cc] ** 2.0 / r)
                             )
                         )
 
-                    arg = dx[:, aa] * dz[:, cc] / dyr
+                    arg = dx[aa] * dz[cc] / dyr
 
                     if (
                         ("gyy" in components)
@@ -267,11 +283,11 @@ class Simulation3DIntegral(BasePFSimulation):
                                 dxdy / (r * dz_r)
                                 + dydz / (r * dx_r)
                                 - np.arctan(arg)
-                                + dy[:, bb]
+                                + dy[bb]
                                 * (1.0 / (1 + arg ** 2.0))
                                 * dxdz
                                 / dyr ** 2.0
-                                * (r + dy[:, bb] ** 2.0 / r)
+                                * (r + dy[bb] ** 2.0 / r)
                             )
                         )
 
@@ -282,12 +298,12 @@ class Simulation3DIntegral(BasePFSimulation):
                             * (-1) ** cc
                             * (
                                 np.log(dx_r)
-                                + dz[:, cc] ** 2.0 / (r * (dx_r))
-                                + dx[:, aa] / r
+                                + dz[cc] ** 2.0 / (r * (dx_r))
+                                + dx[aa] / r
                                 - 1.0
                                 / (1 + arg ** 2.0)
-                                * (dx[:, aa] / (r ** 2))
-                                * (r - dz[:, cc] ** 2.0 / r)
+                                * (dx[aa] / (r ** 2))
+                                * (r - dz[cc] ** 2.0 / r)
                             )
                         )
 
@@ -309,7 +325,9 @@ class Simulation3DIntegral(BasePFSimulation):
             else:
                 rows[component] *= constants.G * 1e8  # conversion for mGal
 
-        return np.vstack([rows[component] for component in components])
+        return np.stack([rows[component] for component in components], axis=1).reshape(
+            (-1, shape[1])
+        )
 
 
 class SimulationEquivalentSourceLayer(
@@ -1,9 +1,15 @@
+import itertools
 import numpy as np
 import scipy.sparse as sp
 from scipy.constants import mu_0
 
 from SimPEG import utils
-from ..base import BasePFSimulation, BaseEquivalentSourceLayerSimulation
+from ..base import (
+    BasePFSimulation,
+    BaseEquivalentSourceLayerSimulation,
+    MatrixFreeSensitivity,
+)
+from SimPEG.utils.code_utils import hash_arrays
 from ...base import BaseMagneticPDESimulation
 from .survey import Survey
 from .analytics import CongruousMagBC
@@ -28,6 +34,13 @@ class Simulation3DIntegral(BasePFSimulation):
         "Whether the supplied data is amplitude data", default=False
     )
 
+    fused_kernel = properties.Boolean(
+        "Accumulate the rows of bx, by, bz and tmi data directly from the "
+        "independent entries of the magnetic tensor, weighted by the "
+        "magnetization, without forming the rows of the three field components",
+        default=True,
+    )
+
     _model_type: str = "scalar"
 
     def __init__(self, mesh, **kwargs):
@@ -88,7 +101,7 @@ class Simulation3DIntegral(BasePFSimulation):
 
         model = self.chiMap * model
 
-        if self.store_sensitivities == "forward_only":
+        if self.store_sensitivities == "forward_only" and self.engine == "integral":
             self.model = model
             fields = mkvc(self.linear_operator())
         else:
@@ -103,8 +116,14 @@ class Simulation3DIntegral(BasePFSimulation):
     def G(self):
 
         if getattr(self, "_G", None) is None:
-
-            self._G = self.linear_operator()
+            if self.engine == "fft":
+                self._G = self._convolution_linear_operator()
+            elif self.engine == "far_field":
+                self._G = self._far_field_linear_operator()
+            elif self.store_sensitivities == "forward_only":
+                self._G = MatrixFreeSensitivity(self)
+            else:
+                self._G = self.linear_operator()
 
         return self._G
 
@@ -159,21 +178,31 @@ class Simulation3DIntegral(BasePFSimulation):
             W = W.diagonal() ** 2
         if getattr(self, "_gtg_diagonal", None) is None:
             diag = np.zeros(self.G.shape[1])
-            if not self.is_amplitude_data:
-                for i in range(len(W)):
-                    diag += W[i] * (self.G[i] * self.G[i])
+            if self.engine == "fft":
+                if self.is_amplitude_data:
+                    # Weights of the products of bx, by and bz of every receiver
+                    fieldDeriv = self.fieldDeriv
+                    W = np.einsum(
+                        "i,ji,ki->ijk",
+                        W[: fieldDeriv.shape[1]],
+                        fieldDeriv,
+                        fieldDeriv,
+                    )
+                diag = self.G.gram_diagonal(W)
+            elif not self.is_amplitude_data:
+                for rows, block in self._row_blocks():
+                    diag += W[rows] @ (block * block)
             else:
                 fieldDeriv = self.fieldDeriv
-                Gx = self.G[::3]
-                Gy = self.G[1::3]
-                Gz = self.G[2::3]
-                for i in range(len(W)):
-                    row = (
-                        fieldDeriv[0, i] * Gx[i]
-                        + fieldDeriv[1, i] * Gy[i]
-                        + fieldDeriv[2, i] * Gz[i]
+                for rows, block in self._row_blocks():
+                    # Rows of bx, by and bz are interleaved for each receiver
+                    receivers = slice(rows.start // 3, rows.stop // 3)
+                    block = np.einsum(
+                        "ij,ijk->ik",
+                        fieldDeriv[:, receivers].T,
+                        block.reshape((-1, 3, block.shape[1])),
                     )
-                    diag += W[i] * (row * row)
+                    diag += W[receivers] @ (block * block)
             self._gtg_diagonal = diag
         else:
             diag = self._gtg_diagonal
@@ -242,7 +271,9 @@ class Simulation3DIntegral(BasePFSimulation):
         location outside the Earth [obsx, obsy, obsz]
 
         INPUT:
-        receiver_location:  [obsx, obsy, obsz] nC x 3 Array
+        receiver_location:  [obsx, obsy, obsz] (3,) or (n_receivers, 3) Array
+            A block of receivers is evaluated at once as a broadcasted
+            (n_receivers x nC) computation.
 
         components: list[str]
             List of magnetic components chosen from:
@@ -255,38 +286,29 @@ class Simulation3DIntegral(BasePFSimulation):
         Tx = [Txx Txy Txz]
         Ty = [Tyx Tyy Tyz]
         Tz = [Tzx Tzy Tzz]
+
+        Rows are returned with shape (n_receivers * n_components, nC), ordered by
+        receiver then component.
         """
         # TODO: This should probably be converted to C
-        rows = {component: np.zeros(3 * self.Xn.shape[0]) for component in components}
-
-        # number of cells in mesh
-        nC = self.Xn.shape[0]
+        receiver_location = np.atleast_2d(receiver_location)
 
-        # base cell dimensions
-        min_hx, min_hy = self.mesh.h[0].min(), self.mesh.h[1].min()
-        if len(self.mesh.h) < 3:
-            # Allow for 2D quadtree representations by using a dummy cell height.
-            # Actually cell heights will come from externally defined ``self.Zn``
-            min_hz = np.minimum(min_hx, min_hy) / 10.0
-        else:
-            min_hz = self.mesh.h[2].min()
+        if self.fused_kernel and set(components) <= {"bx", "by", "bz", "tmi"}:
+            weights = self._magnetization_weights()
+            if weights is not None:
+                return self._evaluate_fused(
+                    receiver_location, components, weights, tolerance=tolerance
+                )
 
-        # comp. pos. differences for tne, bsw nodes. Adjust if location within
-        # tolerance of a node or edge
-        dx1 = self.Xn[:, 0] - receiver_location[0]
-        dx1[np.abs(dx1) / min_hx < tolerance] = tolerance * min_hx
-        dx2 = self.Xn[:, 1] - receiver_location[0]
-        dx2[np.abs(dx2) / min_hx < tolerance] = tolerance * min_hx
+        # number of receivers and cells in mesh
+        nR = receiver_location.shape[0]
+        nC = self.Xn.shape[0]
 
-        dy1 = self.Yn[:, 0] - receiver_location[1]
-        dy1[np.abs(dy1) / min_hy < tolerance] = tolerance * min_hy
-        dy2 = self.Yn[:, 1] - receiver_location[1]
-        dy2[np.abs(dy2) / min_hy < tolerance] = tolerance * min_hy
+        rows = {component: np.zeros((nR, 3 * nC)) for component in components}
 
-        dz1 = self.Zn[:, 0] - receiver_location[2]
-        dz1[np.abs(dz1) / min_hz < tolerance] = tolerance * min_hz
-        dz2 = self.Zn[:, 1] - receiver_location[2]
-        dz2[np.abs(dz2) / min_hz < tolerance] = tolerance * min_hz
+        (dx1, dx2), (dy1, dy2), (dz1, dz2) = self._node_offsets(
+            receiver_location, tolerance
+        )
 
         # comp. squared diff
         dx2dx2 = dx2 ** 2.0
@@ -372,9 +394,9 @@ class Simulation3DIntegral(BasePFSimulation):
         arg40 = dz1 + r8
 
         if ("bxx" in components) or ("bzz" in components):
-            rows["bxx"] = np.zeros((1, 3 * nC))
+            rows["bxx"] = np.zeros((nR, 3 * nC))
 
-            rows["bxx"][0, 0:nC] = 2 * (
+            rows["bxx"][:, 0:nC] = 2 * (
                 ((dx1 ** 2 - r1 * arg1) / (r1 * arg1 ** 2 + dx1 ** 2 * r1))
                 - ((dx2 ** 2 - r2 * arg6) / (r2 * arg6 ** 2 + dx2 ** 2 * r2))
                 + ((dx2 ** 2 - r3 * arg11) / (r3 * arg11 ** 2 + dx2 ** 2 * r3))
@@ -385,7 +407,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 - ((dx2 ** 2 - r8 * arg36) / (r8 * arg36 ** 2 + dx2 ** 2 * r8))
             )
 
-            rows["bxx"][0, nC : 2 * nC] = (
+            rows["bxx"][:, nC : 2 * nC] = (
                 dx2 / (r5 * arg25)
                 - dx2 / (r2 * arg10)
                 + dx2 / (r3 * arg15)
@@ -396,7 +418,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 - dx1 / (r4 * arg20)
             )
 
-            rows["bxx"][0, 2 * nC :] = (
+            rows["bxx"][:, 2 * nC :] = (
                 dx1 / (r1 * arg4)
                 - dx2 / (r2 * arg9)
                 + dx2 / (r3 * arg14)
@@ -412,9 +434,9 @@ class Simulation3DIntegral(BasePFSimulation):
 
         if ("byy" in components) or ("bzz" in components):
 
-            rows["byy"] = np.zeros((1, 3 * nC))
+            rows["byy"] = np.zeros((nR, 3 * nC))
 
-            rows["byy"][0, 0:nC] = (
+            rows["byy"][:, 0:nC] = (
                 dy2 / (r3 * arg15)
                 - dy2 / (r2 * arg10)
                 + dy1 / (r5 * arg25)
@@ -424,7 +446,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + dy1 / (r7 * arg35)
                 - dy1 / (r6 * arg30)
             )
-            rows["byy"][0, nC : 2 * nC] = 2 * (
+            rows["byy"][:, nC : 2 * nC] = 2 * (
                 ((dy2 ** 2 - r1 * arg2) / (r1 * arg2 ** 2 + dy2 ** 2 * r1))
                 - ((dy2 ** 2 - r2 * arg7) / (r2 * arg7 ** 2 + dy2 ** 2 * r2))
                 + ((dy2 ** 2 - r3 * arg12) / (r3 * arg12 ** 2 + dy2 ** 2 * r3))
@@ -434,7 +456,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + ((dy1 ** 2 - r7 * arg32) / (r7 * arg32 ** 2 + dy1 ** 2 * r7))
                 - ((dy1 ** 2 - r8 * arg37) / (r8 * arg37 ** 2 + dy1 ** 2 * r8))
             )
-            rows["byy"][0, 2 * nC :] = (
+            rows["byy"][:, 2 * nC :] = (
                 dy2 / (r1 * arg3)
                 - dy2 / (r2 * arg8)
                 + dy2 / (r3 * arg13)
@@ -453,9 +475,9 @@ class Simulation3DIntegral(BasePFSimulation):
             rows["bzz"] = -rows["bxx"] - rows["byy"]
 
         if "bxy" in components:
-            rows["bxy"] = np.zeros((1, 3 * nC))
+            rows["bxy"] = np.zeros((nR, 3 * nC))
 
-            rows["bxy"][0, 0:nC] = 2 * (
+            rows["bxy"][:, 0:nC] = 2 * (
                 ((dx1 * arg4) / (r1 * arg1 ** 2 + (dx1 ** 2) * r1))
                 - ((dx2 * arg9) / (r2 * arg6 ** 2 + (dx2 ** 2) * r2))
                 + ((dx2 * arg14) / (r3 * arg11 ** 2 + (dx2 ** 2) * r3))
@@ -465,7 +487,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + ((dx1 * arg34) / (r7 * arg31 ** 2 + (dx1 ** 2) * r7))
                 - ((dx2 * arg39) / (r8 * arg36 ** 2 + (dx2 ** 2) * r8))
             )
-            rows["bxy"][0, nC : 2 * nC] = (
+            rows["bxy"][:, nC : 2 * nC] = (
                 dy2 / (r1 * arg5)
                 - dy2 / (r2 * arg10)
                 + dy2 / (r3 * arg15)
@@ -475,7 +497,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + dy1 / (r7 * arg35)
                 - dy1 / (r8 * arg40)
             )
-            rows["bxy"][0, 2 * nC :] = (
+            rows["bxy"][:, 2 * nC :] = (
                 1 / r1 - 1 / r2 + 1 / r3 - 1 / r4 + 1 / r5 - 1 / r6 + 1 / r7 - 1 / r8
             )
 
@@ -484,9 +506,9 @@ class Simulation3DIntegral(BasePFSimulation):
             rows["bxy"] *= self.M
 
         if "bxz" in components:
-            rows["bxz"] = np.zeros((1, 3 * nC))
+            rows["bxz"] = np.zeros((nR, 3 * nC))
 
-            rows["bxz"][0, 0:nC] = 2 * (
+            rows["bxz"][:, 0:nC] = 2 * (
                 ((dx1 * arg5) / (r1 * (arg1 ** 2) + (dx1 ** 2) * r1))
                 - ((dx2 * arg10) / (r2 * (arg6 ** 2) + (dx2 ** 2) * r2))
                 + ((dx2 * arg15) / (r3 * (arg11 ** 2) + (dx2 ** 2) * r3))
@@ -496,10 +518,10 @@ class Simulation3DIntegral(BasePFSimulation):
                 + ((dx1 * arg35) / (r7 * (arg31 ** 2) + (dx1 ** 2) * r7))
                 - ((dx2 * arg40) / (r8 * (arg36 ** 2) + (dx2 ** 2) * r8))
             )
-            rows["bxz"][0, nC : 2 * nC] = (
+            rows["bxz"][:, nC : 2 * nC] = (
                 1 / r1 - 1 / r2 + 1 / r3 - 1 / r4 + 1 / r5 - 1 / r6 + 1 / r7 - 1 / r8
             )
-            rows["bxz"][0, 2 * nC :] = (
+            rows["bxz"][:, 2 * nC :] = (
                 dz2 / (r1 * arg4)
                 - dz2 / (r2 * arg9)
                 + dz1 / (r3 * arg14)
@@ -515,12 +537,12 @@ class Simulation3DIntegral(BasePFSimulation):
             rows["bxz"] *= self.M
 
         if "byz" in components:
-            rows["byz"] = np.zeros((1, 3 * nC))
+            rows["byz"] = np.zeros((nR, 3 * nC))
 
-            rows["byz"][0, 0:nC] = (
+            rows["byz"][:, 0:nC] = (
                 1 / r3 - 1 / r2 + 1 / r5 - 1 / r8 + 1 / r1 - 1 / r4 + 1 / r7 - 1 / r6
             )
-            rows["byz"][0, nC : 2 * nC] = 2 * (
+            rows["byz"][:, nC : 2 * nC] = 2 * (
                 (((dy2 * arg5) / (r1 * (arg2 ** 2) + (dy2 ** 2) * r1)))
                 - (((dy2 * arg10) / (r2 * (arg7 ** 2) + (dy2 ** 2) * r2)))
                 + (((dy2 * arg15) / (r3 * (arg12 ** 2) + (dy2 ** 2) * r3)))
@@ -530,7 +552,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + (((dy1 * arg35) / (r7 * (arg32 ** 2) + (dy1 ** 2) * r7)))
                 - (((dy1 * arg40) / (r8 * (arg37 ** 2) + (dy1 ** 2) * r8)))
             )
-            rows["byz"][0, 2 * nC :] = (
+            rows["byz"][:, 2 * nC :] = (
                 dz2 / (r1 * arg3)
                 - dz2 / (r2 * arg8)
                 + dz1 / (r3 * arg13)
@@ -546,9 +568,9 @@ class Simulation3DIntegral(BasePFSimulation):
             rows["byz"] *= self.M
 
         if ("bx" in components) or ("tmi" in components):
-            rows["bx"] = np.zeros((1, 3 * nC))
+            rows["bx"] = np.zeros((nR, 3 * nC))
 
-            rows["bx"][0, 0:nC] = (
+            rows["bx"][:, 0:nC] = (
                 (-2 * np.arctan2(dx1, arg1 + tolerance))
                 - (-2 * np.arctan2(dx2, arg6 + tolerance))
                 + (-2 * np.arctan2(dx2, arg11 + tolerance))
@@ -558,7 +580,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + (-2 * np.arctan2(dx1, arg31 + tolerance))
                 - (-2 * np.arctan2(dx2, arg36 + tolerance))
             )
-            rows["bx"][0, nC : 2 * nC] = (
+            rows["bx"][:, nC : 2 * nC] = (
                 np.log(arg5)
                 - np.log(arg10)
                 + np.log(arg15)
@@ -568,7 +590,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + np.log(arg35)
                 - np.log(arg40)
             )
-            rows["bx"][0, 2 * nC :] = (
+            rows["bx"][:, 2 * nC :] = (
                 (np.log(arg4) - np.log(arg9))
                 + (np.log(arg14) - np.log(arg19))
                 + (np.log(arg24) - np.log(arg29))
@@ -579,9 +601,9 @@ class Simulation3DIntegral(BasePFSimulation):
             rows["bx"] *= self.M
 
         if ("by" in components) or ("tmi" in components):
-            rows["by"] = np.zeros((1, 3 * nC))
+            rows["by"] = np.zeros((nR, 3 * nC))
 
-            rows["by"][0, 0:nC] = (
+            rows["by"][:, 0:nC] = (
                 np.log(arg5)
                 - np.log(arg10)
                 + np.log(arg15)
@@ -591,7 +613,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + np.log(arg35)
                 - np.log(arg40)
             )
-            rows["by"][0, nC : 2 * nC] = (
+            rows["by"][:, nC : 2 * nC] = (
                 (-2 * np.arctan2(dy2, arg2 + tolerance))
                 - (-2 * np.arctan2(dy2, arg7 + tolerance))
                 + (-2 * np.arctan2(dy2, arg12 + tolerance))
@@ -601,7 +623,7 @@ class Simulation3DIntegral(BasePFSimulation):
                 + (-2 * np.arctan2(dy1, arg32 + tolerance))
                 - (-2 * np.arctan2(dy1, arg37 + tolerance))
             )
-            rows["by"][0, 2 * nC :] = (
+            rows["by"][:, 2 * nC :] = (
                 (np.log(arg3) - np.log(arg8))
                 + (np.log(arg13) - np.log(arg18))
                 + (np.log(arg23) - np.log(arg28))
@@ -613,9 +635,9 @@ class Simulation3DIntegral(BasePFSimulation):
             rows["by"] *= self.M
 
         if ("bz" in components) or ("tmi" in components):
-            rows["bz"] = np.zeros((1, 3 * nC))
+            rows["bz"] = np.zeros((nR, 3 * nC))
 
-            rows["bz"][0, 0:nC] = (
+            rows["bz"][:, 0:nC] = (
                 np.log(arg4)
                 - np.log(arg9)
                 + np.log(arg14)
@@ -625,13 +647,13 @@ class Simulation3DIntegral(BasePFSimulation):
                 + np.log(arg34)
                 - np.log(arg39)
             )
-            rows["bz"][0, nC : 2 * nC] = (
+            rows["bz"][:, nC : 2 * nC] = (
                 (np.log(arg3) - np.log(arg8))
                 + (np.log(arg13) - np.log(arg18))
                 + (np.log(arg23) - np.log(arg28))
                 + (np.log(arg33) - np.log(arg38))
             )
-            rows["bz"][0, 2 * nC :] = (
+            rows["bz"][:, 2 * nC :] = (
                 (-2 * np.arctan2(dz2, arg1_ + tolerance))
                 - (-2 * np.arctan2(dz2, arg6_ + tolerance))
                 + (-2 * np.arctan2(dz1, arg11_ + tolerance))
@@ -648,10 +670,162 @@ class Simulation3DIntegral(BasePFSimulation):
         if "tmi" in components:
 
             rows["tmi"] = np.dot(
-                self.tmi_projection, np.r_[rows["bx"], rows["by"], rows["bz"]]
-            )
+                self.tmi_projection,
+                np.vstack([rows["bx"].ravel(), rows["by"].ravel(), rows["bz"].ravel()]),
+            ).reshape((nR, -1))
 
-        return np.vstack([rows[component] for component in components])
+        return np.stack([rows[component] for component in components], axis=1).reshape(
+            (nR * len(components), -1)
+        )
+
+    def _node_offsets(self, receiver_location, tolerance=1e-4):
+        """
+        Offsets between the receivers and the (bsw, tne) nodes of the cells
+        along x, y and z, each of shape (n_receivers, nC). Offsets within
+        tolerance of a node or edge are adjusted.
+        """
+        # base cell dimensions
+        min_hx, min_hy = self.mesh.h[0].min(), self.mesh.h[1].min()
+        if len(self.mesh.h) < 3:
+            # Allow for 2D quadtree representations by using a dummy cell height.
+            # Actually cell heights will come from externally defined ``self.Zn``
+            min_hz = np.minimum(min_hx, min_hy) / 10.0
+        else:
+            min_hz = self.mesh.h[2].min()
+
+        offsets = []
+        for nodes, location, min_h in zip(
+            [self.Xn, self.Yn, self.Zn], receiver_location.T, [min_hx, min_hy, min_hz]
+        ):
+            axis = []
+            for node in nodes.T:
+                delta = node - location[:, None]
+                delta[np.abs(delta) / min_h < tolerance] = tolerance * min_h
+                axis.append(delta)
+            offsets.append(axis)
+
+        return offsets
+
+    def _magnetization_weights(self):
+        """
+        Magnetization of the cells as an array of shape (3, n_segments, nC)
+        weighting the x, y and z kernel columns for every segment of the
+        columns of G, one for scalar and three for vector models. None if M is
+        not made of diagonal blocks.
+        """
+        cached = getattr(self, "_magnetization_cache", None)
+        if cached is not None and cached[0] is self.M:
+            return cached[1]
+
+        nC = self.Xn.shape[0]
+        M = sp.coo_matrix(self.M)
+        weights = None
+        if M.shape == (3 * nC, nC) and np.all(M.row % nC == M.col):
+            weights = np.zeros((3, 1, nC))
+            np.add.at(weights, (M.row // nC, 0, M.col), M.data)
+        elif M.shape == (3 * nC, 3 * nC) and np.all(M.row == M.col):
+            weights = np.zeros((3, 3, nC))
+            np.add.at(weights, (M.row // nC, M.row // nC, M.row % nC), M.data)
+
+        self._magnetization_cache = (self.M, weights)
+
+        return weights
+
+    def _evaluate_fused(self, receiver_location, components, weights, tolerance=1e-4):
+        """
+        Rows of bx, by, bz and tmi data accumulated corner by corner from the
+        six independent entries of the symmetric magnetic tensor, already
+        projected onto the components and weighted by the magnetization.
+
+        Only one (n_receivers, nC) row per component and segment is held, in
+        place of the (n_receivers, 3 * nC) rows of bx, by and bz, and the
+        entries not contributing to the components are skipped.
+
+        :param numpy.ndarray receiver_location: array of shape (n_receivers, 3)
+        :param list[str] components: components among 'bx', 'by', 'bz' and 'tmi'
+        :param numpy.ndarray weights: magnetization returned by _magnetization_weights
+        :param float tolerance: small constant to avoid singularity near nodes and edges
+        """
+        nR = receiver_location.shape[0]
+        n_segments, nC = weights.shape[1:]
+
+        directions = {
+            "bx": [1.0, 0.0, 0.0],
+            "by": [0.0, 1.0, 0.0],
+            "bz": [0.0, 0.0, 1.0],
+            "tmi": np.ravel(self.tmi_projection),
+        }
+        projections = np.vstack([directions[component] for component in components])
+
+        # Weight of the entries (xx, yy, zz, xy, xz, yz) of the tensor for every
+        # component and segment
+        coefficients = []
+        for a, b in [(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]:
+            coefficient = projections[:, a, None, None] * weights[b]
+            if a != b:
+                coefficient = coefficient + projections[:, b, None, None] * weights[a]
+            coefficients.append(coefficient / (-4 * np.pi))
+        targets = [np.argwhere(np.any(values != 0, axis=-1)) for values in coefficients]
+
+        rows = np.zeros((nR, len(components), n_segments, nC))
+        dx, dy, dz = self._node_offsets(receiver_location, tolerance)
+        for ii, jj, kk in itertools.product(range(2), repeat=3):
+            # Corners alternate in sign with their number of bsw nodes
+            sign = 1.0 if (3 - ii - jj - kk) % 2 else -1.0
+            x, y, z = dx[ii], dy[jj], dz[kk]
+            r = np.sqrt(z ** 2 + (y ** 2 + x ** 2))
+
+            for entry, coefficient in enumerate(coefficients):
+                if len(targets[entry]) == 0:
+                    continue
+
+                if entry == 0:
+                    values = -2 * np.arctan2(x, y + z + r + tolerance)
+                elif entry == 1:
+                    values = -2 * np.arctan2(y, x + z + r + tolerance)
+                elif entry == 2:
+                    values = -2 * np.arctan2(z, x + y + r + tolerance)
+                elif entry == 3:
+                    values = np.log(z + r)
+                elif entry == 4:
+                    values = np.log(y + r)
+                else:
+                    values = np.log(x + r)
+
+                for component, segment in targets[entry]:
+                    rows[:, component, segment] += values * (
+                        sign * coefficient[component, segment]
+                    )
+
+        return rows.reshape((nR * len(components), n_segments * nC))
+
+    def _sensitivity_cache_key(self):
+        """
+        Hash of the state defining the kernel, including the magnetization.
+        """
+        M = self.M.tocsr()
+        return hash_arrays(
+            super()._sensitivity_cache_key(),
+            self.model_type,
+            self.survey.source_field.parameters,
+            M.data,
+            M.indices,
+        )
+
+    def _reference_kernel(self, receiver_locations, components, Xn, Yn, Zn):
+        """
+        Kernel rows of the reference cells without magnetization, mapped onto
+        the model by _kernel_mapping.
+        """
+        M = self._M
+        try:
+            self._M = sp.identity(3 * Xn.shape[0])
+            return super()._reference_kernel(receiver_locations, components, Xn, Yn, Zn)
+        finally:
+            self._M = M
+
+    def _kernel_mapping(self):
+        return self.M
 
     @property
     def deleteTheseOnModelUpdate(self):
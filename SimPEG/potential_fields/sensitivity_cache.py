@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import numpy as np
+
+from ..utils.code_utils import hash_arrays
+
+
+class SensitivityCache(object):
+    """
+    Content addressed storage of sensitivity rows on disk.
+
+    Rows are written to block files grouped under a key hashing the state that
+    defines the kernel (mesh, active cells, model type, ...). Every receiver
+    of a block is identified by a hash of its location and components, so that
+    rows of unchanged receivers are reused by later simulations while only new
+    receivers are computed.
+
+    An index records the receivers held by every block file, its size and last
+    use. The least recently used blocks are evicted to keep the cache below
+    ``max_size``.
+
+    :param str path: directory of the cache
+    :param float max_size: maximum size of the cache (GB), unbounded if None
+    """
+
+    index_name = "sensitivity_index.json"
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+
+    @property
+    def index(self):
+        """
+        Index of the block files, keyed by their path relative to the cache.
+        """
+        if getattr(self, "_index", None) is None:
+            index_file = os.path.join(self.path, self.index_name)
+            if os.path.exists(index_file):
+                with open(index_file, "r") as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {}
+
+        return self._index
+
+    def _write_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, self.index_name), "w") as f:
+            json.dump(self.index, f)
+
+    def locate(self, key, receiver_keys, n_rows):
+        """
+        Locate the cached rows of the receivers in the block files.
+
+        :param str key: hash of the state defining the kernel
+        :param list[str] receiver_keys: hash of every receiver
+        :param numpy.ndarray n_rows: number of rows of every receiver
+        :rtype: tuple
+        :returns: (copies, found) with copies a dict mapping every block file
+            to (source, target) arrays of its rows and of the matching rows of
+            the receivers, and found a boolean array flagging the receivers
+            read from the cache
+        """
+        locations = {}
+        for name, block in self.index.items():
+            if block["key"] != key:
+                continue
+            offsets = np.r_[0, np.cumsum(block["rows"])]
+            for receiver, offset, count in zip(
+                block["receivers"], offsets, block["rows"]
+            ):
+                locations[receiver] = (name, offset, count)
+
+        offsets = np.r_[0, np.cumsum(n_rows)]
+        found = np.zeros(len(receiver_keys), dtype=bool)
+
+        # Group the rows by block file
+        copies = {}
+        for ii, receiver in enumerate(receiver_keys):
+            if receiver in locations and locations[receiver][2] == n_rows[ii]:
+                name, offset, count = locations[receiver]
+                source, target = copies.setdefault(name, ([], []))
+                source.append(np.arange(offset, offset + count))
+                target.append(np.arange(offsets[ii], offsets[ii + 1]))
+                found[ii] = True
+
+        copies = {
+            name: (np.hstack(source), np.hstack(target))
+            for name, (source, target) in copies.items()
+        }
+        for name in copies:
+            self.index[name]["last_used"] = time.time()
+
+        if copies:
+            self.evict(keep=copies)
+            self._write_index()
+
+        return copies, found
+
+    def allocate(self, key, receiver_keys, n_rows, n_columns):
+        """
+        Create the block file of new receivers, memory mapped so that their
+        rows are written in place. The block is only indexed once committed.
+
+        :param str key: hash of the state defining the kernel
+        :param list[str] receiver_keys: hash of every receiver of the block
+        :param numpy.ndarray n_rows: number of rows of every receiver
+        :param int n_columns: number of columns of the kernel
+        :rtype: tuple
+        :returns: (name, rows) with name the block file relative to the cache
+            and rows the writable memory map of shape (n_rows.sum(), n_columns)
+        """
+        name = os.path.join(key, hash_arrays(np.array(receiver_keys)) + ".npy")
+        os.makedirs(os.path.join(self.path, key), exist_ok=True)
+        rows = np.lib.format.open_memmap(
+            os.path.join(self.path, name),
+            mode="w+",
+            dtype=np.float64,
+            shape=(int(np.sum(n_rows)), n_columns),
+        )
+
+        return name, rows
+
+    def commit(self, name, key, receiver_keys, n_rows, keep=()):
+        """
+        Index a block file written after :meth:`allocate`, evicting the least
+        recently used blocks if the cache grows over ``max_size``.
+
+        :param str name: block file relative to the cache
+        :param str key: hash of the state defining the kernel
+        :param list[str] receiver_keys: hash of every receiver of the block
+        :param numpy.ndarray n_rows: number of rows of every receiver
+        :param keep: other block files in use, never evicted
+        """
+        self.index[name] = {
+            "key": key,
+            "receivers": list(receiver_keys),
+            "rows": [int(count) for count in n_rows],
+            "size": os.path.getsize(os.path.join(self.path, name)),
+            "last_used": time.time(),
+        }
+        self.evict(keep=set(keep) | {name})
+        self._write_index()
+
+    def evict(self, keep=()):
+        """
+        Delete the least recently used blocks until the cache fits in ``max_size``.
+
+        :param keep: block files never evicted
+        """
+        if self.max_size is None:
+            return
+
+        blocks = sorted(self.index, key=lambda name: self.index[name]["last_used"])
+        size = sum(self.index[name]["size"] for name in blocks)
+        for name in blocks:
+            if size <= self.max_size * 1e9:
+                break
+            if name in keep:
+                continue
+            size -= self.index[name]["size"]
+            del self.index[name]
+            try:
+                os.remove(os.path.join(self.path, name))
+                os.rmdir(os.path.join(self.path, os.path.dirname(name)))
+            except OSError:
+                # Already deleted, or other blocks remain under the key
+                pass
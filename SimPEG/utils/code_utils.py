@@ -1,5 +1,6 @@
 from __future__ import print_function, division
 import types
+import hashlib
 import numpy as np
 from functools import wraps
 import warnings
@@ -21,6 +22,22 @@ except ImportError:
             )
 
 
+def hash_arrays(*values):
+    """
+    Hash of a sequence of arrays, strings or numbers.
+
+    :rtype: str
+    :returns: hexadecimal digest identifying the content of the values
+    """
+    digest = hashlib.sha1()
+    for value in values:
+        value = np.ascontiguousarray(value)
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(value.tobytes())
+
+    return digest.hexdigest()
+
+
 def memProfileWrapper(towrap, *funNames):
     """
     Create a wrapper for the functions you want to use, wrapping up the
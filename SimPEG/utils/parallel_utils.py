@@ -0,0 +1,85 @@
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+def fork_available():
+    """
+    Whether worker processes can be forked on this platform.
+
+    :rtype: bool
+    """
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def shared_array(shape, processes=True):
+    """
+    Float64 array of zeros written in place by the workers of
+    :func:`worker_executor`.
+
+    The array is held in an anonymous shared memory map if the workers are
+    forked processes, and in memory otherwise.
+
+    :param tuple shape: shape of the array
+    :param bool processes: whether the workers are processes, if fork is
+        available
+    :rtype: numpy.ndarray
+    """
+    if not (processes and fork_available()):
+        return np.zeros(shape)
+
+    size = int(np.prod(shape))
+    buffer = mmap.mmap(-1, max(size, 1) * 8)
+    return np.frombuffer(buffer, dtype=np.float64, count=size).reshape(shape)
+
+
+def worker_executor(function, n_workers, processes=True):
+    """
+    Executor of ``n_workers`` workers applying ``function``.
+
+    Workers are processes forked so that they share the state of
+    ``function``, such as a bound simulation and the outputs of
+    :func:`shared_array`, without pickling it. ``function`` is handed to the
+    workers of the executor when they start, so that concurrent calls keep
+    their own state. Threads are used if ``processes`` is False or fork is not
+    available, relying on numpy releasing the GIL.
+
+    .. code:: python
+
+        executor, task = worker_executor(partial(fill, simulation, out), 4)
+        with executor:
+            for _ in executor.map(task, blocks):
+                pass
+
+    :param callable function: function of the arguments of every task
+    :param int n_workers: number of workers
+    :param bool processes: whether to fork processes, if available
+    :rtype: tuple
+    :returns: (executor, task) with task the picklable callable to submit to
+        the executor in place of ``function``
+    """
+    if processes and fork_available():
+        executor = ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_set_worker_function,
+            initargs=(function,),
+        )
+        return executor, _run_worker_function
+
+    return ThreadPoolExecutor(max_workers=n_workers), function
+
+
+# Function of the forked worker process, set when it starts
+_worker_function = None
+
+
+def _set_worker_function(function):
+    global _worker_function
+    _worker_function = function
+
+
+def _run_worker_function(*args):
+    return _worker_function(*args)
@@ -0,0 +1,164 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MemmapSensitivity(object):
+    """
+    Sensitivity matrix stored on disk, applied by blocks of rows.
+
+    The sensitivities of the data with respect to (nC,) stored parameters are
+    memory mapped from a float32 ``.npy`` file. The sensitivity with respect
+    to the model is ``J = J_stored @ deriv``, with ``deriv`` the sparse
+    derivative of the stored parameters with respect to the model, the
+    identity if the file holds the sensitivities with respect to the model.
+
+    ``J @ v``, ``J.T @ w`` and the diagonal of ``J.T @ W @ J`` read the file
+    by blocks of rows, applied in parallel by ``n_threads`` threads. Row access
+    ``J[i]`` and slicing ``J[rows]`` return dense rows.
+
+    :param str filename: ``.npy`` file of the (nD, nC) sensitivities with
+        respect to the stored parameters
+    :param scipy.sparse.spmatrix deriv: (nC, nP) derivative of the stored
+        parameters with respect to the model
+    :param float chunk_size: size (MB) of the blocks of rows read at once, as
+        float64 copies of the (nC,) rows of the file
+    :param int n_threads: number of threads applying the blocks
+    """
+
+    def __init__(self, filename, deriv, chunk_size=128.0, n_threads=1):
+        self.filename = filename
+        self.values = np.load(filename, mmap_mode="r")
+        self.deriv = sp.csr_matrix(deriv)
+        self.chunk_size = chunk_size
+        self.n_threads = n_threads
+
+    @property
+    def shape(self):
+        return (self.values.shape[0], self.deriv.shape[1])
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    @property
+    def T(self):
+        return _TransposedMemmapSensitivity(self)
+
+    def _blocks(self):
+        """
+        Slices of the blocks of rows read at once, sized from the float64 copies
+        of the rows of the file made by :meth:`_read`.
+        """
+        n_columns = max(self.values.shape[1], 1)
+        n_block = max(1, int(self.chunk_size * 1e6 // (8 * n_columns)))
+        return [
+            slice(start, min(start + n_block, self.shape[0]))
+            for start in range(0, self.shape[0], n_block)
+        ]
+
+    def _map(self, func):
+        """
+        Apply ``func`` to the blocks of rows, in parallel if more than one
+        thread is used.
+        """
+        blocks = self._blocks()
+        if self.n_threads == 1 or len(blocks) == 1:
+            return [func(rows) for rows in blocks]
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            return list(executor.map(func, blocks))
+
+    def _read(self, rows):
+        """
+        Dense rows of the sensitivity with respect to the stored parameters.
+        """
+        return np.asarray(self.values[rows], dtype=np.float64)
+
+    def dot(self, other):
+        other = self.deriv @ np.asarray(other)
+        out = np.empty((self.shape[0],) + other.shape[1:])
+
+        def apply(rows):
+            out[rows] = self._read(rows) @ other
+
+        self._map(apply)
+        return out
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+    def jtj_diag(self, weights=None):
+        """
+        Diagonal of ``J.T @ diag(weights) @ J``.
+
+        :param numpy.ndarray weights: (nD,) squared weights of the data, ones
+            if None
+        :rtype: numpy.ndarray
+        :return: (nP,) diagonal
+        """
+        if weights is None:
+            weights = np.ones(self.shape[0])
+
+        def apply(rows):
+            values = self._read(rows) @ self.deriv
+            return weights[rows] @ (values * values)
+
+        return np.sum(self._map(apply), axis=0)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self[index : index + 1][0]
+
+        return self._read(index) @ self.deriv
+
+    def toarray(self):
+        """
+        Dense matrix read from the file.
+        """
+        return self[:]
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.toarray(), dtype=dtype)
+
+
+class _TransposedMemmapSensitivity(object):
+    """
+    Transpose of a :class:`MemmapSensitivity`, for ``J.T @ w``.
+    """
+
+    def __init__(self, matrix):
+        self.T = matrix
+
+    @property
+    def shape(self):
+        return self.T.shape[::-1]
+
+    def dot(self, other):
+        other = np.asarray(other)
+
+        def apply(rows):
+            return self.T._read(rows).T @ other[rows]
+
+        return self.T.deriv.T @ np.sum(self.T._map(apply), axis=0)
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+
+def create_sensitivity_file(filename, shape):
+    """
+    Create the float32 ``.npy`` file of a sensitivity matrix, memory mapped
+    for writing. Its values are zeros.
+
+    :param str filename: path of the file
+    :param tuple shape: shape of the matrix
+    :rtype: numpy.memmap
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return np.lib.format.open_memmap(
+        filename, mode="w+", dtype=np.float32, shape=tuple(shape)
+    )
@@ -81,12 +81,12 @@ def SolverWrapD(fun, factorize=True, checkAccuracy=True, accuracyTol=1e-6, name=
             if b.dtype is np.dtype("O"):
                 b = b.astype(type(b[0, 0]))
 
-            X = np.empty_like(b)
-
-            for i in range(b.shape[1]):
-                if factorize:
-                    X[:, i] = self.solver.solve(b[:, i])
-                else:
+            if factorize:
+                # Back substitute all the columns at once
+                X = self.solver.solve(b)
+            else:
+                X = np.empty_like(b)
+                for i in range(b.shape[1]):
                     X[:, i] = fun(self.A, b[:, i], **self.kwargs)
 
         if self.checkAccuracy:
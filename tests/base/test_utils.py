@@ -24,8 +24,10 @@ from SimPEG.utils import (
     download,
     surface2ind_topo,
 )
+from SimPEG.utils.parallel_utils import shared_array, worker_executor
 import discretize
 from discretize.tests import checkDerivative
+from functools import partial
 
 
 TOL = 1e-8
@@ -338,6 +340,28 @@ class TestDiagEst(unittest.TestCase):
         self.assertTrue(err < TOL)
 
 
+def _fill(out, value, index):
+    out[index] = value * index
+
+
+class TestWorkerExecutor(unittest.TestCase):
+    def test_shared_output(self):
+        # Workers of concurrent executors fill their own outputs in place
+        for processes in [True, False]:
+            outputs = [shared_array(10, processes=processes) for _ in range(2)]
+            executors = [
+                worker_executor(partial(_fill, out, value), 2, processes=processes)
+                for value, out in enumerate(outputs, start=1)
+            ]
+            for executor, task in executors:
+                with executor:
+                    for _ in executor.map(task, range(10)):
+                        pass
+
+            for value, out in enumerate(outputs, start=1):
+                np.testing.assert_array_equal(out, value * np.arange(10.0))
+
+
 class TestDownload(unittest.TestCase):
     def test_downloads(self):
         url = "https://storage.googleapis.com/simpeg/Chile_GRAV_4_Miller/"
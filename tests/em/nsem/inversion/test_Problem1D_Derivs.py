@@ -60,6 +60,48 @@ def DerivJvecTest_1D(halfspace_value, freq=False, expMap=True):
     return tests.checkDerivative(fun, x0, num=6, plotIt=False, eps=FLR)
 
 
+def DerivJvecTest_1D_stitched():
+
+    frequencies = np.logspace(0, 4, 11)
+    n_sounding = 4
+
+    # Every sounding holds the planewave sources of all frequencies
+    source_list = []
+    for _ in range(n_sounding):
+        for frequency in frequencies:
+            receivers_list = [
+                nsem.receivers.PointNaturalSource(component=component)
+                for component in ["real", "imag", "app_res", "phase"]
+            ]
+            source_list.append(nsem.sources.Planewave(receivers_list, frequency))
+    survey = nsem.survey.Survey(source_list)
+
+    layer_thicknesses = np.array([200, 100])
+    simulation = nsem.simulation_1d.Simulation1DRecursiveStitched(
+        survey=survey,
+        sigmaMap=maps.ExpMap(nP=3 * n_sounding),
+        thicknesses=layer_thicknesses,
+    )
+
+    np.random.seed(1983)
+    x0 = np.log(0.01) + np.random.randn(3 * n_sounding)
+
+    # Every sounding matches the 1D simulation of its layers
+    sounding = nsem.simulation_1d.Simulation1DRecursive(
+        survey=nsem.survey.Survey(source_list[: len(frequencies)]),
+        sigmaMap=maps.ExpMap(nP=3),
+        thicknesses=layer_thicknesses,
+    )
+    d = simulation.dpred(x0).reshape((n_sounding, -1))
+    for ii, m in enumerate(x0.reshape((n_sounding, 3))):
+        np.testing.assert_allclose(d[ii], sounding.dpred(m), rtol=1e-12)
+
+    def fun(x):
+        return simulation.dpred(x), lambda x: simulation.Jvec(x0, x)
+
+    return tests.checkDerivative(fun, x0, num=6, plotIt=False, eps=FLR)
+
+
 def DerivJvecTest(halfspace_value, freq=False, expMap=True):
 
     survey, sig, sigBG, mesh = nsem.utils.test_utils.setup1DSurvey(
@@ -92,6 +134,9 @@ class NSEM_DerivTests(unittest.TestCase):
     def test_derivJvec_Z1d_e(self):
         self.assertTrue(DerivJvecTest_1D(1e-2))
 
+    def test_derivJvec_Z1d_stitched(self):
+        self.assertTrue(DerivJvecTest_1D_stitched())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -100,6 +100,23 @@ class DC1DSimulation(unittest.TestCase):
         print("Adjoint Test", np.abs(wtJv - vtJtw), passed)
         self.assertTrue(passed)
 
+    def test_thicknesses_deriv(self):
+        wires = maps.Wires(("rho", self.mesh.nC), ("t", self.mesh.nC - 1))
+        simulation = dc.simulation_1d.Simulation1DLayers(
+            survey=self.survey,
+            rhoMap=maps.ExpMap(nP=self.mesh.nC) * wires.rho,
+            thicknessesMap=maps.ExpMap(nP=self.mesh.nC - 1) * wires.t,
+            data_type="apparent_resistivity",
+        )
+        m0 = np.r_[np.log([10.0, 50.0, 5.0]), np.log([10.0, 20.0])]
+        passed = tests.checkDerivative(
+            lambda m: [simulation.dpred(m), lambda mx: simulation.Jvec(m0, mx)],
+            m0,
+            plotIt=False,
+            num=3,
+        )
+        self.assertTrue(passed)
+
     def test_dataObj(self):
         passed = tests.checkDerivative(
             lambda m: [self.dmis(m), self.dmis.deriv(m)], self.m0, plotIt=False, num=3
@@ -107,5 +124,111 @@ class DC1DSimulation(unittest.TestCase):
         self.assertTrue(passed)
 
 
+class DC1DStitchedSimulation(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(41)
+        n_sounding = 5
+        thicknesses = np.r_[10.0, 20.0, 40.0]
+        n_layer = len(thicknesses) + 1
+        abhalf = np.logspace(1, 3, 11)
+
+        def sounding(x):
+            srclist = []
+            for ab in abhalf:
+                rx = dc.receivers.Dipole(
+                    np.r_[x - 5.0, 0.0, 0.0], np.r_[x + 5.0, 0.0, 0.0]
+                )
+                srclist.append(
+                    dc.sources.Dipole(
+                        [rx], np.r_[x - ab, 0.0, 0.0], np.r_[x + ab, 0.0, 0.0]
+                    )
+                )
+            return srclist
+
+        self.sounding_survey = dc.survey.Survey(sounding(0.0))
+        self.survey = dc.survey.Survey(
+            [src for x in 50.0 * np.arange(n_sounding) for src in sounding(x)]
+        )
+        self.thicknesses = thicknesses
+        self.n_layer = n_layer
+        self.m0 = np.log(100.0) + np.random.randn(n_sounding * n_layer)
+        self.p = dc.simulation_1d.Simulation1DLayersStitched(
+            survey=self.survey,
+            rhoMap=maps.ExpMap(nP=len(self.m0)),
+            thicknesses=thicknesses,
+            data_type="apparent_resistivity",
+            sounding_locations=50.0 * np.arange(n_sounding),
+            max_chunk_size=0.01,
+        )
+
+    def test_soundings(self):
+        # Every sounding matches the 1D simulation of its layers
+        simulation = dc.simulation_1d.Simulation1DLayers(
+            survey=self.sounding_survey,
+            rhoMap=maps.ExpMap(nP=self.n_layer),
+            thicknesses=self.thicknesses,
+            data_type="apparent_resistivity",
+        )
+        d = self.p.dpred(self.m0).reshape((-1, self.sounding_survey.nD))
+        J = self.p.getJ(self.m0).toarray()
+        for ii, m in enumerate(self.m0.reshape((-1, self.n_layer))):
+            rows = slice(
+                ii * self.sounding_survey.nD, (ii + 1) * self.sounding_survey.nD
+            )
+            columns = slice(ii * self.n_layer, (ii + 1) * self.n_layer)
+            np.testing.assert_allclose(d[ii], simulation.dpred(m), rtol=1e-10)
+            np.testing.assert_allclose(
+                J[rows, columns],
+                simulation.getJ(m),
+                rtol=1e-10,
+                atol=1e-10 * np.abs(J).max(),
+            )
+            simulation._Jmatrix = None
+        self.assertEqual(self.p.getJ(self.m0).nnz, self.survey.nD * self.n_layer)
+
+    def test_misfit(self):
+        passed = tests.checkDerivative(
+            lambda m: [self.p.dpred(m), lambda mx: self.p.Jvec(self.m0, mx)],
+            self.m0,
+            plotIt=False,
+            num=3,
+        )
+        self.assertTrue(passed)
+
+    def test_adjoint(self):
+        v = np.random.rand(len(self.m0))
+        w = np.random.rand(self.survey.nD)
+        wtJv = w.dot(self.p.Jvec(self.m0, v))
+        vtJtw = v.dot(self.p.Jtvec(self.m0, w))
+        passed = np.abs(wtJv - vtJtw) < 1e-8
+        print("Adjoint Test", np.abs(wtJv - vtJtw), passed)
+        self.assertTrue(passed)
+
+    def test_workers(self):
+        d = self.p.dpred(self.m0)
+        J = self.p.getJ(self.m0).toarray()
+        self.p.n_workers = 2
+        self.p._Jmatrix = None
+        np.testing.assert_allclose(self.p.dpred(self.m0), d, rtol=1e-12)
+        np.testing.assert_allclose(self.p.getJ(self.m0).toarray(), J, rtol=1e-12)
+
+    def test_laterally_constrained(self):
+        mesh = self.p.stitched_mesh
+        self.assertEqual(mesh.nC, len(self.m0))
+        np.testing.assert_allclose(mesh.hx, np.r_[self.thicknesses, 40.0])
+        np.testing.assert_allclose(mesh.hy, 50.0)
+
+        dobs = self.p.make_synthetic_data(self.m0, add_noise=True)
+        dmis = data_misfit.L2DataMisfit(simulation=self.p, data=dobs)
+        reg = regularization.Tikhonov(mesh, alpha_x=1.0, alpha_y=10.0)
+        passed = tests.checkDerivative(
+            lambda m: [dmis(m) + reg(m), dmis.deriv(m) + reg.deriv(m)],
+            self.m0,
+            plotIt=False,
+            num=3,
+        )
+        self.assertTrue(passed)
+
+
 if __name__ == "__main__":
     unittest.main()
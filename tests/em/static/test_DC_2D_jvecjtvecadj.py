@@ -1,6 +1,7 @@
 from __future__ import print_function
 import unittest
 import numpy as np
+import threading
 import discretize
 from SimPEG import (
     maps,
@@ -22,6 +23,27 @@ except ImportError:
 np.random.seed(41)
 
 
+class RefactoredSolver(object):
+    """Direct solver counting how often it is created and refactored"""
+
+    n_created = 0
+    n_factored = 0
+
+    def __init__(self, A, **kwargs):
+        RefactoredSolver.n_created += 1
+        self.factor(A)
+
+    def factor(self, A):
+        RefactoredSolver.n_factored += 1
+        self.solver = Solver(A)
+
+    def __mul__(self, other):
+        return self.solver * other
+
+    def clean(self):
+        self.solver.clean()
+
+
 class DCProblem_2DTests(unittest.TestCase):
 
     formulation = "Simulation2DCellCentered"
@@ -96,6 +118,79 @@ class DCProblem_2DTests(unittest.TestCase):
         print("Adjoint Test", np.abs(wtJv - vtJtw), passed)
         self.assertTrue(passed)
 
+    def test_workers(self):
+        v = np.random.rand(self.mesh.nC)
+        w = np.random.rand(self.data.nD)
+        d = self.p.dpred(self.m0)
+        Jv = self.p.Jvec(self.m0, v)
+        Jtv = self.p.Jtvec(self.m0, w)
+
+        for executor in ["threads", "processes"]:
+            self.p.n_workers = 2
+            self.p.executor = executor
+            self.p._Jmatrix = None
+            np.testing.assert_allclose(self.p.dpred(self.m0), d, rtol=1e-12)
+            np.testing.assert_allclose(self.p.Jvec(self.m0, v), Jv, rtol=1e-12)
+            np.testing.assert_allclose(self.p.Jtvec(self.m0, w), Jtv, rtol=1e-12)
+        self.p.n_workers = 1
+
+    def test_max_factors(self):
+        v = np.random.rand(self.mesh.nC)
+        w = np.random.rand(self.data.nD)
+        d = self.p.dpred(self.m0)
+        Jv = self.p.Jvec(self.m0, v)
+        Jtv = self.p.Jtvec(self.m0, w)
+
+        self.p.max_factors = 2
+        self.p._Jmatrix = None
+        np.testing.assert_allclose(self.p.dpred(self.m0), d, rtol=1e-12)
+        np.testing.assert_allclose(self.p.Jvec(self.m0, v), Jv, rtol=1e-12)
+        np.testing.assert_allclose(self.p.Jtvec(self.m0, w), Jtv, rtol=1e-12)
+        self.assertLessEqual(sum(Ainv is not None for Ainv in self.p.Ainv), 2)
+
+        # Systems refactored by the workers are assembled by the main thread
+        threads = set()
+        getA = self.p.getA
+
+        def recorded_getA(ky):
+            threads.add(threading.get_ident())
+            return getA(ky)
+
+        self.p.n_workers = 2
+        self.p.getA = recorded_getA
+        try:
+            np.testing.assert_allclose(self.p.Jvec(self.m0, v), Jv, rtol=1e-12)
+            np.testing.assert_allclose(self.p.Jtvec(self.m0, w), Jtv, rtol=1e-12)
+        finally:
+            del self.p.getA
+            self.p.n_workers = 1
+        self.assertLessEqual(threads, {threading.get_ident()})
+
+    def test_refactor(self):
+        self.p._clean_factors()
+        self.p.solver = RefactoredSolver
+        self.p.max_factors = 3
+        RefactoredSolver.n_created = RefactoredSolver.n_factored = 0
+        f = self.p.fields(self.m0)
+        self.p.Jvec(self.m0, np.random.rand(self.mesh.nC), f=f)
+        self.p.fields(2 * self.m0)
+        # Solvers are only created for the first factorizations, and refactored
+        # for the other wavenumbers and models
+        self.assertEqual(RefactoredSolver.n_created, 3)
+        self.assertEqual(RefactoredSolver.n_factored, 3 * self.p.nky)
+
+    def test_projection(self):
+        # Data projected by the survey-wide operator match the receivers
+        f = self.p.fields(self.m0)
+        d = np.hstack(
+            [
+                rx.eval(src, self.mesh, f).dot(self.p._quad_weights)
+                for src in self.survey.source_list
+                for rx in src.receiver_list
+            ]
+        )
+        np.testing.assert_allclose(self.p.dpred(self.m0, f=f), d, rtol=1e-10)
+
     def test_dataObj(self):
         passed = tests.checkDerivative(
             lambda m: [self.dmis(m), self.dmis.deriv(m)], self.m0, plotIt=False, num=3
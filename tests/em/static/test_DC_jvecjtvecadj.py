@@ -14,8 +14,16 @@ from SimPEG import (
 )
 from SimPEG.utils import mkvc
 from SimPEG.electromagnetics import resistivity as dc
+from SimPEG.electromagnetics.static import induced_polarization as ip
+from SimPEG.utils.sensitivity_utils import (
+    MemmapSensitivity,
+    create_sensitivity_file,
+)
 from pymatsolver import Pardiso
+import os
 import shutil
+import tempfile
+import scipy.sparse as sp
 
 np.random.seed(40)
 
@@ -458,6 +466,19 @@ class DCProblemTestsN_storeJ(unittest.TestCase):
         )
         self.assertTrue(passed)
 
+    def test_adjoint_blocks(self):
+        # J and Jtv must not depend on the number of adjoint problems solved
+        # together
+        f = self.p.fields(self.m0)
+        v = np.random.rand(mkvc(self.dobs).shape[0])
+        J = self.p._Jtvec(self.m0, v=None, f=f).T
+        Jtv = self.p._Jtvec(self.m0, v=v, f=f)
+
+        self.p.max_adjoint_block = 0.0
+        np.testing.assert_allclose(self.p._Jtvec(self.m0, v=None, f=f).T, J)
+        np.testing.assert_allclose(self.p._Jtvec(self.m0, v=v, f=f), Jtv)
+        np.testing.assert_allclose(J.T @ v, Jtv)
+
     def tearDown(self):
         # Clean up the working directory
         try:
@@ -549,5 +570,273 @@ class DCProblemTestsN_storeJ_Robin(unittest.TestCase):
             pass
 
 
+class DCProblemTestsN_storeJ_disk(unittest.TestCase):
+    """Sensitivities memory mapped from disk must match the ones in RAM"""
+
+    formulation = "Simulation3DNodal"
+
+    def setUp(self):
+        aSpacing = 2.5
+        nElecs = 8
+
+        surveySize = nElecs * aSpacing - aSpacing
+        cs = surveySize / nElecs / 4
+
+        mesh = discretize.TensorMesh(
+            [
+                [(cs, 10, -1.3), (cs, surveySize / cs), (cs, 10, 1.3)],
+                [(cs, 3, -1.3), (cs, 3, 1.3)],
+            ],
+            "CN",
+        )
+        self.path = tempfile.mkdtemp()
+        self.simulations = [
+            getattr(dc, self.formulation)(
+                mesh=mesh,
+                survey=dc.survey.Survey(
+                    dc.utils.WennerSrcList(nElecs, aSpacing, in2D=True)
+                ),
+                sigmaMap=maps.ExpMap(mesh),
+                storeJ=True,
+                store_sensitivities=store,
+                sensitivity_path=self.path,
+                sensitivity_chunk_size=0.01,
+                n_threads=2,
+            )
+            for store in ["ram", "disk"]
+        ]
+        self.p = self.simulations[1]
+        self.mesh = mesh
+        self.m0 = np.log(1e-2) + 0.1 * np.random.randn(mesh.nC)
+
+    def test_sensitivity(self):
+        v = np.random.rand(self.mesh.nC)
+        w = np.random.rand(self.p.survey.nD)
+        ram, disk = self.simulations
+        for sim in self.simulations:
+            sim.model = self.m0
+
+        J = ram.getJ(self.m0)
+        np.testing.assert_allclose(np.asarray(disk.getJ(self.m0)), J, rtol=1e-5)
+        # Rows are stored in single precision, so small entries of the products
+        # are compared to the largest one
+        Jv, Jtw = J @ v, J.T @ w
+        np.testing.assert_allclose(
+            disk.Jvec(self.m0, v), Jv, rtol=1e-5, atol=1e-5 * np.abs(Jv).max()
+        )
+        np.testing.assert_allclose(
+            disk.Jtvec(self.m0, w), Jtw, rtol=1e-5, atol=1e-5 * np.abs(Jtw).max()
+        )
+        np.testing.assert_allclose(
+            disk.getJtJdiag(self.m0), ram.getJtJdiag(self.m0), rtol=1e-5
+        )
+
+    def test_adjoint(self):
+        v = np.random.rand(self.mesh.nC)
+        w = np.random.rand(self.p.survey.nD)
+        wtJv = w.dot(self.p.Jvec(self.m0, v))
+        vtJtw = v.dot(self.p.Jtvec(self.m0, w))
+        self.assertLess(np.abs(wtJv - vtJtw), 1e-10 * np.abs(wtJv))
+
+    def test_files(self):
+        # Files of previous models are removed
+        for m in [self.m0, self.m0 + 0.1]:
+            self.p.model = m
+            J = self.p.getJ(m)
+        self.assertEqual(len(os.listdir(self.path)), 1)
+
+        # IP simulations of the same conductivity reuse the file
+        simulation = getattr(ip, self.formulation)(
+            mesh=self.mesh,
+            survey=dc.survey.Survey(self.p.survey.source_list),
+            sigma=np.exp(self.m0 + 0.1),
+            etaMap=maps.IdentityMap(self.mesh),
+            storeJ=True,
+            store_sensitivities="disk",
+            sensitivity_path=self.path,
+        )
+        eta = 0.01 * np.ones(self.mesh.nC)
+        simulation.fields(eta)
+        self.assertEqual(simulation.getJ(eta).filename, J.filename)
+        self.assertEqual(len(os.listdir(self.path)), 1)
+
+    def test_blocks(self):
+        # Blocks are sized from the cells of the file, not the model parameters
+        filename = os.path.join(self.path, "J_blocks.npy")
+        create_sensitivity_file(filename, (200, 500))
+        J = MemmapSensitivity(filename, sp.eye(500, 10), chunk_size=0.1)
+        blocks = J._blocks()
+        n_rows = max(rows.stop - rows.start for rows in blocks)
+        self.assertLessEqual(n_rows * 500 * 8, 0.1e6)
+        self.assertEqual(blocks[-1].stop, 200)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class DCProblemTestsCC_storeJ_disk(DCProblemTestsN_storeJ_disk):
+
+    formulation = "Simulation3DCellCentered"
+
+
+class DCProblemTestsReciprocity(unittest.TestCase):
+    """Reciprocal surveys must match the survey solved from its sources"""
+
+    formulation = "Simulation3DCellCentered"
+
+    def setUp(self):
+        mesh = discretize.TensorMesh(
+            [
+                [(10, 3, -1.3), (10, 12), (10, 3, 1.3)],
+                [(10, 3, -1.3), (10, 4), (10, 3, 1.3)],
+                [(10, 3, -1.3), (10, 4)],
+            ],
+            "CCN",
+        )
+        x = np.linspace(-50, 50, 11) + 2.5
+
+        def get_survey():
+            M = np.array([[-7.5, 2.5, 0.0], [2.5, 2.5, 0.0]])
+            N = M + np.r_[10.0, 0.0, 0.0]
+            source_list = []
+            for i in range(len(x) - 1):
+                receiver_list = [
+                    dc.receivers.Dipole(M, N),
+                    dc.receivers.Dipole(M, N, data_type="apparent_resistivity"),
+                    dc.receivers.Pole(M),
+                ]
+                source_list.append(
+                    dc.sources.Dipole(
+                        receiver_list, np.r_[x[i], 22.5, 0], np.r_[x[i + 1], 22.5, 0]
+                    )
+                )
+            survey = dc.survey.Survey(source_list)
+            survey.set_geometric_factor()
+            return survey
+
+        self.simulations = [
+            getattr(dc, self.formulation)(
+                mesh=mesh,
+                survey=get_survey(),
+                sigmaMap=maps.ExpMap(mesh),
+                reciprocity=reciprocity,
+            )
+            for reciprocity in [False, True]
+        ]
+        self.mesh = mesh
+        self.m0 = np.log(1e-2) + 0.1 * np.random.randn(mesh.nC)
+
+    def test_reciprocal(self):
+        simulation, reciprocal = self.simulations
+        # The 3 potential electrodes are solved instead of the 10 sources
+        self.assertTrue(reciprocal._reciprocal)
+        self.assertEqual(reciprocal._mini_survey.nSrc, 3)
+
+        v = np.random.rand(self.mesh.nC)
+        w = np.random.rand(simulation.survey.nD)
+        for sim in [simulation, reciprocal]:
+            sim.model = self.m0
+        np.testing.assert_allclose(reciprocal.dpred(), simulation.dpred(), rtol=1e-10)
+        np.testing.assert_allclose(
+            reciprocal.Jvec(self.m0, v), simulation.Jvec(self.m0, v), rtol=1e-8
+        )
+        np.testing.assert_allclose(
+            reciprocal.Jtvec(self.m0, w), simulation.Jtvec(self.m0, w), rtol=1e-8
+        )
+        J = simulation.getJ(self.m0)
+        np.testing.assert_allclose(
+            reciprocal.getJ(self.m0), J, rtol=1e-8, atol=1e-8 * np.abs(J).max()
+        )
+
+    def test_misfit(self):
+        simulation = self.simulations[1]
+        passed = tests.checkDerivative(
+            lambda m: [simulation.dpred(m), lambda mx: simulation.Jvec(self.m0, mx)],
+            self.m0,
+            plotIt=False,
+            num=3,
+        )
+        self.assertTrue(passed)
+
+
+class DCProblemTestsReciprocityN(DCProblemTestsReciprocity):
+
+    formulation = "Simulation3DNodal"
+
+
+class DCProblemTestsDataType(unittest.TestCase):
+    """Data follow the data types and geometric factors set after dpred"""
+
+    def setUp(self):
+        mesh = discretize.TensorMesh(
+            [
+                [(10, 3, -1.3), (10, 12), (10, 3, 1.3)],
+                [(10, 3, -1.3), (10, 4), (10, 3, 1.3)],
+                [(10, 3, -1.3), (10, 4)],
+            ],
+            "CCN",
+        )
+        x = np.linspace(-50, 50, 11) + 2.5
+        M = np.array([[-7.5, 2.5, 0.0], [2.5, 2.5, 0.0]])
+        source_list = [
+            dc.sources.Dipole(
+                [dc.receivers.Dipole(M, M + np.r_[10.0, 0.0, 0.0])],
+                np.r_[x[i], 22.5, 0],
+                np.r_[x[i + 1], 22.5, 0],
+            )
+            for i in range(len(x) - 1)
+        ]
+        self.survey = dc.survey.Survey(source_list)
+        self.mesh = mesh
+        self.m0 = np.log(1e-2) * np.ones(mesh.nC)
+
+    reciprocity = False
+
+    def simulation(self):
+        return dc.Simulation3DCellCentered(
+            mesh=self.mesh,
+            survey=self.survey,
+            sigmaMap=maps.ExpMap(self.mesh),
+            reciprocity=self.reciprocity,
+        )
+
+    def test_data_type(self):
+        simulation = self.simulation()
+        volts = simulation.dpred(self.m0)
+
+        # The projection is assembled once until the receivers change
+        ((key, (_, _, P)),) = simulation._projections.items()
+        simulation.dpred(self.m0)
+        self.assertIs(simulation._projections[key][2], P)
+
+        for src in self.survey.source_list:
+            src.receiver_list[0].data_type = "apparent_resistivity"
+        self.survey.set_geometric_factor()
+        np.testing.assert_allclose(
+            simulation.dpred(self.m0), self.simulation().dpred(self.m0), rtol=1e-10
+        )
+        self.assertFalse(np.allclose(simulation.dpred(self.m0), volts))
+
+        self.survey.source_list[0].current = [2.0, -2.0]
+        np.testing.assert_allclose(
+            simulation.dpred(self.m0), self.simulation().dpred(self.m0), rtol=1e-10
+        )
+
+        v = np.random.rand(self.mesh.nC)
+        w = np.random.rand(self.survey.nD)
+        np.testing.assert_allclose(
+            simulation.Jvec(self.m0, v), self.simulation().Jvec(self.m0, v), rtol=1e-10
+        )
+        np.testing.assert_allclose(
+            simulation.Jtvec(self.m0, w),
+            self.simulation().Jtvec(self.m0, w),
+            rtol=1e-10,
+        )
+
+
+class DCProblemTestsDataTypeReciprocity(DCProblemTestsDataType):
+    reciprocity = True
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+
+import numpy as np
+import discretize
+
+from SimPEG import maps, data_misfit, inverse_problem, optimization, regularization
+from SimPEG import utils
+from SimPEG.electromagnetics.static import resistivity as dc
+from SimPEG.electromagnetics.static.resistivity import tiling
+
+try:
+    from pymatsolver import Pardiso as Solver
+except ImportError:
+    from SimPEG import SolverLU as Solver
+
+np.random.seed(40)
+
+
+class DCTilingTests(unittest.TestCase):
+
+    formulation = "Simulation3DNodal"
+
+    def setUp(self):
+        h = [(25.0, 32)]
+        mesh = discretize.TreeMesh([h, h, h], x0="CCC")
+        x = np.linspace(-200, 200, 9)
+        electrodes = utils.ndgrid(x, x, np.r_[-1.0])
+        mesh.insert_cells(
+            electrodes, np.full(len(electrodes), mesh.max_level), finalize=False
+        )
+        mesh.refine(2, finalize=True)
+        active = mesh.gridCC[:, 2] < 0
+
+        source_list = []
+        for i in range(0, len(electrodes) - 3, 2):
+            rx = dc.receivers.Dipole(
+                electrodes[i + 1 : i + 3], electrodes[i + 2 : i + 4]
+            )
+            source_list.append(
+                dc.sources.Dipole([rx], electrodes[i], electrodes[i + 3])
+            )
+        survey = dc.Survey(source_list)
+
+        simulation = getattr(dc, self.formulation)(
+            mesh,
+            survey=survey,
+            solver=Solver,
+            sigmaMap=maps.ExpMap(mesh)
+            * maps.InjectActiveCells(mesh, active, np.log(1e-8)),
+        )
+        self.m0 = np.log(1e-2) + 0.2 * np.random.randn(active.sum())
+        self.data = simulation.make_synthetic_data(
+            self.m0, relative_error=0.05, noise_floor=1e-4, add_noise=True
+        )
+        self.mesh = mesh
+        self.active = active
+        self.survey = survey
+        self.simulation = simulation
+
+    def test_tile_sources(self):
+        tiles = tiling.tile_sources(self.survey, 3)
+        self.assertEqual(len(tiles), 3)
+        np.testing.assert_array_equal(
+            np.sort(np.hstack(tiles)), np.arange(len(self.survey.source_list))
+        )
+        with self.assertRaises(ValueError):
+            tiling.tile_sources(self.survey, len(self.survey.source_list) + 1)
+
+    def test_tile_mesh(self):
+        locations = self.survey.source_list[0].location
+        local_mesh = tiling.create_tile_mesh(self.mesh, locations, [2, 2])
+        self.assertLess(local_mesh.nC, self.mesh.nC)
+
+        # Every local cell averages global cells
+        tile_map = maps.TileMap(
+            self.mesh, np.ones(self.mesh.nC, dtype=bool), local_mesh
+        )
+        self.assertTrue(tile_map.local_active.all())
+
+    def test_global_meshes(self):
+        # Tiles on local meshes matching the global mesh sum to the global misfit
+        dmis = tiling.create_tiled_misfit(
+            self.data,
+            self.mesh,
+            self.active,
+            3,
+            simulation_class=getattr(dc, self.formulation),
+            octree_levels=[100],
+            solver=Solver,
+            n_workers=2,
+        )
+        global_dmis = data_misfit.L2DataMisfit(
+            data=self.data, simulation=self.simulation
+        )
+        m = self.m0 + 0.1 * np.random.randn(self.m0.size)
+        v = np.random.randn(self.m0.size)
+        f = dmis.fields(m)
+
+        np.testing.assert_allclose(
+            dmis.dpred(m, f=f), self.simulation.dpred(m), rtol=1e-8, atol=1e-14
+        )
+        self.assertAlmostEqual(dmis(m, f=f) / global_dmis(m), 1.0)
+        np.testing.assert_allclose(
+            dmis.deriv(m, f=f), global_dmis.deriv(m), rtol=1e-8, atol=1e-14
+        )
+        np.testing.assert_allclose(
+            dmis.deriv2(m, v, f=f), global_dmis.deriv2(m, v), rtol=1e-8, atol=1e-14
+        )
+
+    def test_local_meshes(self):
+        dmis = tiling.create_tiled_misfit(
+            self.data,
+            self.mesh,
+            self.active,
+            3,
+            simulation_class=getattr(dc, self.formulation),
+            octree_levels=[4, 4],
+            solver=Solver,
+            storeJ=True,
+            n_workers=2,
+        )
+        for objfct in dmis.objfcts:
+            self.assertLess(objfct.simulation.mesh.nC, self.mesh.nC)
+
+        d = dmis.dpred(self.m0)
+        d_global = self.simulation.dpred(self.m0)
+        self.assertLess(np.linalg.norm(d - d_global), 1e-2 * np.linalg.norm(d_global))
+
+        # The tiled misfit plugs into the inverse problem
+        reg = regularization.Tikhonov(self.mesh, indActive=self.active)
+        opt = optimization.InexactGaussNewton(maxIter=1)
+        inv_prob = inverse_problem.BaseInvProblem(dmis, reg, opt, beta=1.0)
+        inv_prob.startup(self.m0)
+        phi, g = inv_prob.evalFunction(self.m0, return_H=False)
+        self.assertEqual(len(inv_prob.getFields(self.m0)), 3)
+        np.testing.assert_allclose(
+            g, dmis.deriv(self.m0) + reg.deriv(self.m0), rtol=1e-8
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
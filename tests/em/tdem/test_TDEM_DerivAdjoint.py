@@ -1,10 +1,13 @@
 from __future__ import division, print_function
 import unittest
 import numpy as np
+import os
+import tempfile
 import time
 import discretize
 from SimPEG import maps, SolverLU, tests
 from SimPEG.electromagnetics import time_domain as tdem
+from SimPEG.electromagnetics.time_domain import checkpointing
 
 from pymatsolver import Pardiso as Solver
 
@@ -408,5 +411,188 @@ class DerivAdjoint_J(Base_DerivAdjoint_Test):
             self.JvecVsJtvecTest("MagneticFluxTimeDerivativez")
 
 
+class CountingSolver(object):
+    """Direct solver counting the factorizations held"""
+
+    n_factored = 0
+    n_held = 0
+
+    def __init__(self, A, **kwargs):
+        CountingSolver.n_factored += 1
+        CountingSolver.n_held += 1
+        self.solver = Solver(A, **kwargs)
+
+    def __mul__(self, other):
+        return self.solver * other
+
+    def clean(self):
+        CountingSolver.n_held -= 1
+        self.solver.clean()
+
+
+class TDEM_Factorizations(unittest.TestCase):
+    def setUp(self):
+        mesh = get_mesh()
+        self.survey = get_survey()
+        for src in self.survey.source_list:
+            src.receiver_list = [
+                tdem.Rx.PointMagneticFluxTimeDerivative(
+                    np.array([[15.0, 0.0, -1e-2]]), np.logspace(-4, -3, 20), "z"
+                )
+            ]
+        self.prob = get_prob(mesh, get_mapping(mesh), "ElectricField")
+        self.prob.survey = self.survey
+        self.m = np.log(1e-1) * np.ones(self.prob.sigmaMap.nP)
+        self.v = np.random.rand(self.prob.sigmaMap.nP)
+        self.d = np.random.randn(self.survey.nD)
+
+    def test_factorizations(self):
+        d = self.prob.dpred(self.m)
+        Jv = self.prob.Jvec(self.m, self.v)
+        Jtd = self.prob.Jtvec(self.m, self.d)
+
+        self.prob.model = 2 * self.m
+        self.prob.solver = CountingSolver
+        CountingSolver.n_factored = CountingSolver.n_held = 0
+
+        # One factorization per time step size, shared by Jvec and Jtvec
+        f = self.prob.fields(self.m)
+        Jv_held = self.prob.Jvec(self.m, self.v, f=f)
+        Jtd_held = self.prob.Jtvec(self.m, self.d, f=f)
+        self.assertEqual(CountingSolver.n_factored, 3)
+        np.testing.assert_allclose(self.prob.dpred(self.m, f=f), d, rtol=1e-10)
+        np.testing.assert_allclose(Jv_held, Jv, rtol=1e-10)
+        np.testing.assert_allclose(Jtd_held, Jtd, rtol=1e-10)
+
+        # Factorizations are cleaned on model updates
+        self.prob.model = 2 * self.m
+        self.assertEqual(CountingSolver.n_held, 0)
+
+        self.prob.max_factors = 1
+        f = self.prob.fields(self.m)
+        self.prob.Jtvec(self.m, self.d, f=f)
+        self.assertEqual(CountingSolver.n_held, 1)
+        # The last time step size is reused by the adjoint problems
+        self.assertEqual(CountingSolver.n_factored, 8)
+
+
+class TDEM_Checkpointing(unittest.TestCase):
+    def test_reversed_time_levels(self):
+        for n_checkpoints in [1, 4, 31]:
+            steps = []
+
+            def step(tInd, u):
+                steps.append(tInd)
+                return u + 1
+
+            levels = list(
+                checkpointing.reversed_time_levels(0, 30, n_checkpoints, step)
+            )
+            self.assertEqual(levels, [(t, t) for t in range(30, -1, -1)])
+            self.assertEqual(
+                len(steps), checkpointing.n_recomputed_steps(30, n_checkpoints)
+            )
+
+        # every time step is computed once if all time levels are held
+        self.assertEqual(checkpointing.n_recomputed_steps(30, 31), 30)
+        self.assertEqual(checkpointing.n_recomputed_steps(30, 4), 72)
+
+    def test_checkpointed_sensitivities(self):
+        for formulation in ["MagneticFluxDensity", "ElectricField"]:
+            survey = get_survey()
+            for src in survey.source_list:
+                src.receiver_list = [
+                    tdem.Rx.PointMagneticFluxTimeDerivative(
+                        np.array([[15.0, 0.0, -1e-2]]), np.logspace(-4, -3, 20), "z"
+                    )
+                ]
+            prob = get_prob(get_mesh(), get_mapping(get_mesh()), formulation)
+            prob.survey = survey
+            m = np.log(1e-1) * np.ones(prob.sigmaMap.nP)
+            v = np.random.rand(prob.sigmaMap.nP)
+            d = np.random.randn(survey.nD)
+
+            f = prob.fields(m)
+            dpred = prob.dpred(m, f=f)
+            Jv = prob.Jvec(m, v, f=f)
+            Jtd = prob.Jtvec(m, d, f=f)
+
+            # the fields only hold the initial fields
+            prob.n_checkpoints = 3
+            f = prob.fields(m)
+            self.assertEqual(len(f._fields[prob._fieldType + "Solution"]), 1)
+            np.testing.assert_allclose(prob.dpred(m, f=f), dpred, rtol=1e-10)
+            np.testing.assert_allclose(prob.Jvec(m, v, f=f), Jv, rtol=1e-10)
+            np.testing.assert_allclose(prob.Jtvec(m, d, f=f), Jtd, rtol=1e-10)
+            np.testing.assert_allclose(prob.dpred(m), dpred, rtol=1e-10)
+
+
+class TDEM_StoreJ(unittest.TestCase):
+    def test_getJ(self):
+        for formulation in ["MagneticFluxDensity", "MagneticField"]:
+            survey = get_survey()
+            for src in survey.source_list:
+                src.receiver_list = [
+                    tdem.Rx.PointMagneticFluxTimeDerivative(
+                        np.array([[15.0, 0.0, -1e-2]]), np.logspace(-4, -3, 5), "z"
+                    ),
+                    tdem.Rx.PointMagneticField(
+                        np.array([[5.0, 0.0, -1e-2]]), np.logspace(-4, -3, 5), "x"
+                    ),
+                ]
+            prob = get_prob(get_mesh(), get_mapping(get_mesh()), formulation)
+            prob.survey = survey
+            m = np.log(1e-1) * np.ones(prob.sigmaMap.nP)
+            v = np.random.rand(prob.sigmaMap.nP)
+            d = np.random.randn(survey.nD)
+
+            f = prob.fields(m)
+            Jv = prob.Jvec(m, v, f=f)
+            Jtd = prob.Jtvec(m, d, f=f)
+
+            # blocks of a few data
+            prob.max_adjoint_block = 0.5
+            J = prob.getJ(m, f=f)
+            self.assertEqual(J.shape, (survey.nD, prob.sigmaMap.nP))
+            self.assertLess(np.linalg.norm(J @ v - Jv), 1e-6 * np.linalg.norm(Jv))
+            self.assertLess(np.linalg.norm(J.T @ d - Jtd), 1e-6 * np.linalg.norm(Jtd))
+
+            prob.storeJ = True
+            np.testing.assert_allclose(prob.Jvec(m, v, f=f), J @ v)
+            np.testing.assert_allclose(prob.Jtvec(m, d, f=f), J.T @ d)
+            np.testing.assert_allclose(prob.getJtJdiag(m), np.sum(J ** 2, axis=0))
+
+            # float32 sensitivities on disk
+            prob.model = 2 * m
+            self.assertIsNone(prob._Jmatrix)
+            prob.store_sensitivities = "disk"
+            prob.sensitivity_chunk_size = 1e-6
+            prob.n_threads = 2
+            with tempfile.TemporaryDirectory() as path:
+                prob.sensitivity_path = path
+                J_disk = prob.getJ(m, f=f)
+                self.assertEqual(J_disk.n_threads, 2)
+                self.assertGreater(len(J_disk._blocks()), 1)
+                np.testing.assert_allclose(J_disk @ v, J @ v, rtol=1e-5, atol=1e-12)
+                Jtd = J.T @ d
+                np.testing.assert_allclose(
+                    J_disk.T @ d, Jtd, rtol=1e-5, atol=1e-5 * np.abs(Jtd).max()
+                )
+                np.testing.assert_allclose(
+                    prob.getJtJdiag(m), np.sum(J ** 2, axis=0), rtol=1e-5
+                )
+                del J_disk, prob._Jmatrix
+
+                # the file of the same model and survey is reused
+                files = os.listdir(path)
+                self.assertEqual(len(files), 1)
+                filename = os.path.join(path, files[0])
+                mtime = os.path.getmtime(filename)
+                J_disk = prob.getJ(m, f=f)
+                self.assertEqual(os.listdir(path), files)
+                self.assertEqual(os.path.getmtime(filename), mtime)
+                del J_disk, prob._Jmatrix
+
+
 if __name__ == "__main__":
     unittest.main()
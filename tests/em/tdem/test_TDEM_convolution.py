@@ -0,0 +1,138 @@
+import unittest
+
+import discretize
+import numpy as np
+from numpy.testing import assert_allclose
+
+from SimPEG import maps, tests
+from SimPEG.electromagnetics import time_domain as tdem
+from SimPEG.electromagnetics.time_domain.convolution import (
+    waveform_convolution_matrix,
+)
+
+from pymatsolver import Pardiso as Solver
+
+
+class WaveformConvolutionMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.time_mesh = discretize.TensorMesh([np.r_[0.5, 1.0, 2.0, 4.0, 8.0, 16.0]])
+        self.times = np.r_[10.0, 12.0, 20.0, 31.0]
+        # linear step-off responses are convolved exactly
+        self.response = 3.0 - 0.5 * self.time_mesh.nodes_x
+
+    def test_step_off(self):
+        Q = waveform_convolution_matrix(
+            tdem.sources.StepOffWaveform(), self.times, self.time_mesh
+        )
+        assert_allclose(Q @ self.response, 3.0 - 0.5 * self.times)
+
+    def test_ramp_off(self):
+        waveform = tdem.sources.RampOffWaveform(off_time=4.0)
+        Q = waveform_convolution_matrix(waveform, self.times, self.time_mesh)
+        # average of the step-off response over the ramp
+        assert_allclose(Q @ self.response, 3.0 - 0.5 * (self.times - 2.0))
+
+    def test_trapezoid(self):
+        waveform = tdem.sources.TrapezoidWaveform(
+            ramp_on=np.r_[0.0, 2.0], ramp_off=np.r_[6.0, 10.0]
+        )
+        Q = waveform_convolution_matrix(waveform, self.times, self.time_mesh)
+        # response to the charge of the waveform
+        assert_allclose(Q @ self.response, 0.5 * 7.0 * np.ones(4), rtol=1e-10)
+
+    def test_times(self):
+        waveform = tdem.sources.RampOffWaveform(off_time=4.0)
+        with self.assertRaises(ValueError):
+            waveform_convolution_matrix(waveform, np.r_[3.0, 10.0], self.time_mesh)
+        with self.assertRaises(ValueError):
+            waveform_convolution_matrix(waveform, np.r_[10.0, 32.0], self.time_mesh)
+
+
+class WaveformConvolutionTest(unittest.TestCase):
+    def setUp(self):
+        cs, ncx, ncz, npad = 10.0, 15, 20, 12
+        hx = [(cs, ncx), (cs, npad, 1.3)]
+        hz = [(cs, npad, -1.3), (cs, ncz), (cs, npad, 1.3)]
+        mesh = discretize.CylMesh([hx, 1, hz], "00C")
+
+        active = mesh.vectorCCz < 0.0
+        self.mapping = (
+            maps.ExpMap(mesh)
+            * maps.SurjectVertical1D(mesh)
+            * maps.InjectActiveCells(mesh, active, np.log(1e-8), nC=mesh.nCz)
+        )
+        self.m = np.log(1e-2) * np.ones(active.sum())
+        self.mesh = mesh
+        self.time_steps = [(1e-6, 20), (5e-6, 30), (2e-5, 40), (1e-4, 2)]
+
+        waveforms = [
+            tdem.sources.StepOffWaveform(),
+            tdem.sources.RampOffWaveform(off_time=1e-4),
+            tdem.sources.TrapezoidWaveform(
+                ramp_on=np.r_[0.0, 2e-5], ramp_off=np.r_[5e-5, 1e-4]
+            ),
+        ]
+        self.survey = tdem.Survey([self.source(waveform) for waveform in waveforms])
+        self.step_off = tdem.Simulation3DMagneticFluxDensity(
+            mesh, time_steps=self.time_steps, sigmaMap=self.mapping, solver=Solver
+        )
+        self.sim = tdem.Simulation3DWaveformConvolution(
+            self.step_off, survey=self.survey
+        )
+
+    def source(self, waveform):
+        times = np.logspace(-4, -3, 5) + 1e-4
+        receiver_list = [
+            tdem.receivers.PointMagneticFluxTimeDerivative(
+                np.array([[20.0, 0.0, 0.0]]), times, "z"
+            ),
+            tdem.receivers.PointMagneticFluxDensity(
+                np.array([[20.0, 0.0, 0.0]]), times, "z"
+            ),
+        ]
+        return tdem.sources.CircularLoop(
+            receiver_list,
+            location=np.r_[0.0, 0.0, 0.5],
+            radius=13.0,
+            waveform=waveform,
+        )
+
+    def test_step_off_source(self):
+        d = self.sim.dpred(self.m)
+        # the sources of all waveforms share one step-off source
+        self.assertEqual(len(self.step_off.survey.source_list), 1)
+
+        direct = tdem.Simulation3DMagneticFluxDensity(
+            self.mesh,
+            survey=tdem.Survey([self.source(tdem.sources.StepOffWaveform())]),
+            time_steps=self.time_steps,
+            sigmaMap=self.mapping,
+            solver=Solver,
+        )
+        d_direct = direct.dpred(self.m)
+        assert_allclose(d[: len(d_direct)], d_direct, rtol=1e-10)
+
+    def test_adjoint(self):
+        f = self.sim.fields(self.m)
+        v = np.random.rand(self.m.size)
+        w = np.random.rand(self.survey.nD)
+        vJw = v.dot(self.sim.Jtvec(self.m, w, f=f))
+        wJv = w.dot(self.sim.Jvec(self.m, v, f=f))
+        self.assertLess(np.abs(vJw - wJv), 1e-6 * np.abs(vJw))
+
+        J = self.sim.getJ(self.m, f=f)
+        assert_allclose(J @ v, self.sim.Jvec(self.m, v, f=f), rtol=1e-6, atol=1e-20)
+
+    def test_deriv(self):
+        self.assertTrue(
+            tests.checkDerivative(
+                lambda m: (self.sim.dpred(m), lambda v: self.sim.Jvec(m, v)),
+                self.m,
+                plotIt=False,
+                num=3,
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,9 +2,10 @@ import unittest
 import discretize
 from SimPEG import utils, maps
 from SimPEG.utils.model_builder import getIndicesSphere
-from SimPEG.potential_fields import gravity
+from SimPEG.potential_fields import gravity, get_dist_wgt
 import numpy as np
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 nx = 5
 ny = 5
@@ -88,6 +89,230 @@ class GravFwdProblemTests(unittest.TestCase):
         self.assertLess(err_y, 0.005)
         self.assertLess(err_z, 0.005)
 
+    def test_receiver_blocks(self):
+
+        # Kernel rows must not depend on the number of receivers per block
+        kernels = []
+        for block_size in [1, 7, self.locXyz.shape[0]]:
+            sim = gravity.Simulation3DIntegral(
+                self.sim.mesh,
+                survey=self.survey,
+                rhoMap=self.sim.rhoMap,
+                actInd=self.sim.actInd,
+                receiver_block_size=block_size,
+            )
+            kernels.append(sim.G)
+
+        np.testing.assert_array_equal(kernels[0], kernels[1])
+        np.testing.assert_array_equal(kernels[0], kernels[2])
+
+    def test_n_workers(self):
+
+        # Rows filled by the worker processes must match the serial kernel
+        kernels = []
+        for n_workers in [1, 2]:
+            sim = gravity.Simulation3DIntegral(
+                self.sim.mesh,
+                survey=self.survey,
+                rhoMap=self.sim.rhoMap,
+                actInd=self.sim.actInd,
+                n_workers=n_workers,
+            )
+            kernels.append(sim.G)
+
+        np.testing.assert_array_equal(kernels[0], kernels[1])
+
+        # Simulations computing their rows concurrently keep their own workers
+        def kernel(height):
+            receivers = gravity.Point(self.locXyz + np.r_[0.0, 0.0, height])
+            return gravity.Simulation3DIntegral(
+                self.sim.mesh,
+                survey=gravity.Survey(gravity.SourceField([receivers])),
+                rhoMap=self.sim.rhoMap,
+                actInd=self.sim.actInd,
+                n_workers=2,
+                receiver_block_size=1,
+            ).G
+
+        heights = [0.0, 1.0, 2.0]
+        with ThreadPoolExecutor(max_workers=len(heights)) as executor:
+            concurrent = list(executor.map(kernel, heights))
+        for height, values in zip(heights, concurrent):
+            np.testing.assert_array_equal(values, kernel(height))
+
+    def test_n_cpu(self):
+
+        # n_cpu was replaced by n_workers
+        with self.assertRaisesRegex(TypeError, "n_workers"):
+            self.sim.n_cpu
+        with self.assertRaisesRegex(TypeError, "n_workers"):
+            self.sim.n_cpu = 2
+
+    def test_compressed_sensitivities(self):
+
+        # Every compressed row must be within the requested relative accuracy
+        tolerance = 1e-3
+        sim = gravity.Simulation3DIntegral(
+            self.sim.mesh,
+            survey=self.survey,
+            rhoMap=self.sim.rhoMap,
+            actInd=self.sim.actInd,
+            store_sensitivities="compressed",
+            compression_tolerance=tolerance,
+        )
+        G = self.sim.G
+        err = np.linalg.norm(sim.G.toarray() - G, axis=1) / np.linalg.norm(G, axis=1)
+        self.assertLess(err.max(), tolerance * 1.01)
+
+        data = sim.dpred(self.model)
+        self.assertLess(
+            np.linalg.norm(data - G @ self.model) / np.linalg.norm(G @ self.model),
+            tolerance,
+        )
+
+        # Bounded by the Frobenius norm of the compression error
+        v = np.random.randn(self.survey.nD)
+        self.assertLess(
+            np.linalg.norm(sim.Jtvec(self.model, v) - G.T @ v),
+            tolerance * np.linalg.norm(G) * np.linalg.norm(v),
+        )
+
+    def test_sensitivity_cache(self):
+
+        # Rows of unchanged receivers are read back from the cache
+        self.sim.G
+        locations = self.locXyz.copy()
+        locations[:5, 2] += 1.0
+        receivers = gravity.Point(locations, components=["gx", "gy", "gz"])
+        survey = gravity.Survey(gravity.SourceField([receivers]))
+
+        kernels = []
+        for store_sensitivities in ["disk", "ram"]:
+            sim = gravity.Simulation3DIntegral(
+                self.sim.mesh,
+                survey=survey,
+                rhoMap=self.sim.rhoMap,
+                actInd=self.sim.actInd,
+                store_sensitivities=store_sensitivities,
+                sensitivity_path=self.sim.sensitivity_path,
+            )
+            computed = []
+            compute_rows = sim._compute_rows
+
+            def record_rows(receivers=None, out=None):
+                computed.append(receivers)
+                return compute_rows(receivers=receivers, out=out)
+
+            sim._compute_rows = record_rows
+            kernels.append(sim.G)
+
+            if store_sensitivities == "disk":
+                # Only the rows of the moved receivers are computed
+                self.assertEqual(len(computed), 1)
+                np.testing.assert_array_equal(computed[0], np.arange(5))
+
+        np.testing.assert_array_equal(kernels[0].toarray(), kernels[1])
+
+    def test_chunked_sensitivities(self):
+
+        # Products streamed by chunks of rows from disk must match the dense kernel
+        G = self.sim.G.toarray()
+        sim = gravity.Simulation3DIntegral(
+            self.sim.mesh,
+            survey=self.survey,
+            rhoMap=self.sim.rhoMap,
+            actInd=self.sim.actInd,
+            store_sensitivities="disk",
+            sensitivity_path=self.sim.sensitivity_path,
+            sensitivity_chunk_size=G.shape[1] * 8 * 10 / 1e6,
+        )
+        self.assertGreater(len(sim.G.chunks), 1)
+
+        v = np.random.rand(G.shape[0])
+        np.testing.assert_allclose(sim.G @ self.model, G @ self.model)
+        np.testing.assert_allclose(sim.G.T @ v, G.T @ v)
+        np.testing.assert_allclose(sim.G[2:9], G[2:9])
+        np.testing.assert_allclose(
+            sim.getJtJdiag(self.model), np.sum(G ** 2, axis=0), rtol=1e-10
+        )
+
+    def test_fft_engine(self):
+
+        # Convolutions of the depth slices must match the dense kernel
+        X, Y = np.meshgrid(np.arange(-2.0, 2.5, 1.0), np.arange(-2.0, 2.5, 1.0))
+        locations = np.c_[utils.mkvc(X), utils.mkvc(Y), np.ones(X.size) * 6.0]
+        receivers = gravity.Point(locations, components=["gx", "gz", "gzz"])
+        survey = gravity.Survey(gravity.SourceField([receivers]))
+
+        sims = [
+            gravity.Simulation3DIntegral(
+                self.sim.mesh,
+                survey=survey,
+                rhoMap=self.sim.rhoMap,
+                actInd=self.sim.actInd,
+                engine=engine,
+            )
+            for engine in ["integral", "fft"]
+        ]
+
+        # FFT round-off is relative to the largest entries
+        def assert_close(actual, desired):
+            np.testing.assert_allclose(
+                actual, desired, atol=1e-8 * np.abs(desired).max()
+            )
+
+        v = np.random.randn(survey.nD)
+        W = utils.sdiag(np.random.rand(survey.nD))
+        assert_close(sims[1].G @ self.model, sims[0].G @ self.model)
+        assert_close(sims[1].G.T @ v, sims[0].G.T @ v)
+        np.testing.assert_allclose(
+            sims[1].getJtJdiag(self.model, W), sims[0].getJtJdiag(self.model, W)
+        )
+
+    def test_far_field_engine(self):
+
+        # Rows approximated in the far field must be within the accuracy
+        accuracy = 1e-2
+        sim = gravity.Simulation3DIntegral(
+            self.sim.mesh,
+            survey=self.survey,
+            rhoMap=self.sim.rhoMap,
+            actInd=self.sim.actInd,
+            engine="far_field",
+            far_field_accuracy=accuracy,
+        )
+        G = self.sim.G
+        self.assertGreater(sim.G.far.nnz, 0)
+
+        err = np.linalg.norm(sim.G.toarray() - G, axis=1) / np.linalg.norm(G, axis=1)
+        self.assertLess(err.max(), accuracy)
+
+        v = np.random.randn(self.survey.nD)
+        np.testing.assert_allclose(sim.G.T @ v, sim.G.toarray().T @ v)
+        np.testing.assert_allclose(sim.dpred(self.model), sim.G.toarray() @ self.model)
+
+    def test_dist_wgt(self):
+
+        # Blocked distance weights must match the sum over every receiver
+        mesh, actv = self.sim.mesh, self.sim.actInd
+        centers, sizes = mesh.gridCC[actv], mesh.h_gridded[actv] / np.sqrt(3)
+        corners = np.array(np.meshgrid([-1, 1], [-1, 1], [-1, 1])).reshape((3, -1)).T
+        wr = np.zeros(actv.sum())
+        for location in self.locXyz:
+            temp = 0.0
+            for corner in corners:
+                R = np.linalg.norm(centers + corner * sizes - location, axis=1)
+                temp += (R + 0.05) ** -2
+            wr += (mesh.vol[actv] * temp / 8.0) ** 2.0
+        wr = np.sqrt(np.sqrt(wr) / mesh.vol[actv])
+        wr /= wr.max()
+
+        np.testing.assert_allclose(get_dist_wgt(mesh, self.locXyz, actv, 2, 0.05), wr)
+        np.testing.assert_allclose(
+            get_dist_wgt(mesh, self.locXyz, np.where(actv)[0], 2, 0.05, n_workers=2),
+            wr,
+        )
+
     def tearDown(self):
         # Clean up the working directory
         try:
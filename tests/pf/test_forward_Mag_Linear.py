@@ -93,6 +93,121 @@ class MagFwdProblemTests(unittest.TestCase):
         self.assertLess(err_z, 0.005)
         self.assertLess(err_t, 0.005)
 
+    def test_matrix_free_sensitivities(self):
+
+        # Row blocks recomputed by the forward only simulation must match the
+        # stored sensitivities
+        sim = mag.Simulation3DIntegral(
+            self.sim.mesh,
+            survey=self.survey,
+            chiMap=self.sim.chiMap,
+            actInd=self.sim.actInd,
+            store_sensitivities="ram",
+        )
+
+        v = np.random.randn(self.survey.nD)
+        np.testing.assert_allclose(
+            self.sim.Jvec(self.model, self.model), sim.Jvec(self.model, self.model)
+        )
+        np.testing.assert_allclose(
+            self.sim.Jtvec(self.model, v), sim.Jtvec(self.model, v)
+        )
+        np.testing.assert_allclose(
+            self.sim.getJtJdiag(self.model), sim.getJtJdiag(self.model)
+        )
+
+    def test_fused_kernel(self):
+
+        # Rows accumulated from the projected tensor entries must match the
+        # rows of bx, by and bz projected through tmi_projection and M, up to
+        # the round-off of the cancelling corner terms
+        nC = int(self.sim.actInd.sum())
+        for model_type, M in [
+            ("scalar", None),
+            ("scalar", np.random.randn(nC, 3)),
+            ("vector", None),
+        ]:
+            kernels = []
+            for fused_kernel in [False, True]:
+                sim = mag.Simulation3DIntegral(
+                    self.sim.mesh,
+                    survey=self.survey,
+                    chiMap=maps.IdentityMap(
+                        nP=nC * (3 if model_type == "vector" else 1)
+                    ),
+                    actInd=self.sim.actInd,
+                    model_type=model_type,
+                    fused_kernel=fused_kernel,
+                )
+                if M is not None:
+                    sim.M = M
+                kernels.append(sim.G)
+
+            np.testing.assert_allclose(
+                kernels[1], kernels[0], rtol=0, atol=1e-7 * np.abs(kernels[0]).max()
+            )
+
+    def test_fft_engine(self):
+
+        # Convolutions of the depth slices must match the dense kernel
+        X, Y = np.meshgrid(np.arange(-2.0, 2.5, 1.0), np.arange(-2.0, 2.5, 1.0))
+        locations = np.c_[utils.mkvc(X), utils.mkvc(Y), np.ones(X.size) * 4.0]
+        receivers = mag.Point(locations, components=["bx", "by", "bz", "tmi"])
+        survey = mag.Survey(
+            mag.SourceField([receivers], parameters=self.survey.source_field.parameters)
+        )
+
+        sims = [
+            mag.Simulation3DIntegral(
+                self.sim.mesh,
+                survey=survey,
+                chiMap=self.sim.chiMap,
+                actInd=self.sim.actInd,
+                engine=engine,
+            )
+            for engine in ["integral", "fft"]
+        ]
+
+        # FFT round-off is relative to the largest entries
+        def assert_close(actual, desired):
+            np.testing.assert_allclose(
+                actual, desired, atol=1e-8 * np.abs(desired).max()
+            )
+
+        v = np.random.randn(survey.nD)
+        assert_close(sims[1].G @ self.model, sims[0].G @ self.model)
+        assert_close(sims[1].G.T @ v, sims[0].G.T @ v)
+        np.testing.assert_allclose(
+            sims[1].getJtJdiag(self.model), sims[0].getJtJdiag(self.model)
+        )
+
+    def test_far_field_engine(self):
+
+        # Rows approximated in the far field must be within the accuracy
+        accuracy = 1e-2
+        sim = mag.Simulation3DIntegral(
+            self.sim.mesh,
+            survey=self.survey,
+            chiMap=self.sim.chiMap,
+            actInd=self.sim.actInd,
+            engine="far_field",
+            far_field_accuracy=accuracy,
+        )
+        G = mag.Simulation3DIntegral(
+            self.sim.mesh,
+            survey=self.survey,
+            chiMap=self.sim.chiMap,
+            actInd=self.sim.actInd,
+        ).G
+        self.assertGreater(sim.G.far.nnz, 0)
+
+        err = np.linalg.norm(sim.G.toarray() - G, axis=1) / np.linalg.norm(G, axis=1)
+        self.assertLess(err.max(), accuracy)
+        np.testing.assert_allclose(
+            sim.getJtJdiag(self.model),
+            np.sum(sim.G.toarray() ** 2, axis=0),
+        )
+
 
 if __name__ == "__main__":
     unittest.main()